@@ -1,9 +1,58 @@
-from pymongo import MongoClient
+from pymongo import MongoClient, UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
 from bson.objectid import ObjectId
 from datetime import datetime, timedelta
 import secrets
+import math
+import os
 import pytz
+import numpy as np
+import pandas as pd
 timezone = pytz.timezone("Europe/Paris")
+MONGO_URI = os.getenv("MONGO_URI", "mongodb://mongo:27017/Saint-Bernard")
+
+def get_db(uri=None):
+    # Database handle for scripts running outside of the Flask app (training, data tools)
+    client = MongoClient(uri or MONGO_URI)
+    return client.get_default_database()
+
+def page_sort(sort_field):
+    sort = [("_id", 1)]
+    if sort_field != "_id":
+        sort.insert(0, (sort_field, 1))
+    return sort
+
+
+def keyset_query(query, after, last, sort_field):
+    # Documents after `last` (the sort_field value of the document whose _id is after) in (sort_field, _id) order
+    query = dict(query)
+    if sort_field == "_id":
+        query["_id"] = {"$gt": after}
+    else:
+        query["$or"] = [
+            {sort_field: {"$gt": last.get(sort_field)}},
+            {sort_field: last.get(sort_field), "_id": {"$gt": after}},
+        ]
+    return query
+
+
+def cursor_position(after, sort_field):
+    # (_id, fields of the last document) of a page cursor: the _id alone in _id order, (sort value, _id) otherwise
+    # The fields are None for a bare _id cursor sent with another sort field (older clients)
+    if isinstance(after, tuple):
+        value, after = after
+        return after, {"_id": after, sort_field: value}
+    return after, {"_id": after} if sort_field == "_id" else None
+
+
+def next_cursor(documents, limit, sort_field):
+    # Cursor of the page after documents, None on the last page
+    if len(documents) < limit:
+        return None
+    last = documents[-1]
+    return last["_id"] if sort_field == "_id" else (last.get(sort_field), last["_id"])
+
+
 class BaseModel:
     def __init__(self, db, collection_name):
         self.collection = db[collection_name]
@@ -11,11 +60,23 @@ class BaseModel:
     def create(self, data):
         return self.collection.insert_one(data)
 
-    def read(self, query):
-        return self.collection.find(query)
+    def read(self, query, projection=None):
+        return self.collection.find(query, projection)
+
+    def read_one(self, query, projection=None):
+        return self.collection.find_one(query, projection)
 
-    def read_one(self, query):
-        return self.collection.find_one(query)
+    def read_page(self, query, after=None, limit=100, projection=None, sort_field="_id"):
+        # Keyset pagination ordered by (sort_field, _id), after is the cursor returned with the previous page
+        if after is not None:
+            after, last = cursor_position(after, sort_field)
+            if last is None:
+                last = self.collection.find_one({"_id": after}, {sort_field: 1})
+                if last is None:
+                    return [], None
+            query = keyset_query(query, after, last, sort_field)
+        documents = list(self.collection.find(query, projection).sort(page_sort(sort_field)).limit(limit))
+        return documents, next_cursor(documents, limit, sort_field)
 
     def update(self, query, data):
         return self.collection.update_one(query, {"$set": data})
@@ -28,6 +89,11 @@ class User(BaseModel):
         super().__init__(db, "users")
 
     def create_user(self, username:str ,email:str, password:str, first_name:str, last_name:str, hire_date:str, birth_date:str, Position:float = [0,0]):
+        return self.create(self.user_document(username, email, password, first_name, last_name, hire_date, birth_date, Position))
+
+    @staticmethod
+    def user_document(username:str ,email:str, password:str, first_name:str, last_name:str, hire_date:str, birth_date:str, Position:float = [0,0]):
+        # Document written by create_user, shared with the async models
         max_length = 50
         max_length_name = 10
         max_length_password = 160
@@ -53,84 +119,454 @@ class User(BaseModel):
             "birth_date": datetime.strptime(birth_date, '%Y-%m-%d'),
             "Position": Position,
         }
-        return self.create(user_data)
+        return user_data
+
+
+class TripRollup(BaseModel):
+    # Pre-aggregated totals per (user_id, day), user_id ALL_USERS holds the totals of all users
+    # (not None: $merge refuses a null "on" field)
+    ALL_USERS = "*"
+
+    def __init__(self, db):
+        super().__init__(db, "trip_rollup")
+        self.trips = db["trip"]
+
+    @staticmethod
+    def day_of(date):
+        return datetime(date.year, date.month, date.day)
+
+    def apply(self, trips, sign=1):
+        # Adds (sign=1) or removes (sign=-1) the trips' contribution with one bulk_write
+        totals = {}
+        for trip in trips:
+            if trip.get("start_date") is None:
+                continue
+            day = self.day_of(trip["start_date"])
+            duration = (trip["end_date"] - trip["start_date"]).total_seconds() if trip.get("end_date") else 0
+            for user_id in (trip.get("user_id"), self.ALL_USERS):
+                total = totals.setdefault((user_id, day), {"distance": 0, "trips": 0, "done": 0, "duration_seconds": 0})
+                total["distance"] += sign * (trip.get("distance") or 0)
+                total["trips"] += sign
+                total["done"] += sign * int(bool(trip.get("Is_done")))
+                total["duration_seconds"] += sign * duration
+        if not totals:
+            return None
+        operations = [
+            UpdateOne({"user_id": user_id, "day": day}, {"$inc": inc, "$currentDate": {"updated_at": True}}, upsert=True)
+            for (user_id, day), inc in totals.items()
+        ]
+        return self.collection.bulk_write(operations, ordered=False)
+
+    def backfill(self):
+        # Rebuilds every rollup from the trip collection with aggregation pipelines, in place: readers keep
+        # the previous totals until each one is replaced
+        started = self.collection.database.command("hello")["localTime"]
+        group = {
+            "distance": {"$sum": {"$ifNull": ["$distance", 0]}},
+            "trips": {"$sum": 1},
+            "done": {"$sum": {"$cond": ["$Is_done", 1, 0]}},
+            "duration_seconds": {"$sum": {"$divide": [{"$subtract": ["$end_date", "$start_date"]}, 1000]}},
+        }
+        for user_key in ("$user_id", self.ALL_USERS):
+            self.trips.aggregate([
+                {"$match": {"start_date": {"$type": "date"}, "end_date": {"$type": "date"}}},
+                {"$group": dict(group, _id={"user_id": user_key, "day": {"$dateTrunc": {"date": "$start_date", "unit": "day"}}})},
+                {"$project": dict({field: 1 for field in group}, _id=0, user_id="$_id.user_id", day="$_id.day",
+                                  updated_at="$$NOW")},
+                {"$merge": {"into": "trip_rollup", "on": ["user_id", "day"], "whenMatched": "replace", "whenNotMatched": "insert"}},
+            ], allowDiskUse=True)
+        # Days without trips anymore: neither rebuilt nor updated by a trip write since the start (server clock)
+        self.collection.delete_many({"updated_at": {"$not": {"$gte": started}}})
 
+    def daily(self, user_id=None, day_query=None):
+        # One document per day, read from the rollups only, user_id None for the totals of all users
+        query = {"user_id": self.ALL_USERS if user_id is None else user_id}
+        if day_query:
+            query["day"] = day_query
+        result = []
+        for total in self.collection.find(query, {"_id": 0, "user_id": 0, "updated_at": 0}).sort("day", 1):
+            total["average_duration_seconds"] = total["duration_seconds"] / total["trips"] if total["trips"] else 0
+            result.append(total)
+        return result
 
 class Trip(BaseModel):
+    max_distance = 1100  # Example maximum distance
+    max_position_dot = 100
+    date_format = '%Y-%m-%d-%H:%M:%S'
+    required_fields = ["user_id", "start_date", "end_date", "position_dot", "Is_done", "distance"]
+
     def __init__(self, db):
         super().__init__(db, "trip")
-    def create_trip(self, user_id: str, start_date: str, end_date: str, position_dot: int, Is_done: bool, distance: int):
-        max_distance = 1100  # Example maximum distance
-        distance = min(distance, max_distance)
-        position_dot = min(int(position_dot), 100)  # Convert position_dot to int before comparison
+        self.rollup = TripRollup(db)
+    def create_trip(self, user_id: str, start_date: str, end_date: str, position_dot: int, Is_done: bool, distance: int,
+                    location=None, purchase_rate=None):
+        # Same rules as /trips/bulk, raises ValueError with the message of the rejected field
+        record = {"user_id": user_id, "start_date": start_date, "end_date": end_date,
+                  "position_dot": position_dot, "Is_done": Is_done, "distance": distance}
+        if location is not None:
+            record["location"] = location
+        if purchase_rate is not None:
+            record["purchase_rate"] = purchase_rate
+        documents, _, errors = self.validate_trips([record])
+        if errors:
+            raise ValueError(errors[0])
+        trip_data = documents[0]
+        result = self.create(trip_data)
+        self.rollup.apply([trip_data])
+        return result
 
-        # Convert strings to datetime, ensuring start_date is before end_date and neither are in the future
-        now = datetime.now()
-        start_date_dt = min(datetime.strptime(start_date, '%Y-%m-%d-%H:%M:%S'), now)
-        end_date_dt = min(datetime.strptime(end_date, '%Y-%m-%d-%H:%M:%S'), now)
-        if end_date_dt < start_date_dt:
-            end_date_dt = start_date_dt
-        trip_data = {
-            "user_id": ObjectId(user_id),
-            "start_date": datetime.strptime(start_date, '%Y-%m-%d-%H:%M:%S'),
-            "end_date": datetime.strptime(end_date, '%Y-%m-%d-%H:%M:%S'),
-            "position_dot": position_dot,
-            "Is_done": Is_done,
-            "distance": distance
-        }
-        return self.create(trip_data)
+    def update_trip(self, trip_id, update_data):
+        # The old version comes back from the same round trip, so its contribution can be replaced
+        old = self.collection.find_one_and_update({"_id": ObjectId(trip_id)}, {"$set": update_data},
+                                                  return_document=ReturnDocument.BEFORE)
+        if old is not None:
+            self.rollup.apply([old], sign=-1)
+            self.rollup.apply([dict(old, **update_data)])
+        return old
+
+    def delete_trip(self, trip_id):
+        old = self.collection.find_one_and_delete({"_id": ObjectId(trip_id)})
+        if old is not None:
+            self.rollup.apply([old], sign=-1)
+        return old
+
+    @staticmethod
+    def scalar_fields(record):
+        # Dates are strings, numbers are numbers or numeric strings
+        dates = (record["start_date"], record["end_date"])
+        numbers = (record["distance"], record["position_dot"])
+        return (all(isinstance(value, str) for value in dates)
+                and all(isinstance(value, (str, int, float)) and not isinstance(value, bool) for value in numbers))
+
+    @staticmethod
+    def client_fields_error(record):
+        # Optional client position [lat, lng] and purchase rate, read by the relay point training and the client tiles
+        location = record.get("location")
+        if location is not None:
+            if (not isinstance(location, (list, tuple)) or len(location) != 2
+                    or not all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in location)
+                    # Also false for NaN and infinities
+                    or not -90 <= location[0] <= 90 or not -180 <= location[1] <= 180):
+                return "location must be [latitude, longitude] in degrees"
+        purchase_rate = record.get("purchase_rate")
+        if purchase_rate is not None:
+            if (not isinstance(purchase_rate, (int, float)) or isinstance(purchase_rate, bool)
+                    or not 0 <= purchase_rate < math.inf):
+                return "purchase_rate must be a non-negative number"
+        return None
+
+    def validate_trips(self, records):
+        # Same rules as create_trip applied column-wise to the whole batch
+        # Returns (documents, indexes of the records they come from, {index: error})
+        errors = {}
+        rows = []
+        for i, record in enumerate(records):
+            if not isinstance(record, dict):
+                errors[i] = "Trip must be an object"
+            elif not all(field in record for field in self.required_fields):
+                errors[i] = "Missing fields"
+            elif not ObjectId.is_valid(record["user_id"]):
+                errors[i] = "Invalid user_id"
+            elif not isinstance(record["Is_done"], bool):
+                errors[i] = "Is_done must be a boolean"
+            elif not self.scalar_fields(record):
+                # Lists and objects would make the column conversions below raise for the whole batch
+                errors[i] = "Invalid date or number"
+            else:
+                error = self.client_fields_error(record)
+                if error:
+                    errors[i] = error
+                else:
+                    rows.append(i)
+        if not rows:
+            return [], [], errors
+
+        frame = pd.DataFrame([records[i] for i in rows], index=rows)
+        now = pd.Timestamp(datetime.now())
+        start = pd.to_datetime(frame["start_date"], format=self.date_format, errors="coerce")
+        end = pd.to_datetime(frame["end_date"], format=self.date_format, errors="coerce")
+        distance = pd.to_numeric(frame["distance"], errors="coerce")
+        position_dot = pd.to_numeric(frame["position_dot"], errors="coerce")
+
+        invalid = start.isna() | end.isna() | ~np.isfinite(distance) | ~np.isfinite(position_dot)
+        negative = ~invalid & ((distance < 0) | (position_dot < 0))
+        for i in frame.index[invalid.values]:
+            errors[int(i)] = "Invalid date or number"
+        for i in frame.index[negative.values]:
+            errors[int(i)] = "distance and position_dot must not be negative"
+        valid = ~(invalid | negative)
+        start = start[valid].clip(upper=now)
+        end = end[valid].clip(upper=now)
+        end = end.where(end >= start, start)
+        # Both bounds hold before the int cast, so it cannot overflow
+        distance = distance[valid].clip(upper=self.max_distance)
+        position_dot = position_dot[valid].clip(upper=self.max_position_dot).astype(int)
+
+        frame = frame[valid]
+        documents = [
+            {
+                "user_id": ObjectId(user_id),
+                "start_date": start_date,
+                "end_date": end_date,
+                "position_dot": int(dot),
+                "Is_done": is_done,
+                # The columns are float as soon as one record is, each record keeps the type it was sent with
+                "distance": int(dist) if isinstance(sent, int) else float(dist),
+            }
+            for user_id, start_date, end_date, dot, is_done, dist, sent in zip(
+                frame["user_id"], start.dt.to_pydatetime(), end.dt.to_pydatetime(),
+                position_dot, frame["Is_done"], distance, [records[i]["distance"] for i in frame.index])
+        ]
+        for document, i in zip(documents, frame.index):
+            if records[i].get("location") is not None:
+                document["location"] = [float(value) for value in records[i]["location"]]
+            if records[i].get("purchase_rate") is not None:
+                document["purchase_rate"] = float(records[i]["purchase_rate"])
+        return documents, [int(i) for i in frame.index], errors
+
+    def create_trips_bulk(self, records, chunk_size=1000):
+        # Unordered insert_many per chunk, a failing record never blocks the others
+        documents, indexes, errors = self.validate_trips(records)
+        inserted = 0
+        for start in range(0, len(documents), chunk_size):
+            chunk = documents[start:start + chunk_size]
+            failed = set()
+            try:
+                inserted += len(self.collection.insert_many(chunk, ordered=False).inserted_ids)
+            except BulkWriteError as e:
+                inserted += e.details.get("nInserted", 0)
+                for write_error in e.details.get("writeErrors", []):
+                    failed.add(write_error["index"])
+                    errors[indexes[start + write_error["index"]]] = write_error.get("errmsg", "Write error")
+            self.rollup.apply([document for i, document in enumerate(chunk) if i not in failed])
+        return inserted, [{"index": i, "error": errors[i]} for i in sorted(errors)]
 
 class API_KEY(BaseModel):
     def __init__(self, db):
         super().__init__(db, "api_key")
+    # Fields returned by get_valid_api_key
+    valid_key_projection = {"_id": 0, "user_id": 1, "expiration_time": 1}
+
     def generate_api_key(self, user_id: str):
         #to check if the user already has an api key
-        check_user = self.read_one({"user_id": ObjectId(user_id)})
+        check_user = self.read_one(self.active_key_query(user_id))
         if check_user:
             return check_user["key"]
         else:
-            # Generate a secure, random key using the secrets module
-            key = secrets.token_urlsafe(32)  # Generates a 32-byte (256-bit) key
-            # Truncate or format the key if necessary (optional)
-            # key = key[:50]  # Example: Truncate to 50 characters if needed
-            # Create the API key in the database with an expiration time
-            expiration_time = datetime.now() + timedelta(days=1)  # Set expiration to 1 day from now
-            
-            key_data = {
-                "key": key,
-                "expiration_time": expiration_time  # Set expiration to 1 day from now
-            }
+            key_data = self.new_key_document(user_id)
             self.create(key_data)
-            return key
-        
+            return key_data["key"]
+
+    @staticmethod
+    def active_key_query(user_id: str):
+        return {"user_id": ObjectId(user_id), "expiration_time": {"$gt": datetime.now()}}
+
+    @staticmethod
+    def new_key_document(user_id: str):
+        # Generate a secure, random key using the secrets module
+        key = secrets.token_urlsafe(32)  # Generates a 32-byte (256-bit) key
+        # Truncate or format the key if necessary (optional)
+        # key = key[:50]  # Example: Truncate to 50 characters if needed
+        # Create the API key in the database with an expiration time
+        expiration_time = datetime.now() + timedelta(days=1)  # Set expiration to 1 day from now
+        return {
+            "key": key,
+            "user_id": ObjectId(user_id),
+            "expiration_time": expiration_time  # Set expiration to 1 day from now
+        }
+
+    @staticmethod
+    def valid_key_query(key: str):
+        # The TTL monitor only runs every minute, so expired keys are filtered here too
+        return {"key": key, "expiration_time": {"$gt": datetime.now()}}
+
+    def get_valid_api_key(self, key:str):
+        return self.collection.find_one(self.valid_key_query(key), self.valid_key_projection)
+
     def is_api_key_valid(self, key:str):
-        
-     result = self.read_one({"key": key})
-     print(f"Debug: read_one result for key '{key}': {result}")  # Debugging line
-     if result:
-        return True
-     else:
-        return False
+        return self.get_valid_api_key(key) is not None
+
+    def revoke_api_key(self, key:str):
+        return self.delete({"key": key})
     
 class relay_point(BaseModel):
     def __init__(self, db):
-        super().__init__(db, 'relay_point')
+        super().__init__(db, 'relay_points')
+        self.generations = db['relay_point_generation']
+
+    @staticmethod
+    def location_key(location):
+        # Stable key for a [lat, lng] pair, rounded to ~10cm
+        return f"{float(location[0]):.6f},{float(location[1]):.6f}"
+
     def create_relay_point(self, name:str, location:int):
-       if self.dedublicate_relay_check(name):
+       if self.dedublicate_relay_check(location):
            return False
        else:
         max_length = 50
         name = name[:max_length]
-        location = location
-       
+        location = [float(location[0]), float(location[1])]
+
         relay_point_data = {
+            "name": name,
             "location": location,
-            
+            "location_key": self.location_key(location),
+            "generation": self.current_generation(),
         }
         return self.create(relay_point_data)
     def dedublicate_relay_check(self, location:str):
-        result = self.read_one({"location": location})
+        result = self.read_one({"location_key": self.location_key(location), "generation": self.current_generation()})
         if result:
             return True
         else:
-            return False
\ No newline at end of file
+            return False
+
+    def current_generation(self):
+        active = self.generations.find_one({"_id": "active"})
+        return active["generation"] if active else None
+
+    def replace_relay_points(self, locations, generation, names=None):
+        # Upserts the whole set in one bulk_write, re-running the same generation is a no-op
+        max_length = 50
+        now = datetime.now()
+        operations = []
+        seen = set()
+        for i, location in enumerate(locations):
+            # Same ~10cm precision as the key, not the float noise of the centroid arithmetic
+            location = [round(float(location[0]), 6), round(float(location[1]), 6)]
+            key = self.location_key(location)
+            # Centroids snapped to the same city are one relay point, the first one keeps its name
+            if key in seen:
+                continue
+            seen.add(key)
+            operations.append(UpdateOne(
+                {"generation": generation, "location_key": key},
+                {"$set": {
+                    "name": str(names[i] if names is not None else "")[:max_length],
+                    "location": location,
+                    "updated_at": now,
+                }},
+                upsert=True,
+            ))
+        if operations:
+            self.collection.bulk_write(operations, ordered=False)
+
+        # Readers switch to the new set in a single document update, then the old sets are dropped
+        self.generations.update_one(
+            {"_id": "active"},
+            {"$set": {"generation": generation, "count": len(operations), "updated_at": now}},
+            upsert=True,
+        )
+        self.collection.delete_many({"generation": {"$ne": generation}})
+        return len(operations)
+
+
+class RelayPointJob(BaseModel):
+    # Relay point generation jobs, shared by every web worker: any of them answers the status of a job,
+    # identical submissions join the active job through the unique partial index on key
+    # The job process records its progress and outcome, the submitting worker keeps heartbeat_at fresh
+    # until then, a job whose heartbeat stopped died with its worker
+    stale_after = timedelta(seconds=int(os.getenv("RELAY_JOB_STALE_SECONDS", "120")))
+
+    def __init__(self, db):
+        super().__init__(db, "relay_point_jobs")
+
+    def submit(self, job_id, key, params):
+        # Returns (job_id, coalesced), job_id is the one of the active job when coalesced
+        for _ in range(3):
+            now = datetime.now()
+            try:
+                self.create({"_id": job_id, "key": key, "active": True, "status": "queued", "params": params,
+                             "progress": {}, "submitted_at": now, "heartbeat_at": now, "finished_at": None})
+                return job_id, False
+            except DuplicateKeyError:
+                active = self.read_one({"key": key, "active": True}, {"heartbeat_at": 1})
+                if active is not None and not self.expire_if_stale(active):
+                    return active["_id"], True
+                # Finished or lost meanwhile, submit again
+        raise RuntimeError("Could not submit the relay point job")
+
+    def expire_if_stale(self, job):
+        if job["heartbeat_at"] >= datetime.now() - self.stale_after:
+            return False
+        self.collection.update_one(
+            {"_id": job["_id"], "active": True},
+            {"$set": {"active": False, "status": "failed", "error": "Lost with the worker running it",
+                      "finished_at": datetime.now()}},
+        )
+        return True
+
+    def heartbeat(self, job_ids):
+        self.collection.update_many({"_id": {"$in": list(job_ids)}, "active": True},
+                                    {"$set": {"heartbeat_at": datetime.now()}})
+
+    def start(self, job_id):
+        self.collection.update_one({"_id": job_id, "active": True},
+                                   {"$set": {"status": "running", "started_at": datetime.now()}})
+
+    def progress(self, job_id, progress):
+        self.collection.update_one({"_id": job_id, "active": True}, {"$set": {"progress": progress}})
+
+    def finish(self, job_id, result):
+        self.collection.update_one({"_id": job_id, "active": True},
+                                   {"$set": {"active": False, "status": "done", "result": result,
+                                             "finished_at": datetime.now()}})
+
+    def fail(self, job_id, error):
+        self.collection.update_one({"_id": job_id, "active": True},
+                                   {"$set": {"active": False, "status": "failed", "error": error,
+                                             "finished_at": datetime.now()}})
+
+    def status(self, job_id):
+        # Status document as served by the API (times in epoch seconds), None for an unknown job
+        job = self.read_one({"_id": job_id})
+        if job is None:
+            return None
+        if job["active"] and self.expire_if_stale(job):
+            job = self.read_one({"_id": job_id})
+        status = {
+            "id": job["_id"],
+            "status": job["status"],
+            "params": job["params"],
+            "submitted_at": job["submitted_at"].timestamp(),
+            "finished_at": job["finished_at"].timestamp() if job.get("finished_at") else None,
+            "progress": job.get("progress") or {},
+        }
+        if job["status"] == "failed":
+            status["error"] = job.get("error")
+        if job["status"] == "done":
+            status["result"] = job.get("result")
+        return status
+
+
+class DriverPosition(BaseModel):
+    # Latest reported position per driver (_id is the driver id), shared by the web workers
+    # Each worker copies the recently received ones into its in-memory store for its viewers
+    def __init__(self, db):
+        super().__init__(db, "driver_positions")
+
+    def upsert_positions(self, positions):
+        # positions: normalized {"driver_id", "latitude", "longitude", "timestamp"}, an older report never
+        # replaces a newer one (the upsert then hits the _id of the newer document)
+        now = datetime.now()
+        operations = [
+            UpdateOne(
+                {"_id": position["driver_id"], "timestamp": {"$lt": position["timestamp"]}},
+                {"$set": {"latitude": position["latitude"], "longitude": position["longitude"],
+                          "timestamp": position["timestamp"], "received_at": now}},
+                upsert=True,
+            )
+            for position in positions
+        ]
+        if not operations:
+            return
+        try:
+            self.collection.bulk_write(operations, ordered=False)
+        except BulkWriteError as e:
+            if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                raise
+
+    def received_since(self, since):
+        cursor = self.collection.find({"received_at": {"$gte": since}}, {"received_at": 0})
+        return [{"driver_id": doc["_id"], "latitude": doc["latitude"], "longitude": doc["longitude"],
+                 "timestamp": doc["timestamp"]} for doc in cursor]
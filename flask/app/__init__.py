@@ -1,21 +1,31 @@
 import urllib.parse
 from  dotenv import load_dotenv
 import os   
+import sys
+# The ML modules (ml_model, spatial_index, ...) import each other without the package prefix. Set here,
+# it holds for every entry point: flask run, gunicorn, uvicorn app.asgi:application and the job processes
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
 from flask.app import Flask
 from flask_pymongo import PyMongo
+from app.metrics import init_app as init_metrics, mongo_listener
 
 app = Flask(__name__)
 load_dotenv()
 mongo_user = urllib.parse.quote_plus(os.getenv("MONGO_INITDB_ROOT_USERNAME"))
 mongo_password = urllib.parse.quote_plus(os.getenv("MONGO_INITDB_ROOT_PASSWORD")) 
-app.config["MONGO_URI"] = "mongodb://mongo:27017/Saint-Bernard"
+app.config["MONGO_URI"] = os.getenv("MONGO_URI", "mongodb://mongo:27017/Saint-Bernard")
 
 
-mongo = PyMongo(app)
+# Registered first, so the request timer also covers the API key check
+init_metrics(app)
+# The client is created by connect_db: at import, or in each worker after the fork when gunicorn preloads
+# the app (MONGO_CONNECT_AFTER_FORK), a client created in the master would be shared by the forked workers
+mongo = PyMongo()
 
 from app import routes
 def init_db(app):
-    mongo = PyMongo(app)
     db = mongo.db
 
     # Create initial collections and indexes if they don't exist
@@ -43,20 +53,46 @@ def init_db(app):
             db.trip.create_index("Is_done")
             db.trip.create_index("distance")
             
+        # Keyset pagination of a user's trips, filtered and ordered by start_date
+        db.trip.create_index([("user_id", 1), ("start_date", 1), ("_id", 1)])
+
+        # Per user and per day trip totals, also the key used by the backfill $merge
+        db.trip_rollup.create_index([("user_id", 1), ("day", 1)], unique=True)
+
         if 'api_key' not in db.list_collection_names():
             db.create_collection('api_key')
-            db.key.create_index("key", unique=True)
-            db.key.create_index("user_id")
-            db.key.create_index("expiration_time", expireAfterSeconds=86400 )
-            print("Created 'key' collection")
+            print("Created 'api_key' collection")
+        # Keys are looked up on every authenticated request, documents expire at expiration_time
+        db.api_key.create_index("key", unique=True)
+        db.api_key.create_index("user_id")
+        db.api_key.create_index("expiration_time", expireAfterSeconds=0)
             
         if 'relay_points' not in db.list_collection_names():
             db.create_collection('relay_points')
             print("Created 'relay_points' collection")
             db.relay_points.create_index("location")
+        # One document per location and generation, so rewriting a generation is idempotent
+        db.relay_points.create_index([("generation", 1), ("location_key", 1)], unique=True)
+        # Keyset pagination of the active relay point generation
+        db.relay_points.create_index([("generation", 1), ("_id", 1)])
+
+        # One queued or running job per parameter set, finished jobs are kept a day
+        db.relay_point_jobs.create_index("key", unique=True, partialFilterExpression={"active": True})
+        db.relay_point_jobs.create_index("finished_at", expireAfterSeconds=86400)
+
+        # Positions polled by every web worker, drivers that stopped reporting are removed after an hour
+        db.driver_positions.create_index("received_at", expireAfterSeconds=3600)
          
             
     except Exception as e:
         print("Error initializing database:", e)
     return    print("Database initialized")
-init_db(app)
+
+
+def connect_db():
+    mongo.init_app(app, event_listeners=[mongo_listener])
+    init_db(app)
+
+
+if not os.getenv("MONGO_CONNECT_AFTER_FORK"):
+    connect_db()
@@ -0,0 +1,63 @@
+import os
+import time
+import threading
+from datetime import datetime
+from collections import OrderedDict
+
+# Each worker process keeps its own cache, so revocations reach the other workers after at most TTL seconds
+API_KEY_CACHE_SIZE = int(os.getenv("API_KEY_CACHE_SIZE", "10000"))
+API_KEY_CACHE_TTL = float(os.getenv("API_KEY_CACHE_TTL", "60"))
+API_KEY_CACHE_NEGATIVE_TTL = float(os.getenv("API_KEY_CACHE_NEGATIVE_TTL", "5"))
+
+
+class APIKeyCache:
+    # Bounded LRU of key -> (valid, expires_at), with short-lived entries for unknown keys
+    def __init__(self, max_size=API_KEY_CACHE_SIZE, ttl=API_KEY_CACHE_TTL, negative_ttl=API_KEY_CACHE_NEGATIVE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        # True / False when cached, None on a miss
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, expiration_time=None):
+        # expiration_time is the key's expiry in the database, None caches the key as invalid
+        now = time.monotonic()
+        if expiration_time is None:
+            valid, lifetime = False, self.negative_ttl
+        else:
+            remaining = (expiration_time - datetime.now()).total_seconds()
+            valid, lifetime = True, min(self.ttl, remaining)
+            if lifetime <= 0:
+                return
+        with self._lock:
+            self._entries[key] = (valid, now + lifetime)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+api_key_cache = APIKeyCache()
@@ -0,0 +1,196 @@
+import asyncio
+import contextlib
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route, Mount
+from a2wsgi import WSGIMiddleware
+from app import app as flask_app
+from app.async_model import get_async_db, AsyncUser, AsyncTrip, AsyncAPIKey, AsyncRelayPoint
+from app.api_key_cache import api_key_cache
+from app.metrics import mongo_listener, record_api_key_lookup, ASGITimingMiddleware
+from app.passwords import hash_password_async, check_password_async
+from app.pagination import parse_page_args, parse_date_range, page_response, NEXT_PAGE_HEADER
+from app.routes import USER_PROJECTION, follow_driver_positions
+from app.live_positions import live_positions, stream_positions_async, LIVE_POSITION_INTERVAL
+
+# ASGI entry point, run from the flask directory with:
+#   uvicorn app.asgi:application --host 0.0.0.0 --port 5000
+# Auth, user, trip and relay point reads run on the event loop with Motor, bcrypt runs on a bounded
+# thread pool, the live driver streams are coroutines, every other route is served by the Flask app on
+# a2wsgi's worker threads.
+
+FLASK_THREADS = 32
+REGISTER_FIELDS = ["email", "password", "first_name", "last_name", "hire_date", "birth_date", "username"]
+
+
+def json_response(data, status=200, headers=None):
+    # Flask's JSON provider, so both halves of the API encode dates and ids the same way
+    return Response(flask_app.json.dumps(data), status_code=status, headers=headers, media_type="application/json")
+
+
+def error(message, status):
+    return json_response({"error": message}, status)
+
+
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def authorized(request):
+    # Same rules as require_api_key in routes.py, sharing its cache
+    key = request.headers.get("X-API-KEY")
+    if not key:
+        return False
+    valid = api_key_cache.get(key)
+    hit = valid is not None
+    if not hit:
+        key_data = await AsyncAPIKey(request.app.state.db).get_valid_api_key(key)
+        api_key_cache.put(key, key_data["expiration_time"] if key_data else None)
+        valid = key_data is not None
+    record_api_key_lookup(hit, len(api_key_cache))
+    return valid
+
+
+async def login(request):
+    data = await read_json(request)
+    if not isinstance(data, dict) or not all(field in data for field in ["email", "password"]):
+        return error("Missing fields", 400)
+    db = request.app.state.db
+    user_data = await AsyncUser(db).read_one({"email": data["email"]})
+    if user_data and await check_password_async(user_data["password"], data["password"]):
+        user_data["_id"] = str(user_data["_id"])
+        user_data.pop("password")
+        user_data["API_KEY"] = await AsyncAPIKey(db).generate_api_key(user_data["_id"])
+        api_key_cache.invalidate(user_data["API_KEY"])
+        user_data["message"] = "User logged in"
+        return json_response(user_data)
+    return error("Invalid credentials", 401)
+
+
+async def logout(request):
+    if not await authorized(request):
+        return error("Unauthorized", 401)
+    key = request.headers["X-API-KEY"]
+    await AsyncAPIKey(request.app.state.db).revoke_api_key(key)
+    api_key_cache.invalidate(key)
+    return json_response({"message": "User logged out"})
+
+
+async def register(request):
+    data = await read_json(request)
+    if not isinstance(data, dict) or not all(field in data for field in REGISTER_FIELDS):
+        return error("Missing fields", 400)
+    user = AsyncUser(request.app.state.db)
+    if await user.read_one({"email": data["email"]}, {"_id": 1}):
+        return error("Email already exists", 400)
+    if await user.read_one({"username": data["username"]}, {"_id": 1}):
+        return error("Username already exists", 400)
+    hashed_password = await hash_password_async(data["password"])
+    await user.create_user(
+        email=data["email"],
+        password=hashed_password,
+        username=data["username"],
+        first_name=data["first_name"],
+        last_name=data["last_name"],
+        hire_date=data["hire_date"],
+        birth_date=data["birth_date"],
+    )
+    return json_response({"message": "User created"}, 201)
+
+
+async def get_users(request):
+    if not await authorized(request):
+        return error("Unauthorized", 401)
+    try:
+        after, limit = parse_page_args(request.query_params)
+    except ValueError as e:
+        return error(str(e), 400)
+    users, next_after = await AsyncUser(request.app.state.db).read_page({}, after=after, limit=limit, projection=USER_PROJECTION)
+    result, headers = page_response(users, next_after)
+    return json_response(result, headers=headers)
+
+
+async def get_trips(request):
+    if not await authorized(request):
+        return error("Unauthorized", 401)
+    try:
+        user_id = ObjectId(request.path_params["user_id"])
+    except InvalidId:
+        return error("invalid user id", 404)
+    db = request.app.state.db
+    if not await AsyncUser(db).read_one({"_id": user_id}, {"_id": 1}):
+        return error("invalid user id", 404)
+    try:
+        after, limit = parse_page_args(request.query_params)
+        query = parse_date_range(request.query_params)
+    except ValueError as e:
+        return error(str(e), 400)
+    query["user_id"] = user_id
+    trips, next_after = await AsyncTrip(db).read_page(query, after=after, limit=limit, sort_field="start_date")
+    result, headers = page_response(trips, next_after)
+    return json_response(result, headers=headers)
+
+
+async def get_relay_points(request):
+    # Public, like the get_relay_points endpoint of routes.py
+    try:
+        after, limit = parse_page_args(request.query_params)
+    except ValueError as e:
+        return error(str(e), 400)
+    relay = AsyncRelayPoint(request.app.state.db)
+    relay_points, next_after = await relay.read_page({"generation": await relay.current_generation()}, after=after, limit=limit)
+    result, headers = page_response(relay_points, next_after)
+    return json_response(result, headers=headers)
+
+
+async def stream_drivers(request):
+    # An open dashboard costs a coroutine, not one of the Flask threads
+    if not await authorized(request):
+        return error("Unauthorized", 401)
+    # The feed polls with PyMongo on its own thread, its first poll too
+    await asyncio.to_thread(follow_driver_positions)
+    try:
+        interval = float(request.query_params.get("interval", LIVE_POSITION_INTERVAL))
+    except ValueError:
+        interval = LIVE_POSITION_INTERVAL
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(stream_positions_async(live_positions, interval), media_type="text/event-stream",
+                             headers=headers)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(application):
+    # One Motor client per worker process, created on its event loop
+    application.state.db = get_async_db(flask_app.config["MONGO_URI"], [mongo_listener])
+    yield
+
+
+routes = [
+    Route("/login", login, methods=["POST"]),
+    Route("/logout", logout, methods=["POST"]),
+    Route("/register", register, methods=["POST"]),
+    Route("/users", get_users, methods=["GET"]),
+    Route("/trips/{user_id}", get_trips, methods=["GET"]),
+    Route("/relay_points", get_relay_points, methods=["GET"]),
+    Route("/drivers/stream", stream_drivers, methods=["GET"]),
+]
+application = Starlette(
+    routes=routes + [
+        # Anything else, including other methods on the paths above, goes to Flask
+        Mount("/", app=WSGIMiddleware(flask_app, workers=FLASK_THREADS)),
+    ],
+    middleware=[
+        # The handlers are named after the Flask endpoints, both halves report the same series
+        Middleware(ASGITimingMiddleware, endpoints=[route.endpoint for route in routes]),
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"],
+                   expose_headers=[NEXT_PAGE_HEADER]),
+    ],
+    lifespan=lifespan,
+)
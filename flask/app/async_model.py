@@ -0,0 +1,83 @@
+from motor.motor_asyncio import AsyncIOMotorClient
+from app.Model import User, API_KEY, page_sort, keyset_query, cursor_position, next_cursor
+
+# Motor versions of the models used by the async entry point, documents and queries come from app.Model
+
+
+def get_async_db(uri, event_listeners=None):
+    # The client binds to the running event loop, create it from inside the loop (e.g. at startup)
+    return AsyncIOMotorClient(uri, event_listeners=event_listeners or []).get_default_database()
+
+
+class AsyncBaseModel:
+    def __init__(self, db, collection_name):
+        self.collection = db[collection_name]
+
+    async def create(self, data):
+        return await self.collection.insert_one(data)
+
+    async def read(self, query, projection=None, length=None):
+        return await self.collection.find(query, projection).to_list(length)
+
+    async def read_one(self, query, projection=None):
+        return await self.collection.find_one(query, projection)
+
+    async def read_page(self, query, after=None, limit=100, projection=None, sort_field="_id"):
+        # Same keyset pagination as BaseModel.read_page
+        if after is not None:
+            after, last = cursor_position(after, sort_field)
+            if last is None:
+                last = await self.collection.find_one({"_id": after}, {sort_field: 1})
+                if last is None:
+                    return [], None
+            query = keyset_query(query, after, last, sort_field)
+        documents = await self.collection.find(query, projection).sort(page_sort(sort_field)).limit(limit).to_list(limit)
+        return documents, next_cursor(documents, limit, sort_field)
+
+    async def update(self, query, data):
+        return await self.collection.update_one(query, {"$set": data})
+
+    async def delete(self, query):
+        return await self.collection.delete_one(query)
+
+
+class AsyncUser(AsyncBaseModel):
+    def __init__(self, db):
+        super().__init__(db, "users")
+
+    async def create_user(self, **fields):
+        return await self.create(User.user_document(**fields))
+
+
+class AsyncTrip(AsyncBaseModel):
+    def __init__(self, db):
+        super().__init__(db, "trip")
+
+
+class AsyncAPIKey(AsyncBaseModel):
+    def __init__(self, db):
+        super().__init__(db, "api_key")
+
+    async def generate_api_key(self, user_id):
+        existing = await self.read_one(API_KEY.active_key_query(user_id))
+        if existing:
+            return existing["key"]
+        key_data = API_KEY.new_key_document(user_id)
+        await self.create(key_data)
+        return key_data["key"]
+
+    async def get_valid_api_key(self, key):
+        return await self.collection.find_one(API_KEY.valid_key_query(key), API_KEY.valid_key_projection)
+
+    async def revoke_api_key(self, key):
+        return await self.delete({"key": key})
+
+
+class AsyncRelayPoint(AsyncBaseModel):
+    def __init__(self, db):
+        super().__init__(db, "relay_points")
+        self.generations = db["relay_point_generation"]
+
+    async def current_generation(self):
+        active = await self.generations.find_one({"_id": "active"})
+        return active["generation"] if active else None
@@ -0,0 +1,8 @@
+from Model import TripRollup, get_db
+
+# Rebuilds the trip_rollup collection from the existing trips:
+#   python backfill_rollups.py
+
+if __name__ == "__main__":
+    TripRollup(get_db()).backfill()
+    print("Trip rollups rebuilt")
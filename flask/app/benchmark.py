@@ -0,0 +1,236 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import resource
+import tempfile
+import threading
+import numpy as np
+
+# Per-stage benchmark of the relay point pipeline:
+#   python benchmark.py --sizes 1k,100k,1M,10M --out bench.json
+#   python benchmark.py --sizes 1k,100k --baseline bench_baseline.json
+#   python benchmark.py --sizes 1k,100k --baseline bench_baseline.json --update-baseline
+# Exits with status 1 when a stage is slower than the baseline by more than --tolerance
+
+DEFAULT_SIZES = "1k,100k,1M,10M"
+RSS_SAMPLE_SECONDS = 0.01
+SUFFIXES = {"k": 1000, "m": 1000000}
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    if text[-1:] in SUFFIXES:
+        return int(float(text[:-1]) * SUFFIXES[text[-1]])
+    return int(text)
+
+
+def current_rss_mb():
+    # Resident set size from /proc on Linux, the lifetime peak from getrusage elsewhere
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError):
+        scale = 2 ** 20 if sys.platform == 'darwin' else 2 ** 10
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+class PeakRSS:
+    # Samples the RSS in a background thread while a stage runs
+    def __enter__(self):
+        self.peak = current_rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(RSS_SAMPLE_SECONDS):
+            self.peak = max(self.peak, current_rss_mb())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, current_rss_mb())
+
+
+class Benchmark:
+    def __init__(self, repeat=1):
+        self.repeat = repeat
+        self.results = []
+
+    def run(self, stage, clients, items, unit, function):
+        # Best wall time of `repeat` runs, items / seconds gives the throughput
+        best = None
+        value = None
+        with PeakRSS() as rss:
+            for _ in range(self.repeat):
+                start = time.perf_counter()
+                value = function()
+                elapsed = time.perf_counter() - start
+                best = elapsed if best is None else min(best, elapsed)
+        self.results.append({
+            "stage": stage,
+            "clients": clients,
+            "seconds": round(best, 6),
+            "peak_rss_mb": round(rss.peak, 1),
+            "throughput": round(items / best, 1) if best > 0 else None,
+            "unit": unit,
+        })
+        print(f"{stage:>22} {clients or '':>10} {best:10.4f}s {rss.peak:10.1f} MB")
+        return value
+
+    def skip(self, stage, clients, reason):
+        self.results.append({"stage": stage, "clients": clients, "skipped": reason})
+        print(f"{stage:>22} {clients or '':>10} skipped: {reason}")
+
+
+def available_engines():
+    from distance_engine import get_distance_engine, ENGINES
+
+    engines = {}
+    for name in ENGINES:
+        try:
+            engines[name] = get_distance_engine(name)
+        except Exception as e:
+            print(f"Distance engine {name} not available: {e}")
+    return engines
+
+
+def make_clients(num_clients, seed):
+    from workload_gen import generate_clients
+
+    chunks = list(generate_clients(num_clients, seed=seed))
+    return np.concatenate([c[0] for c in chunks]), np.concatenate([c[1] for c in chunks])
+
+
+def run_pipeline(sizes, relay_points=100, iterations=10, seed=42, repeat=1, boundary=True):
+    import city_data
+    from ml_model import load_city, compute_weighted_haversine_distances
+    from geo_kmeans import weighted_geographic_kmeans, snap_to_cities
+    from spatial_index import SphericalIndex
+    from model_registry import ModelRegistry
+
+    bench = Benchmark(repeat)
+
+    def cold_city_load():
+        # The compiled cache stays on disk, only the per-process table is dropped
+        city_data._tables.clear()
+        return load_city()
+    city_positions, city_names = bench.run("city_loading", None, 1, "loads/s", cold_city_load)
+    city_index = bench.run("city_index_build", None, len(city_positions), "cities/s", lambda: SphericalIndex(city_positions))
+
+    mask = None
+    if boundary:
+        try:
+            from boundary_mask import BoundaryMask
+            mask = bench.run("boundary_load", None, 1, "loads/s", BoundaryMask.load)
+        except Exception as e:
+            bench.skip("boundary_load", None, str(e))
+    engines = available_engines()
+
+    for num_clients in sizes:
+        positions, purchase_rates = make_clients(num_clients, seed)
+        lat, lon = positions[:, 0], positions[:, 1]
+        if mask is not None:
+            bench.run("boundary_filter", num_clients, num_clients, "clients/s", lambda: mask.filter(positions, purchase_rates))
+        else:
+            bench.skip("boundary_filter", num_clients, "no boundary data")
+
+        # Distances to relay_points candidate sites taken from the city table
+        sites = city_positions[:relay_points]
+        for name in engines:
+            bench.run(f"distances_{name}", num_clients, num_clients * len(sites), "pairs/s",
+                      lambda: compute_weighted_haversine_distances(lat, lon, sites[:, 0], sites[:, 1], purchase_rates, len(sites), engine=name))
+
+        # Fixed iteration count so every size does the same amount of work per client
+        result = bench.run("clustering", num_clients, num_clients * iterations, "client-iterations/s",
+                           lambda: weighted_geographic_kmeans(positions, purchase_rates, None, relay_points,
+                                                              max_iterations=iterations, shift_tol_km=0.0,
+                                                              inertia_tol=0.0, seed=seed))
+        bench.run("snapping", num_clients, len(result.centroids), "centroids/s",
+                  lambda: snap_to_cities(result.centroids, city_index))
+
+        artifact = {"centroids": result.centroids, "cluster_weights": result.cluster_weights, "inertia": result.inertia}
+        with tempfile.TemporaryDirectory() as root:
+            registry = ModelRegistry(root=root)
+            bench.run("persistence", num_clients, 1, "publishes/s",
+                      lambda: (registry.publish(artifact), registry.load()))
+        del positions, purchase_rates, lat, lon
+    return bench.results
+
+
+def environment():
+    return {
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "cpu_count": os.cpu_count(),
+        "distance_engine": os.getenv("DISTANCE_ENGINE", "auto"),
+    }
+
+
+def compare(results, baseline, tolerance):
+    # (stage, clients, ratio) of every stage slower than the baseline by more than tolerance
+    reference = {(r["stage"], r["clients"]): r for r in baseline.get("results", []) if "seconds" in r}
+    regressions = []
+    for result in results:
+        base = reference.get((result["stage"], result["clients"]))
+        if base is None or "seconds" not in result or not base["seconds"]:
+            continue
+        ratio = result["seconds"] / base["seconds"]
+        result["baseline_seconds"] = base["seconds"]
+        result["ratio"] = round(ratio, 3)
+        if ratio > 1 + tolerance:
+            regressions.append((result["stage"], result["clients"], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark each stage of the relay point pipeline")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma separated client counts, e.g. 1k,100k,1M")
+    parser.add_argument("--relay-points", type=int, default=100)
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per stage, the best time is kept")
+    parser.add_argument("--no-boundary", action="store_true", help="skip the boundary stages")
+    parser.add_argument("--out", default=None, help="JSON report path, printed to stdout otherwise")
+    parser.add_argument("--baseline", default=None, help="JSON report to compare against")
+    parser.add_argument("--update-baseline", action="store_true", help="write this run to --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown over the baseline")
+    args = parser.parse_args()
+    if args.update_baseline and not args.baseline:
+        parser.error("--update-baseline needs --baseline")
+
+    sizes = [parse_size(size) for size in args.sizes.split(",")]
+    results = run_pipeline(sizes, args.relay_points, args.iterations, args.seed, args.repeat, not args.no_boundary)
+    report = {"environment": environment(), "parameters": vars(args), "results": results}
+
+    regressions = []
+    if args.baseline and not args.update_baseline:
+        try:
+            with open(args.baseline) as f:
+                regressions = compare(results, json.load(f), args.tolerance)
+        except FileNotFoundError:
+            print(f"No baseline at {args.baseline}, run with --update-baseline to record one.")
+        report["regressions"] = [{"stage": s, "clients": c, "ratio": round(r, 3)} for s, c, r in regressions]
+        for stage, clients, ratio in regressions:
+            print(f"Regression: {stage} at {clients} clients is {ratio:.2f}x the baseline time")
+
+    output = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            f.write(output)
+        print("Baseline written to", args.baseline)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
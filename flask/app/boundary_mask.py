@@ -0,0 +1,138 @@
+import os
+import glob
+import threading
+import numpy as np
+import joblib
+import geopandas as gpd
+import shapely
+from shapely import wkb
+from city_data import cached_checksum
+
+cache_file_boundaries = 'france_boundaries_cache.pkl'
+FRANCE_SHAPEFILE = 'FRA.zip'
+DEFAULT_CHUNK_SIZE = 1_000_000
+# ~1km at French latitudes, used by the simplified fast path
+DEFAULT_SIMPLIFY_TOLERANCE = 0.01
+
+
+def _read_source(cache_file):
+    try:
+        with open(cache_file + '.source') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def boundaries_checksum(cache_file=cache_file_boundaries, shapefile=None):
+    # Checksum of the GeoDataFrame pickle, which is first rebuilt when the shapefile it was read from changed
+    # (without the shapefile, the pickle is used as it is)
+    shapefile = shapefile or FRANCE_SHAPEFILE
+    if os.path.exists(shapefile):
+        source = cached_checksum(shapefile, cache_file + '.shapefile.json')
+        if source != _read_source(cache_file) or not os.path.exists(cache_file):
+            print(f"Loading France boundaries from {shapefile}.")
+            tmp_path = f'{cache_file}.{os.getpid()}.tmp'
+            joblib.dump(gpd.read_file(shapefile), tmp_path)
+            os.replace(tmp_path, cache_file)
+            with open(cache_file + '.source', 'w') as f:
+                f.write(source)
+            print("France boundaries cached.")
+    return cached_checksum(cache_file, cache_file + '.checksum.json')
+
+
+def load_france_boundaries(cache_file_boundaries, shapefile=None):
+    boundaries_checksum(cache_file_boundaries, shapefile)
+    france_boundaries = joblib.load(cache_file_boundaries)
+    print("Loaded France boundaries from cache.")
+    return france_boundaries
+
+
+def _wkb_path(cache_file, simplify_tolerance, checksum):
+    base = f"{os.path.splitext(cache_file)[0]}_union"
+    if simplify_tolerance:
+        base += f"_simplified_{simplify_tolerance:g}"
+    return f"{base}.{checksum[:16]}.wkb"
+
+
+def load_union_geometry(cache_file=cache_file_boundaries, simplify_tolerance=None, shapefile=None):
+    # The dissolved geometry is cached as WKB next to the GeoDataFrame pickle, under the pickle's checksum
+    # like the compiled city table, so a changed shapefile or pickle is never served from an older union
+    checksum = boundaries_checksum(cache_file, shapefile)
+    path = _wkb_path(cache_file, simplify_tolerance, checksum)
+    try:
+        with open(path, 'rb') as f:
+            return wkb.loads(f.read())
+    except FileNotFoundError:
+        pass
+
+    geometry = joblib.load(cache_file).geometry.union_all()
+    if simplify_tolerance:
+        geometry = geometry.simplify(simplify_tolerance, preserve_topology=True)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(wkb.dumps(geometry))
+    os.replace(tmp_path, path)
+    # Unions of previous versions of the pickle
+    prefix = _wkb_path(cache_file, simplify_tolerance, '')[:-len('.wkb')]
+    for stale in glob.glob(glob.escape(prefix) + '*.wkb'):
+        if stale != path and len(os.path.basename(stale)) == len(os.path.basename(path)):
+            os.remove(stale)
+    print("France boundary union cached at", path)
+    return geometry
+
+
+class BoundaryMask:
+    def __init__(self, geometry, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.geometry = geometry
+        shapely.prepare(self.geometry)
+        self.bounds = self.geometry.bounds  # (min_lon, min_lat, max_lon, max_lat)
+        self.chunk_size = chunk_size
+        # Checksum of the boundary pickle the mask was loaded from
+        self.checksum = None
+
+    @classmethod
+    def load(cls, cache_file=cache_file_boundaries, simplify_tolerance=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        mask = cls(load_union_geometry(cache_file, simplify_tolerance), chunk_size=chunk_size)
+        mask.checksum = boundaries_checksum(cache_file)
+        return mask
+
+    @classmethod
+    def load_fast(cls, cache_file=cache_file_boundaries, chunk_size=DEFAULT_CHUNK_SIZE):
+        # Simplified polygon: far fewer vertices, may misclassify points within ~1km of the border
+        return cls.load(cache_file, DEFAULT_SIMPLIFY_TOLERANCE, chunk_size)
+
+    def contains(self, lat, lon):
+        # Boolean mask of the points inside the boundary
+        lat = np.asarray(lat, dtype=np.float64)
+        lon = np.asarray(lon, dtype=np.float64)
+        min_lon, min_lat, max_lon, max_lat = self.bounds
+        inside = (lon >= min_lon) & (lon <= max_lon) & (lat >= min_lat) & (lat <= max_lat)
+
+        # Exact test only for the points that passed the bounding box, chunk by chunk
+        candidates = np.flatnonzero(inside)
+        for start in range(0, len(candidates), self.chunk_size):
+            rows = candidates[start:start + self.chunk_size]
+            inside[rows] = shapely.contains_xy(self.geometry, lon[rows], lat[rows])
+        return inside
+
+    def filter(self, client_positions, *arrays):
+        # Keeps the [lat, lng] rows inside the boundary, plus the matching rows of any extra arrays
+        mask = self.contains(client_positions[:, 0], client_positions[:, 1])
+        if not arrays:
+            return client_positions[mask]
+        return (client_positions[mask],) + tuple(np.asarray(a)[mask] for a in arrays)
+
+
+_lock = threading.Lock()
+_masks = {}
+
+
+def get_boundary_mask(cache_file=cache_file_boundaries, simplify_tolerance=None):
+    # Loaded once per process and again when the boundary sources change, a mask loaded before a fork
+    # is shared copy-on-write by the children
+    key = (os.path.abspath(cache_file), simplify_tolerance)
+    with _lock:
+        mask = _masks.get(key)
+        if mask is None or mask.checksum != boundaries_checksum(cache_file):
+            mask = _masks[key] = BoundaryMask.load(cache_file, simplify_tolerance)
+        return mask
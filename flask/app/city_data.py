@@ -0,0 +1,180 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+import numpy as np
+import pandas as pd
+
+CITY_CSV = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cleaned_cities.csv')
+CITY_CACHE_DIR = os.getenv("CITY_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'city_cache'))
+# Bumped when the layout of the compiled files changes
+CACHE_FORMAT = 2
+ARRAYS = ("lat", "lon", "name_offsets", "name_bytes", "department_codes", "region_codes",
+          "department_order", "department_starts", "region_order", "region_starts")
+
+
+def file_checksum(path):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def cached_checksum(path, stamp_path):
+    # The file is only hashed again when its size or mtime changed since the stamp was written
+    stat = os.stat(path)
+    stamp = {"path": os.path.abspath(path), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+    try:
+        with open(stamp_path) as f:
+            current = json.load(f)
+        if {key: current.get(key) for key in stamp} == stamp:
+            return current["sha256"]
+    except (FileNotFoundError, ValueError):
+        pass
+    stamp["sha256"] = file_checksum(path)
+    os.makedirs(os.path.dirname(stamp_path) or '.', exist_ok=True)
+    tmp_path = stamp_path + f'.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(stamp, f)
+    os.replace(tmp_path, stamp_path)
+    return stamp["sha256"]
+
+
+def csv_checksum(csv_path, cache_dir):
+    return cached_checksum(csv_path, os.path.join(cache_dir, 'current.json'))
+
+
+def lookup_index(codes, count):
+    # Rows sorted by code plus the start of each code, rows of code c are order[starts[c]:starts[c + 1]]
+    order = np.argsort(codes, kind='stable').astype(np.int32)
+    starts = np.searchsorted(codes[order], np.arange(count + 1)).astype(np.int32)
+    return order, starts
+
+
+def compile_city_table(csv_path, target_dir, checksum):
+    city = pd.read_csv(csv_path, dtype={'department_number': str, 'region_name': str})
+    city = city.dropna(subset=['latitude', 'longitude', 'label'])
+    departments, department_codes = np.unique(city['department_number'].fillna('').values, return_inverse=True)
+    regions, region_codes = np.unique(city['region_name'].fillna('').values, return_inverse=True)
+
+    encoded = [label.encode('utf-8') for label in city['label'].values]
+    name_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(name) for name in encoded], out=name_offsets[1:])
+    department_codes = department_codes.astype(np.int16)
+    region_codes = region_codes.astype(np.int16)
+    department_order, department_starts = lookup_index(department_codes, len(departments))
+    region_order, region_starts = lookup_index(region_codes, len(regions))
+    arrays = {
+        # float64: relay points snapped on a city are stored with the coordinates of the CSV
+        "lat": city['latitude'].values.astype(np.float64),
+        "lon": city['longitude'].values.astype(np.float64),
+        "name_offsets": name_offsets,
+        "name_bytes": np.frombuffer(b''.join(encoded), dtype=np.uint8),
+        "department_codes": department_codes,
+        "region_codes": region_codes,
+        "department_order": department_order,
+        "department_starts": department_starts,
+        "region_order": region_order,
+        "region_starts": region_starts,
+    }
+
+    # Compiled in a private directory and renamed, concurrent processes never see a partial cache
+    tmp_dir = f'{target_dir}.{os.getpid()}.tmp'
+    os.makedirs(tmp_dir, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_dir, name + '.npy'), array)
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump({"format": CACHE_FORMAT, "sha256": checksum, "count": len(city),
+                   "departments": departments.tolist(), "regions": regions.tolist()}, f)
+    try:
+        os.rename(tmp_dir, target_dir)
+    except OSError:
+        # Another process compiled the same checksum first
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    print(f"Compiled {len(city)} cities into {target_dir}.")
+
+
+class CityTable:
+    # Columnar, memory-mapped city table, the pages are shared by every process reading the same cache
+    def __init__(self, directory):
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        self.directory = directory
+        self.checksum = meta["sha256"]
+        self.departments = meta["departments"]
+        self.regions = meta["regions"]
+        self._department_ids = {code: i for i, code in enumerate(self.departments)}
+        self._region_ids = {name: i for i, name in enumerate(self.regions)}
+        for name in ARRAYS:
+            setattr(self, name, np.load(os.path.join(directory, name + '.npy'), mmap_mode='r'))
+        self._names = None
+
+    def __len__(self):
+        return len(self.lat)
+
+    @property
+    def positions(self):
+        # (n, 2) float64 [lat, lng] copy, the layout used by the clustering code
+        return np.column_stack((self.lat, self.lon)).astype(np.float64)
+
+    def name(self, row):
+        return bytes(self.name_bytes[self.name_offsets[row]:self.name_offsets[row + 1]]).decode('utf-8')
+
+    @property
+    def names(self):
+        # Decoded once per process on first use
+        if self._names is None:
+            blob = bytes(self.name_bytes)
+            offsets = self.name_offsets.tolist()
+            self._names = np.array([blob[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])], dtype=object)
+        return self._names
+
+    def department_of(self, rows):
+        return np.asarray(self.departments, dtype=object)[self.department_codes[rows]]
+
+    def region_of(self, rows):
+        return np.asarray(self.regions, dtype=object)[self.region_codes[rows]]
+
+    def rows(self, department=None, region=None):
+        # Row numbers of the cities in a department and/or region, sorted
+        selected = None
+        if department is not None:
+            code = self._department_ids.get(str(department))
+            if code is None:
+                return np.empty(0, dtype=np.int32)
+            selected = self.department_order[self.department_starts[code]:self.department_starts[code + 1]]
+        if region is not None:
+            code = self._region_ids.get(region)
+            if code is None:
+                return np.empty(0, dtype=np.int32)
+            region_rows = self.region_order[self.region_starts[code]:self.region_starts[code + 1]]
+            selected = region_rows if selected is None else np.intersect1d(selected, region_rows)
+        if selected is None:
+            return np.arange(len(self), dtype=np.int32)
+        return np.sort(selected)
+
+
+_lock = threading.Lock()
+_tables = {}
+
+
+def load_city_table(csv_path=CITY_CSV, cache_dir=CITY_CACHE_DIR):
+    # Compiles the CSV on first use, later loads only map the compiled files, no network access
+    with _lock:
+        checksum = csv_checksum(csv_path, cache_dir)
+        table = _tables.get(cache_dir)
+        if table is not None and table.checksum == checksum:
+            return table
+        directory = os.path.join(cache_dir, f'v{CACHE_FORMAT}-{checksum[:16]}')
+        if not os.path.exists(os.path.join(directory, 'meta.json')):
+            compile_city_table(csv_path, directory, checksum)
+            # Caches of previous CSV versions, already mapped files stay readable after the removal
+            for entry in os.listdir(cache_dir):
+                path = os.path.join(cache_dir, entry)
+                if entry.startswith('v') and path != directory and not entry.endswith('.tmp'):
+                    shutil.rmtree(path, ignore_errors=True)
+        table = CityTable(directory)
+        _tables[cache_dir] = table
+        return table
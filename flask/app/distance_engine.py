@@ -0,0 +1,280 @@
+import os
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0
+DEG_TO_RAD = 0.017453292519943295
+
+# Memory budget for one client x relay-point block on the CPU backend (in bytes)
+DEFAULT_BLOCK_BYTES = 64 * 1024 * 1024
+
+
+def haversine_matrix(lat1, lon1, lat2, lon2):
+    # Great-circle distance in km between every (lat1, lon1) and every (lat2, lon2)
+    lat1 = np.asarray(lat1, dtype=np.float64)[:, None] * DEG_TO_RAD
+    lon1 = np.asarray(lon1, dtype=np.float64)[:, None] * DEG_TO_RAD
+    lat2 = np.asarray(lat2, dtype=np.float64)[None, :] * DEG_TO_RAD
+    lon2 = np.asarray(lon2, dtype=np.float64)[None, :] * DEG_TO_RAD
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    np.clip(a, 0.0, 1.0, out=a)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+def haversine_distances(lat1, lon1, lat2, lon2):
+    # Element-wise great-circle distance in km between (lat1[i], lon1[i]) and (lat2[i], lon2[i])
+    lat1 = np.asarray(lat1, dtype=np.float64) * DEG_TO_RAD
+    lon1 = np.asarray(lon1, dtype=np.float64) * DEG_TO_RAD
+    lat2 = np.asarray(lat2, dtype=np.float64) * DEG_TO_RAD
+    lon2 = np.asarray(lon2, dtype=np.float64) * DEG_TO_RAD
+
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    a = np.clip(a, 0.0, 1.0)
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class CPUDistanceEngine:
+    name = "cpu"
+
+    def __init__(self, block_bytes=DEFAULT_BLOCK_BYTES):
+        self.block_bytes = block_bytes
+
+    def _block_size(self, num_relay_points):
+        # Number of clients per block so that the float64 distance matrix fits the budget
+        return max(1, self.block_bytes // (8 * max(1, num_relay_points)))
+
+    def weighted_min_distances(self, lat1, lon1, lat2, lon2, purchase_rates):
+        num_clients = len(lat1)
+        purchase_rates = np.asarray(purchase_rates, dtype=np.float64)
+        distances = np.empty(num_clients, dtype=np.float32)
+        if len(lat2) == 0:
+            distances.fill(1e20)
+            return distances
+
+        block = self._block_size(len(lat2))
+        for start in range(0, num_clients, block):
+            end = min(start + block, num_clients)
+            matrix = haversine_matrix(lat1[start:end], lon1[start:end], lat2, lon2)
+            distances[start:end] = purchase_rates[start:end] * matrix.min(axis=1)
+        return distances
+
+    def nearest(self, lat1, lon1, lat2, lon2):
+        # Index of the closest (lat2, lon2) point for every (lat1, lon1) point and its distance in km
+        num_clients = len(lat1)
+        indices = np.empty(num_clients, dtype=np.int64)
+        distances = np.empty(num_clients, dtype=np.float64)
+        if len(lat2) == 0:
+            raise ValueError("nearest() needs at least one target point")
+
+        block = self._block_size(len(lat2))
+        rows = np.arange(min(block, num_clients))
+        for start in range(0, num_clients, block):
+            end = min(start + block, num_clients)
+            matrix = haversine_matrix(lat1[start:end], lon1[start:end], lat2, lon2)
+            best = matrix.argmin(axis=1)
+            indices[start:end] = best
+            distances[start:end] = matrix[rows[:end - start], best]
+        return indices, distances
+
+
+# Corrected Haversine formula implemented in CUDA for geographical distance calculation
+CUDA_SOURCE = """
+__global__ void calculate_weighted_haversine(float *lat1, float *lon1, float *lat2, float *lon2, float *distances, float *purchase_rates, int num_clients, int num_relay_points) {
+    int idx = threadIdx.x + blockIdx.x * blockDim.x;
+    if (idx < num_clients) {
+        float R = 6371.0; // Radius of Earth in kilometers
+        float min_distance = 1e20;
+
+        for (int j = 0; j < num_relay_points; ++j) {
+            float dlat = (lat2[j] - lat1[idx]) * 0.017453292519943295; // Convert degrees to radians
+            float dlon = (lon2[j] - lon1[idx]) * 0.017453292519943295; // Convert degrees to radians
+            float a = sin(dlat/2) * sin(dlat/2) + cos(lat1[idx] * 0.017453292519943295) * cos(lat2[j] * 0.017453292519943295) * sin(dlon/2) * sin(dlon/2);
+            float c = 2 * atan2(sqrt(a), sqrt(1-a));
+            float distance = purchase_rates[idx] * R * c;
+            if (distance < min_distance) {
+                min_distance = distance;
+            }
+        }
+        distances[idx] = min_distance;
+    }
+}
+
+__global__ void assign_nearest_haversine(float *lat1, float *lon1, float *lat2, float *lon2, float *distances, int *indices, int num_clients, int num_relay_points) {
+    int idx = threadIdx.x + blockIdx.x * blockDim.x;
+    if (idx < num_clients) {
+        float R = 6371.0;
+        float min_distance = 1e20;
+        int best = 0;
+
+        for (int j = 0; j < num_relay_points; ++j) {
+            float dlat = (lat2[j] - lat1[idx]) * 0.017453292519943295;
+            float dlon = (lon2[j] - lon1[idx]) * 0.017453292519943295;
+            float a = sin(dlat/2) * sin(dlat/2) + cos(lat1[idx] * 0.017453292519943295) * cos(lat2[j] * 0.017453292519943295) * sin(dlon/2) * sin(dlon/2);
+            float c = 2 * atan2(sqrt(a), sqrt(1-a));
+            float distance = R * c;
+            if (distance < min_distance) {
+                min_distance = distance;
+                best = j;
+            }
+        }
+        distances[idx] = min_distance;
+        indices[idx] = best;
+    }
+}
+"""
+
+
+class CUDADistanceEngine:
+    name = "cuda"
+
+    def __init__(self, block_size=1024):
+        # pycuda is only imported here so hosts without a GPU can still load this module
+        import pycuda.autoinit  # noqa: F401
+        import pycuda.driver as cuda
+        from pycuda.compiler import SourceModule
+
+        self.cuda = cuda
+        self.block_size = block_size
+        self.module = SourceModule(CUDA_SOURCE)
+        self.calculate_weighted_haversine = self.module.get_function("calculate_weighted_haversine")
+        self.assign_nearest_haversine = self.module.get_function("assign_nearest_haversine")
+
+    def weighted_min_distances(self, lat1, lon1, lat2, lon2, purchase_rates):
+        cuda = self.cuda
+        num_clients = len(lat1)
+
+        # The kernel works on float32, make sure the arrays are contiguous and typed
+        lat1 = np.ascontiguousarray(lat1, dtype=np.float32)
+        lon1 = np.ascontiguousarray(lon1, dtype=np.float32)
+        lat2 = np.ascontiguousarray(lat2, dtype=np.float32)
+        lon2 = np.ascontiguousarray(lon2, dtype=np.float32)
+        purchase_rates = np.ascontiguousarray(purchase_rates, dtype=np.float32)
+        distances = np.empty(num_clients, dtype=np.float32)
+        if num_clients == 0:
+            return distances
+
+        # Allocate memory on the GPU
+        lat1_gpu = cuda.mem_alloc(lat1.nbytes)
+        lon1_gpu = cuda.mem_alloc(lon1.nbytes)
+        lat2_gpu = cuda.mem_alloc(max(lat2.nbytes, 4))
+        lon2_gpu = cuda.mem_alloc(max(lon2.nbytes, 4))
+        distances_gpu = cuda.mem_alloc(distances.nbytes)
+        purchase_rates_gpu = cuda.mem_alloc(purchase_rates.nbytes)
+        try:
+            # Copy data to the GPU in one batch
+            cuda.memcpy_htod(lat1_gpu, lat1)
+            cuda.memcpy_htod(lon1_gpu, lon1)
+            cuda.memcpy_htod(lat2_gpu, lat2)
+            cuda.memcpy_htod(lon2_gpu, lon2)
+            cuda.memcpy_htod(purchase_rates_gpu, purchase_rates)
+
+            grid_size = (num_clients + self.block_size - 1) // self.block_size
+            self.calculate_weighted_haversine(
+                lat1_gpu, lon1_gpu, lat2_gpu, lon2_gpu, distances_gpu, purchase_rates_gpu,
+                np.int32(num_clients), np.int32(len(lat2)),
+                block=(self.block_size, 1, 1), grid=(grid_size, 1)
+            )
+
+            # Copy the result back to the CPU in one batch
+            cuda.memcpy_dtoh(distances, distances_gpu)
+        finally:
+            # Free GPU memory
+            lat1_gpu.free()
+            lon1_gpu.free()
+            lat2_gpu.free()
+            lon2_gpu.free()
+            distances_gpu.free()
+            purchase_rates_gpu.free()
+        return distances
+
+    def nearest(self, lat1, lon1, lat2, lon2):
+        cuda = self.cuda
+        num_clients = len(lat1)
+        if len(lat2) == 0:
+            raise ValueError("nearest() needs at least one target point")
+
+        lat1 = np.ascontiguousarray(lat1, dtype=np.float32)
+        lon1 = np.ascontiguousarray(lon1, dtype=np.float32)
+        lat2 = np.ascontiguousarray(lat2, dtype=np.float32)
+        lon2 = np.ascontiguousarray(lon2, dtype=np.float32)
+        distances = np.empty(num_clients, dtype=np.float32)
+        indices = np.empty(num_clients, dtype=np.int32)
+        if num_clients == 0:
+            return indices.astype(np.int64), distances.astype(np.float64)
+
+        lat1_gpu = cuda.mem_alloc(lat1.nbytes)
+        lon1_gpu = cuda.mem_alloc(lon1.nbytes)
+        lat2_gpu = cuda.mem_alloc(lat2.nbytes)
+        lon2_gpu = cuda.mem_alloc(lon2.nbytes)
+        distances_gpu = cuda.mem_alloc(distances.nbytes)
+        indices_gpu = cuda.mem_alloc(indices.nbytes)
+        try:
+            cuda.memcpy_htod(lat1_gpu, lat1)
+            cuda.memcpy_htod(lon1_gpu, lon1)
+            cuda.memcpy_htod(lat2_gpu, lat2)
+            cuda.memcpy_htod(lon2_gpu, lon2)
+
+            grid_size = (num_clients + self.block_size - 1) // self.block_size
+            self.assign_nearest_haversine(
+                lat1_gpu, lon1_gpu, lat2_gpu, lon2_gpu, distances_gpu, indices_gpu,
+                np.int32(num_clients), np.int32(len(lat2)),
+                block=(self.block_size, 1, 1), grid=(grid_size, 1)
+            )
+
+            cuda.memcpy_dtoh(distances, distances_gpu)
+            cuda.memcpy_dtoh(indices, indices_gpu)
+        finally:
+            lat1_gpu.free()
+            lon1_gpu.free()
+            lat2_gpu.free()
+            lon2_gpu.free()
+            distances_gpu.free()
+            indices_gpu.free()
+        return indices.astype(np.int64), distances.astype(np.float64)
+
+
+ENGINES = {
+    "cpu": CPUDistanceEngine,
+    "cuda": CUDADistanceEngine,
+}
+
+_engines = {}
+
+
+def get_distance_engine(name=None):
+    # Engine is chosen by argument, then DISTANCE_ENGINE env var ("auto", "cpu" or "cuda")
+    name = (name or os.getenv("DISTANCE_ENGINE", "auto")).lower()
+    if name in _engines:
+        return _engines[name]
+
+    if name == "auto":
+        try:
+            engine = CUDADistanceEngine()
+        except Exception as e:
+            print(f"CUDA not available ({e}), using CPU distance engine.")
+            engine = CPUDistanceEngine()
+    elif name in ENGINES:
+        engine = ENGINES[name]()
+    else:
+        raise ValueError(f"Unknown distance engine '{name}', expected one of: auto, {', '.join(ENGINES)}")
+
+    _engines[name] = engine
+    return engine
+
+
+def compare_engines(num_clients=10000, num_relay_points=50, rtol=1e-3, seed=42):
+    # Check that the CPU and CUDA backends agree on random points inside France
+    rng = np.random.default_rng(seed)
+    lat1 = rng.uniform(42.0, 51.0, num_clients)
+    lon1 = rng.uniform(-5.0, 8.0, num_clients)
+    lat2 = rng.uniform(42.0, 51.0, num_relay_points)
+    lon2 = rng.uniform(-5.0, 8.0, num_relay_points)
+    purchase_rates = rng.uniform(1.0, 10.0, num_clients)
+
+    cpu = get_distance_engine("cpu").weighted_min_distances(lat1, lon1, lat2, lon2, purchase_rates)
+    cuda = get_distance_engine("cuda").weighted_min_distances(lat1, lon1, lat2, lon2, purchase_rates)
+    # float32 haversine loses precision for very short distances, hence the absolute tolerance
+    return bool(np.allclose(cpu, cuda, rtol=rtol, atol=0.05))
+
+
+if __name__ == "__main__":
+    print("CPU and CUDA engines agree:", compare_engines())
@@ -0,0 +1,58 @@
+import json
+import zlib
+from datetime import datetime
+from bson.objectid import ObjectId
+from app.pagination import parse_date_range
+
+EXPORT_BATCH_SIZE = 2000
+# Lines are buffered up to this size before a chunk is sent to the client
+EXPORT_CHUNK_BYTES = 64 * 1024
+
+# collection -> (date field used by the start_date/end_date filter, projection)
+EXPORTS = {
+    "trips": ("trip", "start_date", None),
+    "users": ("users", "hire_date", {"password": 0}),
+    "relay_points": ("relay_points", "updated_at", None),
+}
+
+
+def _json_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def iter_ndjson(cursor):
+    # One JSON document per line, grouped into chunks of roughly EXPORT_CHUNK_BYTES
+    encoder = json.JSONEncoder(default=_json_default, separators=(',', ':'), ensure_ascii=False)
+    buffer = []
+    size = 0
+    for document in cursor:
+        line = encoder.encode(document) + '\n'
+        buffer.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_BYTES:
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def gzip_chunks(chunks):
+    # Streaming gzip, wbits=31 writes the gzip header and trailer
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_cursor(db, name, args):
+    # The start_date/end_date arguments filter on the collection's own date field
+    collection, date_field, projection = EXPORTS[name]
+    query = parse_date_range(args, field=date_field)
+    return db[collection].find(query, projection).sort("_id", 1).batch_size(EXPORT_BATCH_SIZE)
@@ -0,0 +1,128 @@
+import numpy as np
+from distance_engine import get_distance_engine, haversine_distances
+from spatial_index import SphericalIndex
+
+
+class GeoKMeansResult:
+    def __init__(self, centroids, labels, distances, inertia, iterations, converged, cluster_weights):
+        self.centroids = centroids  # (k, 2) array of [lat, lng]
+        self.labels = labels  # index of the relay point serving each client
+        self.distances = distances  # client to relay point distance in km
+        self.inertia = inertia  # sum of purchase_rate * distance^2 (km^2)
+        self.iterations = iterations
+        self.converged = converged
+        self.cluster_weights = cluster_weights  # total purchase rate served by each relay point
+
+    def __repr__(self):
+        return (f"GeoKMeansResult(k={len(self.centroids)}, iterations={self.iterations}, "
+                f"inertia={self.inertia:.2f}, converged={self.converged})")
+
+
+def as_city_index(city_positions):
+    # Accepts a prebuilt index (e.g. get_city_index()) or a raw (n, 2) array of cities
+    if city_positions is None or isinstance(city_positions, SphericalIndex):
+        return city_positions
+    return SphericalIndex(city_positions)
+
+
+def snap_to_cities(centroids, city_index):
+    # Move every centroid onto the nearest city by great-circle distance
+    indices, _ = city_index.nearest(centroids[:, 0], centroids[:, 1])
+    return city_index.positions[indices]
+
+
+def kmeans_plus_plus(client_positions, purchase_rates, num_relay_points, rng, initial=None):
+    # Weighted k-means++: each new seed is drawn with probability purchase_rate * D^2
+    # initial: seeds kept as they are (warm start), only the missing ones are drawn
+    num_clients = len(client_positions)
+    lat, lon = client_positions[:, 0], client_positions[:, 1]
+    weights = purchase_rates / purchase_rates.sum()
+
+    seeds = np.empty((num_relay_points, 2), dtype=np.float64)
+    if initial is not None and len(initial):
+        start = min(len(initial), num_relay_points)
+        seeds[:start] = initial[:start]
+    else:
+        start = 1
+        seeds[0] = client_positions[rng.choice(num_clients, p=weights)]
+    closest_sq = haversine_distances(lat, lon, seeds[0, 0], seeds[0, 1]) ** 2
+    for j in range(1, start):
+        np.minimum(closest_sq, haversine_distances(lat, lon, seeds[j, 0], seeds[j, 1]) ** 2, out=closest_sq)
+
+    for j in range(start, num_relay_points):
+        potential = purchase_rates * closest_sq
+        total = potential.sum()
+        if total > 0:
+            index = rng.choice(num_clients, p=potential / total)
+        else:
+            index = rng.choice(num_clients, p=weights)
+        seeds[j] = client_positions[index]
+        new_sq = haversine_distances(lat, lon, seeds[j, 0], seeds[j, 1]) ** 2
+        np.minimum(closest_sq, new_sq, out=closest_sq)
+    return seeds
+
+
+def weighted_geographic_kmeans(client_positions, purchase_rates, city_positions, num_relay_points,
+                               max_iterations=100, shift_tol_km=0.01, inertia_tol=1e-6,
+                               seed=None, engine=None, callback=None, init_centroids=None):
+    engine = get_distance_engine(engine)
+    rng = np.random.default_rng(seed)
+
+    client_positions = np.asarray(client_positions, dtype=np.float64)
+    purchase_rates = np.asarray(purchase_rates, dtype=np.float64)
+    city_index = as_city_index(city_positions)
+    lat, lon = client_positions[:, 0], client_positions[:, 1]
+
+    num_clients = len(client_positions)
+    if num_clients == 0:
+        raise ValueError("No client positions to cluster")
+    num_relay_points = min(num_relay_points, num_clients)
+
+    # init_centroids warm-starts the run, e.g. from the solution for a neighbouring number of relay points
+    initial = np.asarray(init_centroids, dtype=np.float64).reshape(-1, 2) if init_centroids is not None else None
+    centroids = kmeans_plus_plus(client_positions, purchase_rates, num_relay_points, rng, initial)
+    if city_index is not None:
+        centroids = snap_to_cities(centroids, city_index)
+
+    previous_inertia = None
+    converged = False
+    assigned = False
+    iteration = 0
+    for iteration in range(1, max_iterations + 1):
+        # Assignment step: full argmin over every relay point for each client
+        labels, distances = engine.nearest(lat, lon, centroids[:, 0], centroids[:, 1])
+        inertia = float(np.dot(purchase_rates, distances ** 2))
+        assigned = True
+
+        if previous_inertia is not None and previous_inertia - inertia <= inertia_tol * max(previous_inertia, 1e-12):
+            converged = True
+            break
+        if callback is not None:
+            callback(iteration, inertia)
+        previous_inertia = inertia
+
+        # Update step: weighted means per cluster in one pass, empty clusters keep their centroid
+        cluster_weights = np.bincount(labels, weights=purchase_rates, minlength=num_relay_points)
+        sum_lat = np.bincount(labels, weights=purchase_rates * lat, minlength=num_relay_points)
+        sum_lon = np.bincount(labels, weights=purchase_rates * lon, minlength=num_relay_points)
+        new_centroids = centroids.copy()
+        filled = cluster_weights > 0
+        new_centroids[filled, 0] = sum_lat[filled] / cluster_weights[filled]
+        new_centroids[filled, 1] = sum_lon[filled] / cluster_weights[filled]
+
+        if city_index is not None:
+            new_centroids = snap_to_cities(new_centroids, city_index)
+
+        shift = haversine_distances(centroids[:, 0], centroids[:, 1], new_centroids[:, 0], new_centroids[:, 1])
+        centroids = new_centroids
+        assigned = False
+        if shift.max() <= shift_tol_km:
+            converged = True
+            break
+
+    if not assigned:
+        # Centroids moved since the last assignment
+        labels, distances = engine.nearest(lat, lon, centroids[:, 0], centroids[:, 1])
+        inertia = float(np.dot(purchase_rates, distances ** 2))
+    cluster_weights = np.bincount(labels, weights=purchase_rates, minlength=num_relay_points)
+    return GeoKMeansResult(centroids, labels, distances, inertia, iteration, converged, cluster_weights)
@@ -0,0 +1,39 @@
+import time
+import traceback
+
+# Functions run in the relay point job processes. Imported without the app package prefix, so a pool
+# process unpickling a job loads the ML stack only, not the Flask app and its Mongo client
+
+# Progress is written to the job document at most this often
+PROGRESS_SECONDS = 1.0
+
+
+def run_relay_point_job(job_id, params):
+    from Model import RelayPointJob, get_db
+    from ml_model import generate_relay_points
+    from model_registry import ModelRegistry
+
+    db = get_db()
+    jobs = RelayPointJob(db)
+    last_report = [0.0]
+
+    def report(iteration, inertia):
+        now = time.monotonic()
+        if now - last_report[0] >= PROGRESS_SECONDS:
+            last_report[0] = now
+            jobs.progress(job_id, {"iteration": iteration, "inertia": inertia})
+
+    try:
+        jobs.start(job_id)
+        stored = generate_relay_points(progress=report, **params)
+        info = ModelRegistry().info(stored["generation"])
+        result = {"model_version": info["version"], "model": info["metadata"], "relay_points": stored["count"]}
+        jobs.finish(job_id, result)
+        return result
+    except Exception as e:
+        # The message of the failing step is what the client reads at /relay_points/jobs/<job_id>
+        traceback.print_exc()
+        jobs.fail(job_id, f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        db.client.close()
@@ -0,0 +1,121 @@
+import os
+import json
+import uuid
+import time
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from app.Model import RelayPointJob
+from job_tasks import run_relay_point_job
+
+MAX_WORKERS = int(os.getenv("RELAY_JOB_WORKERS", "1"))
+# Values accepted for the source parameter, the data sources of ml_model.load_training_data
+TRAINING_SOURCES = ("fake",)
+# Every web worker may run jobs, the one that accepted a job keeps it alive in the collection
+HEARTBEAT_SECONDS = 30
+
+
+def parse_job_params(data):
+    # Relay point job parameters from a request body, raises ValueError with a message meant for the client
+    params = {key: value for key, value in data.items() if key in ["num_relay_points", "source", "seed"]}
+    if "num_relay_points" in params:
+        try:
+            params["num_relay_points"] = int(params["num_relay_points"])
+        except (TypeError, ValueError):
+            raise ValueError("num_relay_points must be an integer")
+        if params["num_relay_points"] <= 0:
+            raise ValueError("num_relay_points must be positive")
+    if "source" in params and params["source"] not in TRAINING_SOURCES:
+        raise ValueError(f"source must be one of {', '.join(TRAINING_SOURCES)}")
+    if "seed" in params and params["seed"] is not None:
+        if not isinstance(params["seed"], int) or isinstance(params["seed"], bool) or params["seed"] < 0:
+            raise ValueError("seed must be a non-negative integer")
+    return params
+
+
+class JobManager:
+    # Runs the jobs of this web worker on its process pool, their state lives in the relay_point_jobs
+    # collection so any worker answers for any job
+    def __init__(self, max_workers=MAX_WORKERS, heartbeat_seconds=HEARTBEAT_SECONDS):
+        self.max_workers = max_workers
+        self.heartbeat_seconds = heartbeat_seconds
+        self._executor = None
+        self._pending = set()  # ids of the jobs submitted to this worker's pool and not finished yet
+        self._heartbeat = None
+        self._lock = threading.Lock()
+
+    def _start(self, db):
+        # The pool and the heartbeat thread are created on the first submission only
+        if self._executor is None:
+            # Not fork: the web worker runs request threads whose locks a forked child could inherit held,
+            # pool processes come from a fresh single-threaded server instead
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context(method))
+        if self._heartbeat is None:
+            self._heartbeat = threading.Thread(target=self._beat, args=(db,), name="relay-job-heartbeat", daemon=True)
+            self._heartbeat.start()
+
+    def _beat(self, db):
+        while True:
+            time.sleep(self.heartbeat_seconds)
+            with self._lock:
+                job_ids = list(self._pending)
+            if job_ids:
+                try:
+                    RelayPointJob(db).heartbeat(job_ids)
+                except Exception as e:
+                    print("Error refreshing the relay point job heartbeats:", e)
+
+    @staticmethod
+    def params_key(params):
+        return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+    def submit(self, db, params, func=run_relay_point_job):
+        # Returns (job_id, coalesced); identical parameters join the job already in flight on any worker
+        jobs = RelayPointJob(db)
+        job_id, coalesced = jobs.submit(uuid.uuid4().hex, self.params_key(params), params)
+        if coalesced:
+            return job_id, True
+        with self._lock:
+            try:
+                self._start(db)
+                future = self._executor.submit(func, job_id, params)
+            except Exception as e:
+                jobs.fail(job_id, str(e))
+                if isinstance(e, BrokenProcessPool):
+                    self._executor = None
+                raise
+            self._pending.add(job_id)
+        future.add_done_callback(lambda future: self._finish(db, job_id, future))
+        return job_id, False
+
+    def _finish(self, db, job_id, future):
+        with self._lock:
+            self._pending.discard(job_id)
+        error = "cancelled" if future.cancelled() else future.exception()
+        if error is None:
+            return
+        # The job process records its own failures, this covers the ones it could not (killed, broken pool)
+        if isinstance(error, BrokenProcessPool):
+            with self._lock:
+                self._executor = None
+        try:
+            RelayPointJob(db).fail(job_id, str(error))
+        except Exception as e:
+            print("Error recording the failure of relay point job", job_id, e)
+
+    def status(self, db, job_id):
+        return RelayPointJob(db).status(job_id)
+
+    def result(self, db, job_id):
+        # (status, result) where result is only set once the job is done
+        status = self.status(db, job_id)
+        if status is None or status["status"] != "done":
+            return status, None
+        return status, status.pop("result")
+
+
+job_manager = JobManager()
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from datetime import datetime, timedelta
+
+LIVE_POSITION_INTERVAL = float(os.getenv("LIVE_POSITION_INTERVAL", "1.0"))
+MIN_INTERVAL = 0.2
+MAX_INTERVAL = 30.0
+# Drivers that did not report for this long are dropped from the map
+POSITION_MAX_AGE = float(os.getenv("LIVE_POSITION_MAX_AGE", "300"))
+KEEPALIVE_SECONDS = 15
+# Removals are remembered this long, a viewer further behind gets a new snapshot instead of a delta
+TOMBSTONE_SECONDS = max(4 * MAX_INTERVAL, 2 * KEEPALIVE_SECONDS)
+# How often each worker reads the positions posted to the other workers
+FEED_INTERVAL = float(os.getenv("LIVE_POSITION_FEED_INTERVAL", "0.5"))
+FEED_OVERLAP_SECONDS = 2.0
+
+
+def normalize_positions(positions, now=None):
+    # Raises TypeError or ValueError on a position whose fields are not numbers
+    now = now or time.time()
+    return [
+        {
+            "driver_id": str(position["driver_id"]),
+            "latitude": float(position["latitude"]),
+            "longitude": float(position["longitude"]),
+            "timestamp": float(position.get("timestamp") or now),
+        }
+        for position in positions
+    ]
+
+
+class LivePositionStore:
+    # Latest position per driver, every change gets a version so viewers can ask for what changed since theirs
+    def __init__(self, max_age=POSITION_MAX_AGE):
+        self.max_age = max_age
+        self._positions = {}
+        self._removed = {}  # driver_id -> (version of the removal, removal time)
+        self._pruned_version = 0  # newest removal forgotten, older viewer versions need a snapshot
+        self._version = 0
+        self._condition = threading.Condition()
+
+    def update(self, positions):
+        # positions: iterable of {"driver_id", "latitude", "longitude"[, "timestamp"]}
+        self.merge(normalize_positions(positions))
+
+    def merge(self, positions):
+        # positions as returned by normalize_positions, a report not newer than the stored one changes nothing
+        now = time.time()
+        with self._condition:
+            for position in positions:
+                driver_id = position["driver_id"]
+                current = self._positions.get(driver_id)
+                if current is not None and current["timestamp"] >= position["timestamp"]:
+                    continue
+                self._version += 1
+                self._positions[driver_id] = dict(position, version=self._version)
+                self._removed.pop(driver_id, None)
+            self._expire(now)
+            self._condition.notify_all()
+
+    @property
+    def version(self):
+        return self._version
+
+    def _expire(self, now):
+        for driver_id in [d for d, p in self._positions.items() if now - p["timestamp"] > self.max_age]:
+            self._version += 1
+            del self._positions[driver_id]
+            self._removed[driver_id] = (self._version, now)
+        # Removals are in version order, which is also time order
+        for driver_id, (version, removed_at) in list(self._removed.items()):
+            if now - removed_at <= TOMBSTONE_SECONDS:
+                break
+            del self._removed[driver_id]
+            self._pruned_version = version
+
+    def snapshot(self):
+        with self._condition:
+            self._expire(time.time())
+            return self._version, list(self._positions.values())
+
+    def changes_since(self, version):
+        # (current version, updated positions, removed driver ids), or (current version, all positions, None)
+        # when removals after version were already forgotten and the viewer must start over from a snapshot
+        with self._condition:
+            self._expire(time.time())
+            if version < self._pruned_version:
+                return self._version, list(self._positions.values()), None
+            updated = [p for p in self._positions.values() if p["version"] > version]
+            removed = [d for d, (v, _) in self._removed.items() if v > version]
+            return self._version, updated, removed
+
+    def wait_for_change(self, version, timeout):
+        with self._condition:
+            return self._condition.wait_for(lambda: self._version > version, timeout=timeout)
+
+
+class PositionFeed:
+    # Positions are posted to any web worker, each worker polls the ones received since its last poll into
+    # its own store, so its viewers see every driver
+    # load_since(datetime) -> normalized positions received since then (DriverPosition.received_since)
+    def __init__(self, store, interval=FEED_INTERVAL):
+        self.store = store
+        self.interval = interval
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self, load_since):
+        # Started by the first viewer of the worker, the first poll runs in the caller so it sees current positions
+        with self._lock:
+            if self._thread is not None:
+                return
+            since = self._poll(load_since, datetime.now() - timedelta(seconds=self.store.max_age))
+            self._thread = threading.Thread(target=self._run, args=(load_since, since), name="position-feed", daemon=True)
+            self._thread.start()
+
+    def _poll(self, load_since, since):
+        # Returns where the next poll starts, overlapping this one: a write may commit after the poll began
+        polled_at = datetime.now()
+        try:
+            self.store.merge(load_since(since))
+        except Exception as e:
+            print("Error polling driver positions:", e)
+            return since
+        return polled_at - timedelta(seconds=FEED_OVERLAP_SECONDS)
+
+    def _run(self, load_since, since):
+        while True:
+            time.sleep(self.interval)
+            since = self._poll(load_since, since)
+
+
+def _event(name, data):
+    return f"event: {name}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def _changes_event(store, version):
+    version, updated, removed = store.changes_since(version)
+    if removed is None:
+        return version, _event("snapshot", updated)
+    return version, _event("delta", {"updated": updated, "removed": removed})
+
+
+def stream_positions(store, interval=LIVE_POSITION_INTERVAL):
+    # Server-Sent Events: one snapshot, then at most one delta per interval whatever the update rate
+    # Holds a server thread per viewer, the ASGI app serves the stream with stream_positions_async instead
+    interval = min(max(interval, MIN_INTERVAL), MAX_INTERVAL)
+    version, positions = store.snapshot()
+    yield _event("snapshot", positions)
+    last_sent = time.monotonic()
+    while True:
+        if not store.wait_for_change(version, KEEPALIVE_SECONDS):
+            yield ": keepalive\n\n"
+            continue
+        # Let the updates of the current interval pile up before sending them together
+        delay = last_sent + interval - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        version, event = _changes_event(store, version)
+        yield event
+        last_sent = time.monotonic()
+
+
+async def stream_positions_async(store, interval=LIVE_POSITION_INTERVAL):
+    # Same events on the event loop: each viewer is a coroutine comparing its version once per interval
+    interval = min(max(interval, MIN_INTERVAL), MAX_INTERVAL)
+    version, positions = store.snapshot()
+    yield _event("snapshot", positions)
+    idle = 0.0
+    while True:
+        await asyncio.sleep(interval)
+        if store.version == version:
+            idle += interval
+            if idle >= KEEPALIVE_SECONDS:
+                yield ": keepalive\n\n"
+                idle = 0.0
+            continue
+        idle = 0.0
+        version, event = _changes_event(store, version)
+        yield event
+
+
+live_positions = LivePositionStore()
+position_feed = PositionFeed(live_positions)
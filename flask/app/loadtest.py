@@ -0,0 +1,215 @@
+import json
+import time
+import random
+import argparse
+import threading
+from datetime import datetime, timedelta
+import numpy as np
+import requests
+
+# Mixed-traffic load test against a running app, seeded through MONGO_URI (use a throwaway database):
+#   MONGO_URI=mongodb://localhost:27017/loadtest python loadtest.py --seed --reset --users 500 --trips 100000
+#   python loadtest.py --base-url http://localhost:5000 --threads 32 --duration 60 --report load.json
+
+# (label, weight) of the request mix, logins are rare compared to authenticated reads
+DEFAULT_MIX = {
+    "login": 2,
+    "get_users": 15,
+    "get_trips": 25,
+    "post_trip": 20,
+    "get_relay_points": 18,
+    "nearest_relay_points": 20,
+}
+PERCENTILES = (50, 95, 99)
+TRIP_DATE_FORMAT = '%Y-%m-%d-%H:%M:%S'
+
+
+def seed_database(db, num_users, num_trips, num_relay_points=200, seed=42, reset=False, bcrypt_rounds=12):
+    # Users share workload_gen.DEFAULT_PASSWORD, hashed with the Flask-Bcrypt default cost so logins cost what they do in production
+    from pymongo.errors import BulkWriteError
+    from Model import API_KEY, relay_point, TripRollup
+    from city_data import load_city_table
+    from workload_gen import generate_users, generate_clients, trip_documents
+
+    if reset:
+        for name in ("users", "trip", "trip_rollup", "api_key", "relay_points", "relay_point_generation"):
+            db[name].delete_many({})
+    users = generate_users(num_users, seed=seed, bcrypt_rounds=bcrypt_rounds)
+    try:
+        db.users.insert_many(users, ordered=False)
+    except BulkWriteError:
+        # Users left by a previous run keep their ids, they have the same emails and password
+        pass
+    user_ids = [user["_id"] for user in db.users.find({"email": {"$in": [u["email"] for u in users]}}, {"_id": 1})]
+
+    rng = np.random.default_rng(seed)
+    for positions, purchase_rates in generate_clients(num_trips, seed=seed, chunk_size=50000):
+        db.trip.insert_many(trip_documents(positions, purchase_rates, user_ids, rng), ordered=False)
+    TripRollup(db).backfill()
+
+    # One API key per user, for workers that skip the login
+    api_key = API_KEY(db)
+    keys = [api_key.generate_api_key(str(user_id)) for user_id in user_ids]
+
+    table = load_city_table()
+    rows = rng.choice(len(table), size=min(num_relay_points, len(table)), replace=False)
+    relay = relay_point(db)
+    generation = (relay.current_generation() or 0) + 1
+    relay.replace_relay_points(np.column_stack((table.lat[rows], table.lon[rows])), generation, table.names[rows])
+    print(f"Seeded {len(user_ids)} users, {num_trips} trips, {len(keys)} API keys and {len(rows)} relay points.")
+    return {"user_ids": [str(user_id) for user_id in user_ids], "emails": [u["email"] for u in users]}
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, label, seconds, ok):
+        with self._lock:
+            self.samples.setdefault(label, []).append((seconds, ok))
+
+    def report(self, duration):
+        endpoints = {}
+        everything = []
+        for label, samples in sorted(self.samples.items()):
+            everything.extend(samples)
+            endpoints[label] = summarize(samples, duration)
+        return {"duration_seconds": round(duration, 3), "total": summarize(everything, duration), "endpoints": endpoints}
+
+
+def summarize(samples, duration):
+    if not samples:
+        return {"requests": 0}
+    latencies = np.array([seconds for seconds, _ in samples]) * 1000
+    errors = sum(1 for _, ok in samples if not ok)
+    summary = {
+        "requests": len(samples),
+        "errors": errors,
+        "error_rate": round(errors / len(samples), 4),
+        "throughput_rps": round(len(samples) / duration, 2) if duration > 0 else None,
+        "mean_ms": round(float(latencies.mean()), 2),
+        "max_ms": round(float(latencies.max()), 2),
+    }
+    for p, value in zip(PERCENTILES, np.percentile(latencies, PERCENTILES)):
+        summary[f"p{p}_ms"] = round(float(value), 2)
+    return summary
+
+
+class Worker(threading.Thread):
+    # One HTTP session, logs in once then sends requests drawn from the mix until the deadline
+    def __init__(self, base_url, users, mix, recorder, deadline, password, seed):
+        super().__init__(daemon=True)
+        self.base_url = base_url.rstrip('/')
+        self.users = users
+        self.labels = list(mix)
+        self.weights = list(mix.values())
+        self.recorder = recorder
+        self.deadline = deadline
+        self.password = password
+        self.random = random.Random(seed)
+        self.session = requests.Session()
+        self.user = None
+
+    def call(self, label, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.base_url + path, timeout=30, **kwargs)
+            ok = response.status_code < 400
+        except requests.RequestException:
+            response, ok = None, False
+        self.recorder.add(label, time.perf_counter() - start, ok)
+        return response
+
+    def login(self):
+        email = self.random.choice(self.users["emails"])
+        response = self.call("login", "POST", "/login", json={"email": email, "password": self.password})
+        if response is not None and response.status_code == 200:
+            body = response.json()
+            self.user = body["_id"]
+            self.session.headers["X-API-KEY"] = body["API_KEY"]
+
+    def step(self, label):
+        if label == "login" or self.user is None:
+            self.login()
+        elif label == "get_users":
+            self.call(label, "GET", "/users", params={"limit": 50})
+        elif label == "get_trips":
+            self.call(label, "GET", f"/trips/{self.random.choice(self.users['user_ids'])}", params={"limit": 100})
+        elif label == "post_trip":
+            start = datetime.now() - timedelta(minutes=self.random.randint(10, 600))
+            self.call(label, "POST", "/trips", json={
+                "user_id": self.user,
+                "start_date": start.strftime(TRIP_DATE_FORMAT),
+                "end_date": (start + timedelta(minutes=self.random.randint(5, 120))).strftime(TRIP_DATE_FORMAT),
+                "position_dot": self.random.randint(0, 100),
+                "Is_done": True,
+                "distance": self.random.randint(1, 1100),
+            })
+        elif label == "get_relay_points":
+            self.call(label, "GET", "/relay_points", params={"limit": 100})
+        elif label == "nearest_relay_points":
+            self.call(label, "GET", "/relay_points/nearest",
+                      params={"lat": self.random.uniform(43.0, 50.0), "lng": self.random.uniform(-1.5, 7.0), "k": 3})
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            self.step(self.random.choices(self.labels, self.weights)[0])
+
+
+def run_load(base_url, users, threads=16, duration=30.0, mix=None, password=None, seed=42):
+    from workload_gen import DEFAULT_PASSWORD
+
+    recorder = Recorder()
+    started = time.monotonic()
+    workers = [Worker(base_url, users, mix or DEFAULT_MIX, recorder, started + duration,
+                      password or DEFAULT_PASSWORD, seed + i) for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return recorder.report(time.monotonic() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed the database and drive mixed HTTP traffic against the app")
+    parser.add_argument("--base-url", default="http://localhost:5000")
+    parser.add_argument("--seed", action="store_true", help="seed MONGO_URI with users, trips, API keys and relay points first")
+    parser.add_argument("--reset", action="store_true", help="empty the seeded collections before seeding")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--trips", type=int, default=50000)
+    parser.add_argument("--relay-points", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds")
+    parser.add_argument("--mix", default=None, help='JSON weights, e.g. {"get_trips": 3, "post_trip": 1}')
+    parser.add_argument("--random-seed", type=int, default=42)
+    parser.add_argument("--report", default=None, help="JSON report path, printed to stdout otherwise")
+    args = parser.parse_args()
+
+    from Model import get_db
+    db = get_db()
+    if args.seed:
+        users = seed_database(db, args.users, args.trips, args.relay_points, seed=args.random_seed, reset=args.reset)
+    else:
+        documents = list(db.users.find({"email": {"$regex": "^user[0-9]+@example\\.com$"}}, {"_id": 1, "email": 1}))
+        if not documents:
+            parser.error("No generated users in the database, run with --seed first")
+        users = {"user_ids": [str(d["_id"]) for d in documents], "emails": [d["email"] for d in documents]}
+
+    mix = json.loads(args.mix) if args.mix else None
+    report = run_load(args.base_url, users, args.threads, args.duration, mix, seed=args.random_seed)
+    report["parameters"] = {"base_url": args.base_url, "threads": args.threads, "mix": mix or DEFAULT_MIX}
+    for label, summary in report["endpoints"].items():
+        print(f"{label:>22} {summary['requests']:>8} req {summary['throughput_rps']:>9} rps "
+              f"p50 {summary['p50_ms']:>8} ms p95 {summary['p95_ms']:>8} ms p99 {summary['p99_ms']:>8} ms "
+              f"errors {summary['error_rate']:.2%}")
+    output = json.dumps(report, indent=2)
+    if args.report:
+        with open(args.report, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
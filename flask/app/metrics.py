@@ -0,0 +1,135 @@
+import os
+import time
+from flask import request, g
+from pymongo import monitoring
+from prometheus_client import (Counter, Gauge, Histogram, CollectorRegistry, REGISTRY, CONTENT_TYPE_LATEST,
+                               generate_latest)
+from prometheus_client.multiprocess import MultiProcessCollector
+
+# Commands slower than this are printed with their collection and filter fields (never the values)
+MONGO_SLOW_QUERY_MS = float(os.getenv("MONGO_SLOW_QUERY_MS", "100"))
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+PROMETHEUS_CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+# With PROMETHEUS_MULTIPROC_DIR set (gunicorn.conf.py does it), every worker writes its series to files in
+# that directory and a scrape of any worker reports the sum over all of them. The variable must be set
+# before this module is imported.
+
+request_latency = Histogram("http_request_duration_seconds", "Time spent in the view, per endpoint",
+                            ["endpoint", "method", "status"], buckets=REQUEST_BUCKETS)
+mongo_latency = Histogram("mongo_command_duration_seconds", "Mongo command round trips, per collection and operation",
+                          ["collection", "command"], buckets=MONGO_BUCKETS)
+mongo_failures = Counter("mongo_command_failures", "Failed Mongo commands, per collection and operation",
+                         ["collection", "command"])
+mongo_slow = Counter("mongo_slow_commands", f"Mongo commands slower than {MONGO_SLOW_QUERY_MS:g} ms",
+                     ["collection", "command"])
+api_key_cache_hits = Counter("api_key_cache_hits", "API key lookups answered by the cache")
+api_key_cache_misses = Counter("api_key_cache_misses", "API key lookups that went to Mongo")
+api_key_cache_entries = Gauge("api_key_cache_entries", "Keys held in the API key caches of the live workers",
+                              multiprocess_mode="livesum")
+
+
+def _command_collection(command_name, command):
+    # Most commands carry the collection as the value of their own name, getMore has a field for it
+    if command_name == "getMore":
+        return command.get("collection", "")
+    value = command.get(command_name)
+    return value if isinstance(value, str) else ""
+
+
+def _filter_fields(command):
+    # Field names of the query, the values may hold API keys or personal data
+    query = command.get("filter") or command.get("q") or {}
+    if not query and command.get("updates"):
+        query = command["updates"][0].get("q", {})
+    elif not query and command.get("deletes"):
+        query = command["deletes"][0].get("q", {})
+    return sorted(query) if isinstance(query, dict) else []
+
+
+class MongoCommandListener(monitoring.CommandListener):
+    # Times every command from the durations reported by the driver, the collection comes from the started event
+    def __init__(self, slow_query_ms=MONGO_SLOW_QUERY_MS):
+        self.slow_query_ms = slow_query_ms
+        self._pending = {}  # (request_id, connection) -> (collection, filter fields)
+
+    def started(self, event):
+        self._pending[(event.request_id, event.connection_id)] = (
+            _command_collection(event.command_name, event.command),
+            _filter_fields(event.command) if self.slow_query_ms is not None else None,
+        )
+
+    def _finish(self, event, failed):
+        collection, fields = self._pending.pop((event.request_id, event.connection_id), ("", None))
+        labels = (collection, event.command_name)
+        seconds = event.duration_micros / 1e6
+        mongo_latency.labels(*labels).observe(seconds)
+        if failed:
+            mongo_failures.labels(*labels).inc()
+        if self.slow_query_ms is not None and seconds * 1000 >= self.slow_query_ms:
+            mongo_slow.labels(*labels).inc()
+            print(f"Slow Mongo command: {event.command_name} on {event.database_name}.{collection} "
+                  f"took {seconds * 1000:.1f} ms (filter fields: {', '.join(fields or []) or '-'})")
+
+    def succeeded(self, event):
+        self._finish(event, False)
+
+    def failed(self, event):
+        self._finish(event, True)
+
+
+mongo_listener = MongoCommandListener()
+
+
+def init_app(app):
+    # Request timing hooks, the time of streamed bodies after the view returned is not included
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_latency(response):
+        started = g.pop("request_started", None)
+        if started is not None:
+            labels = (request.endpoint or "unmatched", request.method, str(response.status_code))
+            request_latency.labels(*labels).observe(time.perf_counter() - started)
+        return response
+
+
+class ASGITimingMiddleware:
+    # Same histogram for the routes of the ASGI app, the mounted Flask app times its own views
+    # The time runs until the response starts, like the Flask hooks it leaves streamed bodies out
+    def __init__(self, app, endpoints):
+        self.app = app
+        self.endpoints = set(endpoints)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+
+        async def timed_send(message):
+            # The router has put the matched endpoint in the scope by the time the response starts
+            if message["type"] == "http.response.start" and scope.get("endpoint") in self.endpoints:
+                labels = (scope["endpoint"].__name__, scope["method"], str(message["status"]))
+                request_latency.labels(*labels).observe(time.perf_counter() - started)
+            await send(message)
+
+        await self.app(scope, receive, timed_send)
+
+
+def record_api_key_lookup(hit, entries):
+    # Called by both halves of the API after each key check, entries is the size of this worker's cache
+    (api_key_cache_hits if hit else api_key_cache_misses).inc()
+    api_key_cache_entries.set(entries)
+
+
+def render():
+    # Prometheus text format, summed over the workers in multiprocess mode
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
@@ -0,0 +1,100 @@
+import os
+import json
+import fcntl
+import contextlib
+import threading
+from datetime import datetime
+import joblib
+
+MODEL_DIR = os.getenv("MODEL_REGISTRY_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models'))
+MODEL_NAME = 'geographic_relay_points_model'
+
+
+class ModelRegistry:
+    # Versioned model artifacts on disk: <root>/<name>/v0001.pkl ... plus a manifest.json
+    def __init__(self, root=MODEL_DIR, name=MODEL_NAME):
+        self.directory = os.path.join(root, name)
+        self.manifest_path = os.path.join(self.directory, 'manifest.json')
+        self.lock_path = os.path.join(self.directory, '.publish.lock')
+
+    def read_manifest(self):
+        try:
+            with open(self.manifest_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"latest": None, "versions": []}
+
+    def _write_manifest(self, manifest):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def latest_version(self):
+        return self.read_manifest()["latest"]
+
+    @contextlib.contextmanager
+    def _publish_lock(self):
+        # Publishers in other processes (train.py, jobs, online updates) wait for the manifest to be written
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.lock_path, 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def publish(self, artifact, metadata=None):
+        with self._publish_lock():
+            manifest = self.read_manifest()
+            version = (manifest["latest"] or 0) + 1
+            filename = f"v{version:04d}.pkl"
+
+            # The artifact is fully written before the manifest points to it
+            tmp_path = os.path.join(self.directory, filename + '.tmp')
+            joblib.dump(artifact, tmp_path)
+            os.replace(tmp_path, os.path.join(self.directory, filename))
+
+            manifest["versions"].append({
+                "version": version,
+                "file": filename,
+                "created_at": datetime.now().isoformat(timespec='seconds'),
+                "metadata": metadata or {},
+            })
+            manifest["latest"] = version
+            self._write_manifest(manifest)
+        print(f"Model {os.path.basename(self.directory)} version {version} published.")
+        return version
+
+    def info(self, version=None):
+        manifest = self.read_manifest()
+        version = version or manifest["latest"]
+        for entry in manifest["versions"]:
+            if entry["version"] == version:
+                return entry
+        raise FileNotFoundError(f"No model version {version} in {self.directory}")
+
+    def load(self, version=None):
+        entry = self.info(version)
+        return joblib.load(os.path.join(self.directory, entry["file"])), entry
+
+
+_lock = threading.Lock()
+_cached = {}
+
+
+def get_latest_model(registry=None):
+    # Loads the latest artifact once per process and reloads it only when a new version is published
+    registry = registry or ModelRegistry()
+    try:
+        mtime = os.path.getmtime(registry.manifest_path)
+    except FileNotFoundError:
+        raise FileNotFoundError("No trained model published yet, run train.py first")
+
+    with _lock:
+        cached = _cached.get(registry.directory)
+        if cached is None or cached[0] != mtime:
+            artifact, entry = registry.load()
+            cached = (mtime, artifact, entry)
+            _cached[registry.directory] = cached
+        return cached[1], cached[2]
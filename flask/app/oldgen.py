@@ -8,6 +8,8 @@ import requests
 from tqdm import tqdm
 from joblib import Parallel, delayed
 from Model import relay_point
+from spatial_index import SphericalIndex
+from boundary_mask import BoundaryMask
 import json, os
 from  dotenv import load_dotenv
 load_dotenv()
@@ -19,17 +21,6 @@ api_url = 'http://overpass-api.de/api/interpreter?data=[out:json];area[name=%27F
     
 def generate_relay_points() -> bool:
     try:
-        def load_france_boundaries(cache_file_boundaries):
-            try:
-                france_boundaries = joblib.load(cache_file_boundaries)
-                print("Loaded France boundaries from cache.")
-            except (FileNotFoundError, EOFError):
-                print("Cache not found. Loading France boundaries from shapefile.")
-                france_boundaries = gpd.read_file("FRA.zip")
-                joblib.dump(france_boundaries, cache_file_boundaries)
-                print("France boundaries cached.")
-            return france_boundaries
-
         def load_city(cache_file_city, api_url):
             try:
                 city_data = joblib.load(cache_file_city)
@@ -80,11 +71,11 @@ def generate_relay_points() -> bool:
             delivery_data, geometry=gpd.points_from_xy(delivery_data.longitude, delivery_data.latitude))
 
         # Load France boundary shapefile and city data
-        france_boundaries = load_france_boundaries(cache_file_boundaries)
+        boundary_mask = BoundaryMask.load(cache_file_boundaries)
         city_coordonne, city_names = load_city(cache_file_city, api_url)
 
         # Filter delivery points to be within France
-        gdf_deliveries = gdf_deliveries[gdf_deliveries.within(france_boundaries.unary_union)]
+        gdf_deliveries = gdf_deliveries[boundary_mask.contains(gdf_deliveries.latitude.values, gdf_deliveries.longitude.values)]
 
         # Cluster analysis to find optimal relay points
         kmeans = KMeans(n_clusters=150, random_state=42)
@@ -109,10 +100,10 @@ def generate_relay_points() -> bool:
                     fill_opacity=0.6
                 ).add_to(m)
             
-            for idx, row in cluster_centers.iterrows():
-                loca = np.array([row['latitude'], row['longitude']])
-                distances = np.linalg.norm(city_coordonne - loca, axis=1)
-                closest_city_index = np.argmin(distances)
+            # Snap every cluster center to its closest city in one great-circle query
+            city_index = SphericalIndex(city_coordonne)
+            closest_city_indices, _ = city_index.nearest(cluster_centers['latitude'].values, cluster_centers['longitude'].values)
+            for idx, closest_city_index in enumerate(closest_city_indices):
                 closest_city_coords = city_coordonne[closest_city_index]
 
                 if not np.isnan(closest_city_coords).any():
@@ -0,0 +1,137 @@
+import os
+from datetime import datetime, timezone
+import numpy as np
+from bson.objectid import ObjectId
+from Model import get_db
+from distance_engine import get_distance_engine
+from geo_kmeans import as_city_index, snap_to_cities
+from model_registry import ModelRegistry
+from streaming_training import MiniBatchState, minibatch_update, iter_client_batches, DEFAULT_BATCH_SIZE
+
+# Share of the cluster weights kept at each online update, older demand fades out as new orders arrive
+ONLINE_DECAY = float(os.getenv("ONLINE_UPDATE_DECAY", "0.9"))
+# Relative increase of the mean weighted squared distance over the last full training
+MAX_INERTIA_INCREASE = float(os.getenv("ONLINE_MAX_INERTIA_INCREASE", "0.25"))
+# Share of the new purchase weight that the update moved to another relay point
+MAX_REASSIGNED_SHARE = float(os.getenv("ONLINE_MAX_REASSIGNED_SHARE", "0.2"))
+# Drift retrains checkpoint apart from train.py --source mongo runs
+retrain_checkpoint_file = 'online_retrain_checkpoint.pkl'
+
+
+def reference_mean_sq_distance(artifact):
+    # Mean weighted squared distance (km^2) of the last full training, carried over by online updates
+    if artifact.get("reference_mean_sq_km") is not None:
+        return artifact["reference_mean_sq_km"]
+    if artifact.get("inertia") is not None and artifact.get("total_weight"):
+        return artifact["inertia"] / artifact["total_weight"]
+    return None
+
+
+def apply_online_update(artifact, batches, decay=ONLINE_DECAY, engine=None, city_positions=None):
+    # batches: iterable of (positions, purchase_rates) of new or changed clients
+    # Returns (updated artifact or None when there was nothing new, drift metrics)
+    engine = get_distance_engine(engine)
+    state = MiniBatchState(np.array(artifact["centroids"], dtype=np.float64))
+    state.counts = np.asarray(artifact["cluster_weights"], dtype=np.float64) * decay
+
+    new_weight = 0.0
+    reassigned_weight = 0.0
+    sq_distance_sum = 0.0
+    for positions, weights in batches:
+        labels = minibatch_update(state, positions, weights, engine)
+        updated_labels, distances = engine.nearest(positions[:, 0], positions[:, 1], state.centroids[:, 0], state.centroids[:, 1])
+        new_weight += float(weights.sum())
+        reassigned_weight += float(weights[labels != updated_labels].sum())
+        sq_distance_sum += float(np.dot(weights, distances ** 2))
+
+    reference = reference_mean_sq_distance(artifact)
+    drift = {"clients": state.clients_seen, "weight": new_weight, "inertia_increase": 0.0, "reassigned_share": 0.0}
+    if not state.clients_seen:
+        return None, drift
+    mean_sq_distance = sq_distance_sum / new_weight if new_weight > 0 else 0.0
+    if reference:
+        drift["inertia_increase"] = (mean_sq_distance - reference) / reference
+    else:
+        # No inertia recorded for the current model, the new demand becomes the reference
+        reference = mean_sq_distance
+    drift["reassigned_share"] = reassigned_weight / new_weight if new_weight > 0 else 0.0
+
+    centroids = state.centroids
+    city_index = as_city_index(city_positions)
+    if city_index is not None:
+        centroids = snap_to_cities(centroids, city_index)
+    updated = dict(artifact)
+    updated.update({
+        "centroids": centroids,
+        "cluster_weights": state.counts.copy(),
+        "inertia": None,
+        "num_clients": artifact.get("num_clients", 0) + state.clients_seen,
+        "total_weight": float(state.counts.sum()),
+        "reference_mean_sq_km": reference,
+        "online_updates": artifact.get("online_updates", 0) + 1,
+    })
+    return updated, drift
+
+
+def drift_exceeded(drift, max_inertia_increase=MAX_INERTIA_INCREASE, max_reassigned_share=MAX_REASSIGNED_SHARE):
+    # Reason for a full retrain, None when the incremental update can be kept
+    if drift["inertia_increase"] > max_inertia_increase:
+        return f"inertia increased by {drift['inertia_increase']:.1%}"
+    if drift["reassigned_share"] > max_reassigned_share:
+        return f"{drift['reassigned_share']:.1%} of the new demand changed relay point"
+    return None
+
+
+def trip_watermark(artifact, entry):
+    # New trips are the ones inserted after the last consumed trip, or after the model was published
+    if artifact.get("last_trip_id"):
+        return ObjectId(artifact["last_trip_id"])
+    created_at = datetime.fromisoformat(entry["created_at"]).astimezone(timezone.utc)
+    return ObjectId.from_datetime(created_at)
+
+
+def run_online_update(db=None, registry=None, batch_size=DEFAULT_BATCH_SIZE, decay=ONLINE_DECAY,
+                      max_inertia_increase=MAX_INERTIA_INCREASE, max_reassigned_share=MAX_REASSIGNED_SHARE,
+                      city_positions=None, engine=None, retrain=None):
+    # Applies the trips added since the latest model version and publishes the result,
+    # retrain(num_relay_points) -> version is called instead when the drift is over a threshold
+    db = db if db is not None else get_db()
+    registry = registry or ModelRegistry()
+    artifact, entry = registry.load()
+    if not isinstance(artifact, dict):
+        raise ValueError("Online updates need a model published with cluster weights, retrain it first")
+
+    watermark = trip_watermark(artifact, entry)
+    last_seen = {"id": watermark}
+
+    def batches():
+        for positions, weights, last_id in iter_client_batches(db, batch_size, after_id=watermark):
+            last_seen["id"] = last_id
+            yield positions, weights
+
+    updated, drift = apply_online_update(artifact, batches(), decay, engine, city_positions)
+    if updated is None:
+        print("No new client demand since version", entry["version"])
+        return {"action": "none", "version": entry["version"], "drift": drift, "reason": None}
+
+    reason = drift_exceeded(drift, max_inertia_increase, max_reassigned_share)
+    if reason:
+        print(f"Drift over threshold ({reason}), retraining from scratch.")
+        if retrain is None:
+            from streaming_training import train_and_publish_streaming
+            retrain = lambda k: train_and_publish_streaming(k, city_positions=city_positions, engine=engine,
+                                                            checkpoint_path=retrain_checkpoint_file)
+        version = retrain(len(artifact["centroids"]))
+        return {"action": "retrained", "version": version, "drift": drift, "reason": reason}
+
+    updated["last_trip_id"] = str(last_seen["id"])
+    metadata = dict(entry.get("metadata") or {})
+    metadata.update({
+        "online_update_of": entry["version"],
+        "num_clients": updated["num_clients"],
+        "new_clients": drift["clients"],
+        "inertia_increase": drift["inertia_increase"],
+        "reassigned_share": drift["reassigned_share"],
+    })
+    version = registry.publish(updated, metadata)
+    return {"action": "updated", "version": version, "drift": drift, "reason": None}
@@ -0,0 +1,83 @@
+import calendar
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from bson.errors import InvalidId
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+NEXT_PAGE_HEADER = "X-Next-After"
+
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def encode_cursor(next_after):
+    # "<id>" for pages in _id order, "<sort value>.<id>" when read_page returned (sort value, _id):
+    # the value travels with the cursor, the next page never looks up the last document again
+    if not isinstance(next_after, tuple):
+        return str(next_after)
+    value, last_id = next_after
+    if value is None:
+        return f"null.{last_id}"
+    if not isinstance(value, datetime):
+        raise TypeError(f"Cannot page on {type(value).__name__} values")
+    # Mongo dates have millisecond precision, naive values are UTC as returned by pymongo
+    milliseconds = calendar.timegm(value.utctimetuple()) * 1000 + value.microsecond // 1000
+    return f"{milliseconds}.{last_id}"
+
+
+def decode_cursor(cursor):
+    value, separator, last_id = cursor.rpartition(".")
+    try:
+        last_id = ObjectId(last_id)
+        if not separator:
+            return last_id
+        if value == "null":
+            return None, last_id
+        return EPOCH + timedelta(milliseconds=int(value)), last_id
+    except (InvalidId, TypeError, ValueError, OverflowError):
+        raise ValueError("after must be a cursor returned in the X-Next-After header")
+
+
+def parse_page_args(args):
+    # ?after=<cursor>&limit=<n>, raises ValueError with a message meant for the client
+    after = args.get("after")
+    after = decode_cursor(after) if after else None
+
+    try:
+        limit = int(args.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+    return after, min(limit, MAX_PAGE_SIZE)
+
+
+def parse_date_range(args, start_field="start_date", end_field="end_date", field=None):
+    # ?start_date=YYYY-MM-DD&end_date=YYYY-MM-DD, the end date is inclusive
+    # Bounds apply to the start_field/end_field document fields, or both to field when given
+    query = {}
+    try:
+        if args.get(start_field):
+            query.setdefault(field or start_field, {})["$gte"] = datetime.strptime(args[start_field], '%Y-%m-%d')
+        if args.get(end_field):
+            query.setdefault(field or end_field, {})["$lt"] = datetime.strptime(args[end_field], '%Y-%m-%d') + timedelta(days=1)
+    except ValueError:
+        raise ValueError(f"{start_field} and {end_field} must use the YYYY-MM-DD format")
+    return query
+
+
+def serialize(document):
+    # ObjectId values (top level or in lists) become strings so the document can be sent as JSON
+    for key, value in document.items():
+        if isinstance(value, ObjectId):
+            document[key] = str(value)
+        elif isinstance(value, list):
+            document[key] = [str(item) if isinstance(item, ObjectId) else item for item in value]
+    return document
+
+
+def page_response(documents, next_after):
+    # The body stays a plain list, the cursor for the next page goes in a header
+    headers = {NEXT_PAGE_HEADER: encode_cursor(next_after)} if next_after is not None else {}
+    return [serialize(document) for document in documents], headers
@@ -0,0 +1,51 @@
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+
+# Same cost as the Flask-Bcrypt default, existing hashes keep verifying
+BCRYPT_LOG_ROUNDS = int(os.getenv("BCRYPT_LOG_ROUNDS", "12"))
+# bcrypt releases the GIL, so hashes run in parallel on these threads while the pool size caps the CPU they take
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+
+_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+
+
+def get_executor():
+    # One pool per process, a forked worker must not reuse the threads of its parent
+    global _executor, _executor_pid
+    with _lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _hash(password):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(BCRYPT_LOG_ROUNDS)).decode('utf-8')
+
+
+def _check(password_hash, password):
+    try:
+        return bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8'))
+    except ValueError:
+        return False  # not a bcrypt hash
+
+
+def hash_password(password):
+    return get_executor().submit(_hash, password).result()
+
+
+def check_password(password_hash, password):
+    return get_executor().submit(_check, password_hash, password).result()
+
+
+async def hash_password_async(password):
+    return await asyncio.wrap_future(get_executor().submit(_hash, password))
+
+
+async def check_password_async(password_hash, password):
+    return await asyncio.wrap_future(get_executor().submit(_check, password_hash, password))
@@ -0,0 +1,90 @@
+import time
+import threading
+import numpy as np
+
+# How often the active generation is checked, a new relay point set is picked up within this delay
+GENERATION_RECHECK_SECONDS = 5.0
+
+
+def valid_coordinates(lat, lon):
+    # Finite latitudes within [-90, 90] and longitudes within [-180, 180], checked before a tree query
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    return bool(np.all(np.isfinite(lat) & np.isfinite(lon) & (np.abs(lat) <= 90) & (np.abs(lon) <= 180)))
+
+
+class RelayPointSnapshot:
+    # Immutable index over one generation, requests keep using theirs while a new one is built
+    def __init__(self, generation, documents):
+        # sklearn is only imported by processes that serve nearest lookups
+        from spatial_index import SphericalIndex
+
+        self.generation = generation
+        self.ids = np.array([str(document["_id"]) for document in documents], dtype=object)
+        self.names = np.array([document.get("name", "") for document in documents], dtype=object)
+        positions = np.array([document["location"] for document in documents], dtype=np.float64).reshape(-1, 2)
+        self.index = SphericalIndex(positions) if len(positions) else None
+
+    def query(self, lat, lon, k=1):
+        # (row indices, distances in km), both shaped (len(lat), k)
+        if self.index is None:
+            raise LookupError("No relay points available")
+        return self.index.query(lat, lon, k=k)
+
+    def describe(self, row, distance):
+        position = self.index.positions[row]
+        return {
+            "id": self.ids[row],
+            "name": self.names[row],
+            "location": [float(position[0]), float(position[1])],
+            "distance_km": round(float(distance), 3),
+        }
+
+
+class RelayPointIndex:
+    # In-memory great-circle index over the active relay point generation, rebuilt when it changes
+    # Only the first lookup waits for a build, later checks and rebuilds run on a background thread
+    # while lookups keep using the current snapshot
+    def __init__(self, recheck_seconds=GENERATION_RECHECK_SECONDS):
+        self.recheck_seconds = recheck_seconds
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def get(self, db, current_generation):
+        # current_generation: callable reading the active generation, called at most every recheck_seconds
+        snapshot = self._snapshot
+        if snapshot is None:
+            with self._lock:
+                if self._snapshot is None:
+                    self._refresh(db, current_generation)
+                return self._snapshot
+        if time.monotonic() - self._checked_at >= self.recheck_seconds:
+            with self._lock:
+                start = not self._refreshing and time.monotonic() - self._checked_at >= self.recheck_seconds
+                self._refreshing = self._refreshing or start
+            if start:
+                threading.Thread(target=self._refresh_in_background, args=(db, current_generation),
+                                 name="relay-index-refresh", daemon=True).start()
+        return snapshot
+
+    def _refresh(self, db, current_generation):
+        generation = current_generation()
+        if self._snapshot is None or self._snapshot.generation != generation:
+            documents = list(db.relay_points.find({"generation": generation}, {"location": 1, "name": 1}))
+            self._snapshot = RelayPointSnapshot(generation, documents)
+        self._checked_at = time.monotonic()
+
+    def _refresh_in_background(self, db, current_generation):
+        try:
+            self._refresh(db, current_generation)
+        except Exception as e:
+            # Keep serving the current snapshot, the next lookup after recheck_seconds tries again
+            print(f"Could not refresh the relay point index: {e}")
+            self._checked_at = time.monotonic()
+        finally:
+            self._refreshing = False
+
+
+relay_index = RelayPointIndex()
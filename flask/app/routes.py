@@ -1,26 +1,49 @@
-from flask import request, jsonify, abort, send_file
+from flask import request, jsonify, abort, make_response, send_file, Response, stream_with_context
 from app import app, mongo
-from app.Model import User, Trip, API_KEY
+from app.Model import User, Trip, TripRollup, API_KEY, relay_point, DriverPosition
+from app.jobs import job_manager, parse_job_params
+from app.api_key_cache import api_key_cache
+from app.pagination import parse_page_args, parse_date_range, page_response, NEXT_PAGE_HEADER
+from app.export import EXPORTS, export_cursor, iter_ndjson, gzip_chunks
+from app.live_positions import live_positions, position_feed, normalize_positions, stream_positions, LIVE_POSITION_INTERVAL
+from app.tiles import tile_cache, client_layer_version, LAYERS, MAX_ZOOM, CLIENT_MAX_ZOOM
+from app.relay_index import relay_index, valid_coordinates
+from app.passwords import hash_password, check_password
+from app.metrics import render as render_metrics, record_api_key_lookup, PROMETHEUS_CONTENT_TYPE
 from bson.objectid import ObjectId
+from bson.errors import InvalidId
+import json
 from datetime import datetime
-from flask_bcrypt import Bcrypt
 from flask_cors import CORS
-from ml_model import generate_relay_points
-CORS(app)
-bcrypt = Bcrypt(app)
+CORS(app, expose_headers=[NEXT_PAGE_HEADER])
+# Password hashes never leave the API
+USER_PROJECTION = {"password": 0}
+MAX_BULK_TRIPS = 10000
+MAX_NEAREST_POINTS = 10000
+MAX_NEAREST_K = 20
 @app.before_request
 def require_api_key():
-    open_endpoints = ['login', 'register', 'map', 'get_map','relay_points/generate','relay_points']
-    if request.endpoint in open_endpoints:
+    # Endpoint names, not paths. The relay point reads are public, as on the ASGI app, generating them is not
+    open_endpoints = ['login', 'register', 'get_map', 'get_relay_points', 'get_tile', 'metrics']
+    # Client tiles carry client positions and purchase weights, only the relay point tiles are public
+    if request.endpoint in open_endpoints and not (request.endpoint == 'get_tile' and request.args.get('layer') == 'clients'):
         return  # Allow the request for open endpoints
     if 'X-API-KEY' in request.headers:
-        apikey = API_KEY(mongo.db)
-        if apikey.is_api_key_valid(request.headers['X-API-KEY']):
+        key = request.headers['X-API-KEY']
+        valid = api_key_cache.get(key)
+        hit = valid is not None
+        if not hit:
+            # Cache miss, one indexed lookup and the answer is cached until the key's expiry (or the cache TTL)
+            key_data = API_KEY(mongo.db).get_valid_api_key(key)
+            api_key_cache.put(key, key_data["expiration_time"] if key_data else None)
+            valid = key_data is not None
+        record_api_key_lookup(hit, len(api_key_cache))
+        if valid:
             return  # Allow the request if the API key is valid
         else:
-            abort(jsonify({"error": "Unauthorized"}), 401)  # Abort if the API key is invalid
+            abort(make_response(jsonify({"error": "Unauthorized"}), 401))  # Abort if the API key is invalid
     else:
-        abort(jsonify({"error": "Unauthorized"}), 401)  # Abort if the API key is missing
+        abort(make_response(jsonify({"error": "Unauthorized"}), 401))  # Abort if the API key is missing
         
 @app.route('/login', methods=['POST'], endpoint='login')
 def login():
@@ -32,17 +55,30 @@ def login():
     user = User(mongo.db)
     user_data = user.read_one({"email": data["email"]})
     
-    if user_data and bcrypt.check_password_hash(user_data["password"], data["password"]):
+    if user_data and check_password(user_data["password"], data["password"]):
         apikey = API_KEY(mongo.db)
         user_data['_id'] = str(user_data['_id'])
         user_data.pop("password")  # Corrected from user_data.pop["password"]
         # Correctly add API_KEY and message to the user_data dictionary
         user_data["API_KEY"] = apikey.generate_api_key(user_data["_id"])  # Corrected from user_data.append[{"API_KEY": apikey.generate_api_key()}]
+        api_key_cache.invalidate(user_data["API_KEY"])  # Drop a cached "unknown key" answer for the issued key
         user_data["message"] = "User logged in"  # Corrected from user_data.append[{"message": "User logged in"}]
         return jsonify(user_data), 200
     else:
         return jsonify({"error": "Invalid credentials"}), 401
 
+@app.route('/metrics', methods=['GET'], endpoint='metrics')
+def get_metrics():
+    # Prometheus scrape target: request and Mongo latency histograms plus the API key cache counters
+    return Response(render_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.route('/logout', methods=['POST'])
+def logout():
+    key = request.headers['X-API-KEY']
+    API_KEY(mongo.db).revoke_api_key(key)
+    api_key_cache.invalidate(key)
+    return jsonify({"message": "User logged out"}), 200
+
 @app.route('/register', methods=['POST'], endpoint='register')
 def create_user():
     data = request.get_json()
@@ -51,14 +87,15 @@ def create_user():
     if not all(field in data for field in required_fields):
         return jsonify({"error": "Missing fields"}), 400
     
-    hashed_password = bcrypt.generate_password_hash(data["password"]).decode('utf-8')
-    
     user = User(mongo.db)
     #check if email or username already exists
-    if (user.read_one({"email": data["email"]})):
+    if (user.read_one({"email": data["email"]}, {"_id": 1})):
         return jsonify({"error": "Email already exists"}), 400
-    if (user.read_one({"username": data["username"]})):
+    if (user.read_one({"username": data["username"]}, {"_id": 1})):
         return jsonify({"error": "Username already exists"}), 400
+
+    # Hashed on the bounded bcrypt pool, only once the cheap checks passed
+    hashed_password = hash_password(data["password"])
     
     user.create_user(
         email=data["email"],
@@ -73,25 +110,26 @@ def create_user():
 
 @app.route('/users', methods=['GET'])
 def get_users():
+    try:
+        after, limit = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     user = User(mongo.db)
-    users = user.read({})
-    result = []
-    for user in users:
-        user['_id'] = str(user['_id'])
-        result.append(user)
-    return jsonify(result), 200
+    users, next_after = user.read_page({}, after=after, limit=limit, projection=USER_PROJECTION)
+    result, headers = page_response(users, next_after)
+    return jsonify(result), 200, headers
 
 @app.route('/users/<user_id>', methods=['GET'])
 def get_user_by_id(user_id):
     user = User(mongo.db)
-    user = user.read_one({"_id": ObjectId(user_id)})
+    user = user.read_one({"_id": ObjectId(user_id)}, USER_PROJECTION)
     user['_id'] = str(user['_id'])
     return jsonify(user), 200
 
 @app.route('/users/<username>', methods=['GET'])
 def get_user_by_username(username):
     user = User(mongo.db)
-    user = user.read_one({"username": username})
+    user = user.read_one({"username": username}, USER_PROJECTION)
     user['_id'] = str(user['_id'])
     return jsonify(user), 200
 
@@ -119,6 +157,28 @@ def get_map():
     return send_file('relay_points_map.html'), 200
 
 
+@app.route('/export/<name>', methods=['GET'])
+def export_collection(name):
+    # Streams a whole collection as NDJSON straight from the cursor, memory use does not depend on its size
+    if name not in EXPORTS:
+        return jsonify({"error": "Unknown export"}), 404
+    if request.args.get("format", "ndjson") != "ndjson":
+        return jsonify({"error": "Only the ndjson format is supported"}), 400
+    try:
+        cursor = export_cursor(mongo.db, name, request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    chunks = iter_ndjson(cursor)
+    filename = f"{name}.ndjson"
+    mimetype = "application/x-ndjson"
+    if request.args.get("gzip", "").lower() in ("1", "true"):
+        chunks = gzip_chunks(chunks)
+        filename += ".gz"
+        mimetype = "application/gzip"
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+    return Response(stream_with_context(chunks), mimetype=mimetype, headers=headers)
+
 @app.route('/trips', methods=['POST'])
 def create_trip():
     data = request.get_json()
@@ -128,32 +188,72 @@ def create_trip():
         return jsonify({"error": "Missing fields"}), 400
     
     trip = Trip(mongo.db)
-    trip.create_trip(
-        user_id=data["user_id"],
-        start_date=data["start_date"],
-        end_date=data["end_date"],
-        position_dot=data["position_dot"],
-        Is_done=data["Is_done"],
-        distance=data["distance"]
-    )
+    try:
+        trip.create_trip(
+            user_id=data["user_id"],
+            start_date=data["start_date"],
+            end_date=data["end_date"],
+            position_dot=data["position_dot"],
+            Is_done=data["Is_done"],
+            distance=data["distance"],
+            location=data.get("location"),
+            purchase_rate=data.get("purchase_rate")
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     return jsonify({"message": "Trip created"}), 201
 
+@app.route('/trips/bulk', methods=['POST'])
+def create_trips_bulk():
+    # JSON array or NDJSON (one trip per line), invalid records are reported without failing the batch
+    # NDJSON errors are reported by line number (from 1), JSON array errors by index in the array
+    parse_errors = []
+    lines = None
+    if request.mimetype == 'application/x-ndjson':
+        records = []
+        lines = []
+        for number, line in enumerate(request.get_data(as_text=True).splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                records.append(json.loads(line))
+                lines.append(number)
+            except ValueError:
+                parse_errors.append({"line": number, "error": "Invalid JSON"})
+    else:
+        records = request.get_json(silent=True)
+        if not isinstance(records, list):
+            return jsonify({"error": "Expected a JSON array of trips"}), 400
+
+    if len(records) > MAX_BULK_TRIPS:
+        return jsonify({"error": f"At most {MAX_BULK_TRIPS} trips per request"}), 413
+
+    trip = Trip(mongo.db)
+    inserted, errors = trip.create_trips_bulk(records)
+    if lines is not None:
+        errors = [{"line": lines[error["index"]], "error": error["error"]} for error in errors]
+    status = 201 if not errors and not parse_errors else 207
+    return jsonify({"inserted": inserted, "errors": errors, "parse_errors": parse_errors}), status
+
 @app.route('/trips/<user_id>', methods=['GET'])
 def get_trips(user_id):
+    try:
+        user_id = ObjectId(user_id)
+    except InvalidId:
+        return jsonify({"error": "invalid user id"}), 404
     trip = Trip(mongo.db)
     user = User(mongo.db)
-    if user.read_one({"_id": ObjectId(user_id)}):
-        trips = trip.read({})
-
-        result = []
-        for trip in trips:
-            # Convert ObjectId to string for JSON serialization
-            trip["_id"] = str(trip['_id'])
-            trip["user_id"] = str(trip["user_id"])
-            # If there are other ObjectId fields, convert them to strings as well
-            # Example: trip['user_id'] = str(trip['user_id'])
-            result.append(trip)
-        return jsonify(result), 200
+    if user.read_one({"_id": user_id}, {"_id": 1}):
+        try:
+            after, limit = parse_page_args(request.args)
+            query = parse_date_range(request.args)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        query["user_id"] = user_id
+        # Served by the (user_id, start_date, _id) index, in chronological order
+        trips, next_after = trip.read_page(query, after=after, limit=limit, sort_field="start_date")
+        result, headers = page_response(trips, next_after)
+        return jsonify(result), 200, headers
     else:
         return jsonify({"error": "invalid user id"}), 404
 
@@ -169,27 +269,188 @@ def update_trip(trip_id):
         update_data['start_date'] = datetime.strptime(update_data['start_date'], '%Y-%m-%d')
     if 'end_date' in update_data:
         update_data['end_date'] = datetime.strptime(update_data['end_date'], '%Y-%m-%d')
-    trip.update({"_id": ObjectId(trip_id)}, update_data)
+    trip.update_trip(trip_id, update_data)
     return jsonify({"message": "Trip updated"}), 200
 @app.route('/trips/<trip_id>', methods=['DELETE'])
 def delete_trip(trip_id):
     trip = Trip(mongo.db)
-    trip.delete({"_id": ObjectId(trip_id)})
+    trip.delete_trip(trip_id)
     return jsonify({"message": "Trip deleted"}), 200
 
+@app.route('/drivers/position', methods=['POST'])
+def push_driver_position():
+    # One position or a list of positions: {"driver_id", "latitude", "longitude"[, "timestamp"]}
+    data = request.get_json(silent=True)
+    positions = data if isinstance(data, list) else [data]
+    required_fields = ["driver_id", "latitude", "longitude"]
+    if not all(isinstance(p, dict) and all(field in p for field in required_fields) for p in positions):
+        return jsonify({"error": "Missing fields"}), 400
+    try:
+        positions = normalize_positions(positions)
+    except (TypeError, ValueError):
+        return jsonify({"error": "latitude and longitude must be numbers"}), 400
+    # Stored for the viewers of the other workers, merged right away for the viewers of this one
+    DriverPosition(mongo.db).upsert_positions(positions)
+    live_positions.merge(positions)
+    return jsonify({"message": "Position updated"}), 202
+
+def follow_driver_positions():
+    position_feed.start(DriverPosition(mongo.db).received_since)
+
+@app.route('/drivers', methods=['GET'], endpoint='get_drivers')
+def get_drivers():
+    follow_driver_positions()
+    version, positions = live_positions.snapshot()
+    return jsonify(positions), 200
+
+@app.route('/drivers/stream', methods=['GET'], endpoint='stream_drivers')
+def stream_drivers():
+    # Every viewer reads the same in-memory state, one feed per worker polls Mongo for all of them
+    # Each viewer holds a server thread here, the ASGI app (app.asgi) serves this path on its event loop
+    follow_driver_positions()
+    interval = request.args.get("interval", LIVE_POSITION_INTERVAL, type=float)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_positions(live_positions, interval), mimetype="text/event-stream", headers=headers)
+
+@app.route('/tiles/<int:z>/<int:x>/<int:y>', methods=['GET'], endpoint='get_tile')
+def get_tile(z, x, y):
+    # Pre-clustered points of one map tile: [[lat, lng, count, weight], ...]
+    layer = request.args.get("layer", "relay_points")
+    if layer not in LAYERS:
+        return jsonify({"error": "Unknown layer"}), 404
+    if not 0 <= z <= MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return jsonify({"error": "Invalid tile"}), 400
+    if layer == "clients" and z > CLIENT_MAX_ZOOM:
+        return jsonify({"error": f"The clients layer stops at zoom {CLIENT_MAX_ZOOM}"}), 400
+
+    generation = relay_point(mongo.db).current_generation()
+    # Client tiles follow the trips, not the relay point generation
+    version = client_layer_version.get(mongo.db) if layer == "clients" else generation
+    etag = f'"{layer}-{version}-{z}-{x}-{y}"'
+    if request.headers.get("If-None-Match") == etag:
+        return "", 304
+    clusters = tile_cache.get_tile(layer, version, z, x, y, lambda: LAYERS[layer](mongo.db, version))
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=60" if layer == "clients" else "public, max-age=60"}
+    return jsonify({"z": z, "x": x, "y": y, "generation": generation, "clusters": clusters}), 200, headers
+
+@app.route('/analytics/daily', methods=['GET'])
+def get_daily_analytics():
+    # Totals of all users per day
+    try:
+        day_query = parse_date_range(request.args, field="day").get("day")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(TripRollup(mongo.db).daily(None, day_query)), 200
+
+@app.route('/analytics/users/<user_id>/daily', methods=['GET'])
+def get_user_daily_analytics(user_id):
+    try:
+        day_query = parse_date_range(request.args, field="day").get("day")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(TripRollup(mongo.db).daily(ObjectId(user_id), day_query)), 200
+
+@app.route('/analytics/users/<user_id>/summary', methods=['GET'])
+def get_user_analytics_summary(user_id):
+    # Sum of the user's daily rollups over the requested range
+    try:
+        day_query = parse_date_range(request.args, field="day").get("day")
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    days = TripRollup(mongo.db).daily(ObjectId(user_id), day_query)
+    summary = {field: sum(day[field] for day in days) for field in ["distance", "trips", "done", "duration_seconds"]}
+    summary["days"] = len(days)
+    summary["average_duration_seconds"] = summary["duration_seconds"] / summary["trips"] if summary["trips"] else 0
+    return jsonify(summary), 200
+
 @app.route('/relay_points', methods=['GET'])
 def get_relay_points():
-    relay_points = mongo.db.relay_points.find({})
-    result = []
-    for point in relay_points:
-        point['_id'] = str(point['_id'])
-        result.append(point)
-    return jsonify(result), 200
+    try:
+        after, limit = parse_page_args(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    # Only the active generation, a new set becomes visible once it is fully written
+    relay = relay_point(mongo.db)
+    relay_points, next_after = relay.read_page({"generation": relay.current_generation()}, after=after, limit=limit)
+    result, headers = page_response(relay_points, next_after)
+    return jsonify(result), 200, headers
+
+@app.route('/relay_points/nearest', methods=['GET'])
+def get_nearest_relay_points():
+    # ?lat=&lng=&k= -> the k closest relay points of the active generation
+    lat = request.args.get("lat", type=float)
+    lng = request.args.get("lng", type=float)
+    k = request.args.get("k", 1, type=int)
+    if lat is None or lng is None or not 1 <= k <= MAX_NEAREST_K:
+        return jsonify({"error": f"lat and lng are required, k must be between 1 and {MAX_NEAREST_K}"}), 400
+    if not valid_coordinates(lat, lng):
+        return jsonify({"error": "lat must be within [-90, 90] and lng within [-180, 180]"}), 400
+
+    relay = relay_point(mongo.db)
+    snapshot = relay_index.get(mongo.db, relay.current_generation)
+    try:
+        rows, distances = snapshot.query([lat], [lng], k=k)
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    results = [snapshot.describe(row, distance) for row, distance in zip(rows[0], distances[0])]
+    return jsonify({"generation": snapshot.generation, "results": results}), 200
+
+@app.route('/relay_points/nearest', methods=['POST'])
+def post_nearest_relay_points():
+    # {"points": [[lat, lng], ...], "k": 1} -> relay point ids and distances for every point, in one call
+    data = request.get_json(silent=True) or {}
+    points = data.get("points")
+    k = data.get("k", 1)
+    if not isinstance(points, list) or not isinstance(k, int) or not 1 <= k <= MAX_NEAREST_K:
+        return jsonify({"error": f"points must be a list of [lat, lng], k must be between 1 and {MAX_NEAREST_K}"}), 400
+    if len(points) > MAX_NEAREST_POINTS:
+        return jsonify({"error": f"At most {MAX_NEAREST_POINTS} points per request"}), 413
+    try:
+        lat = [float(point[0]) for point in points]
+        lng = [float(point[1]) for point in points]
+    except (TypeError, ValueError, IndexError):
+        return jsonify({"error": "points must be a list of [lat, lng]"}), 400
+    if not valid_coordinates(lat, lng):
+        return jsonify({"error": "Every lat must be within [-90, 90] and every lng within [-180, 180]"}), 400
+
+    relay = relay_point(mongo.db)
+    snapshot = relay_index.get(mongo.db, relay.current_generation)
+    try:
+        rows, distances = snapshot.query(lat, lng, k=k)
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
+    return jsonify({
+        "generation": snapshot.generation,
+        "ids": snapshot.ids[rows].tolist(),
+        "distances_km": distances.round(3).tolist(),
+    }), 200
 
 @app.route('/relay_points/generate', methods=['POST'])
 def generate_relay():
-    relay_points = generate_relay_points()
-    if relay_points:
-        return jsonify({"message": "Relay points generated"}), 200
-    else:
-        return jsonify({"error": "Error generating relay points"}), 500
\ No newline at end of file
+    # Generation runs in a background process, the client polls /relay_points/jobs/<job_id>
+    data = request.get_json(silent=True)
+    try:
+        params = parse_job_params(data if isinstance(data, dict) else {})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    job_id, coalesced = job_manager.submit(mongo.db, params)
+    return jsonify({"job_id": job_id, "coalesced": coalesced, "message": "Relay point generation started"}), 202
+
+@app.route('/relay_points/jobs/<job_id>', methods=['GET'])
+def get_relay_job(job_id):
+    status = job_manager.status(mongo.db, job_id)
+    if status is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(status), 200
+
+@app.route('/relay_points/jobs/<job_id>/result', methods=['GET'])
+def get_relay_job_result(job_id):
+    status, result = job_manager.result(mongo.db, job_id)
+    if status is None:
+        return jsonify({"error": "Job not found"}), 404
+    if status["status"] == "failed":
+        return jsonify({"error": status["error"]}), 500
+    if result is None:
+        return jsonify(status), 202
+    return jsonify(result), 200
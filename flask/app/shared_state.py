@@ -0,0 +1,66 @@
+import gc
+import os
+import time
+import threading
+from model_registry import ModelRegistry, get_latest_model
+from city_data import load_city_table
+from spatial_index import get_city_index
+from boundary_mask import get_boundary_mask
+
+# How often the serving master checks the registry for a new model version
+MODEL_RELOAD_INTERVAL = float(os.getenv("MODEL_RELOAD_INTERVAL", "30"))
+PRELOAD_BOUNDARY = os.getenv("PRELOAD_BOUNDARY", "1") == "1"
+
+
+def preload(boundary=PRELOAD_BOUNDARY):
+    # Loads the read-only ML state into the per-process caches, called in the server master before it forks:
+    # the workers find it loaded and share its pages copy-on-write. The relay point job processes start
+    # from a forkserver (or spawn), not from the workers, and load their own copy on first use
+    # State frozen by a previous call becomes collectable again once replaced
+    gc.unfreeze()
+    summary = {}
+    table = load_city_table()
+    table.names  # decoded once here instead of in every worker
+    summary["cities"] = len(table)
+    get_city_index()  # the ball tree used to name relay points
+    try:
+        artifact, entry = get_latest_model()
+        summary["model_version"] = entry["version"]
+    except FileNotFoundError:
+        summary["model_version"] = None
+    if boundary:
+        try:
+            get_boundary_mask()
+            summary["boundary"] = True
+        except Exception as e:
+            print(f"France boundary not preloaded ({e}), workers will load it on first use.")
+            summary["boundary"] = False
+
+    # Objects alive now are left out of the garbage collector, whose passes would otherwise write
+    # to (and copy) their pages in every worker
+    gc.collect()
+    gc.freeze()
+    print("Preloaded serving state:", summary)
+    return summary
+
+
+def watch_registry(on_new_version, interval=MODEL_RELOAD_INTERVAL, registry=None):
+    # Daemon thread calling on_new_version(version) whenever a new model version is published
+    registry = registry or ModelRegistry()
+    state = {"version": registry.latest_version()}
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                latest = registry.latest_version()
+            except (OSError, ValueError) as e:
+                print(f"Could not read the model registry: {e}")
+                continue
+            if latest is not None and latest != state["version"]:
+                state["version"] = latest
+                on_new_version(latest)
+
+    thread = threading.Thread(target=run, name="model-registry-watcher", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,130 @@
+import os
+import threading
+import numpy as np
+import joblib
+from sklearn.neighbors import BallTree
+from distance_engine import EARTH_RADIUS_KM
+from city_data import CITY_CSV, load_city_table
+
+cache_file_city_index = 'city_index_cache.pkl'
+
+
+class SphericalIndex:
+    # Ball tree on the unit sphere, queried by true great-circle distance
+    def __init__(self, positions, leaf_size=40):
+        self.positions = np.asarray(positions, dtype=np.float64).reshape(-1, 2)
+        self.tree = BallTree(np.radians(self.positions), leaf_size=leaf_size, metric='haversine')
+
+    def __len__(self):
+        return len(self.positions)
+
+    def query(self, lat, lon, k=1):
+        # Batch lookup of the k nearest points, returns (indices, distances in km) shaped (n, k)
+        points = np.radians(np.column_stack((np.atleast_1d(lat), np.atleast_1d(lon))).astype(np.float64))
+        k = min(k, len(self.positions))
+        distances, indices = self.tree.query(points, k=k)
+        return indices, distances * EARTH_RADIUS_KM
+
+    def nearest(self, lat, lon):
+        indices, distances = self.query(lat, lon, k=1)
+        return indices[:, 0], distances[:, 0]
+
+    def within(self, lat, lon, radius_km):
+        # Indices of all points within radius_km of each query point
+        points = np.radians(np.column_stack((np.atleast_1d(lat), np.atleast_1d(lon))).astype(np.float64))
+        return self.tree.query_radius(points, r=radius_km / EARTH_RADIUS_KM)
+
+
+class CityIndex(SphericalIndex):
+    # Cities of the compiled city table with their names, the tree is pickled next to the table
+    # Rows are the table's rows, department and region lookups go through the table
+    def __init__(self, positions, names=None, checksum=None, leaf_size=40):
+        super().__init__(positions, leaf_size=leaf_size)
+        self.names = np.asarray(names if names is not None else [''] * len(self.positions), dtype=object)
+        self.checksum = checksum
+        self.table = None
+        self._subsets = {}
+        self._subsets_lock = threading.Lock()
+
+    @classmethod
+    def from_table(cls, table):
+        index = cls(table.positions, names=table.names, checksum=table.checksum)
+        index.table = table
+        return index
+
+    def __getstate__(self):
+        # The table is memory-mapped and the subsets are cheap to rebuild, neither is pickled
+        state = self.__dict__.copy()
+        state.update(table=None, _subsets={}, _subsets_lock=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._subsets_lock = threading.Lock()
+
+    def subset(self, department=None, region=None):
+        # (index over the cities of a department and/or region, their rows in this index), built on first use
+        key = (None if department is None else str(department), region)
+        with self._subsets_lock:
+            subset = self._subsets.get(key)
+            if subset is None:
+                if self.table is None:
+                    raise LookupError("City index without its table, load it with get_city_index()")
+                rows = self.table.rows(department=department, region=region)
+                if len(rows) == 0:
+                    raise LookupError(f"No city for department={department!r} region={region!r}")
+                subset = self._subsets[key] = (SphericalIndex(self.positions[rows]), rows)
+            return subset
+
+    def query(self, lat, lon, k=1, department=None, region=None):
+        # Same as SphericalIndex.query, restricted to a department and/or region when given
+        if department is None and region is None:
+            return super().query(lat, lon, k=k)
+        index, rows = self.subset(department, region)
+        indices, distances = index.query(lat, lon, k=k)
+        return rows[indices], distances
+
+    def nearest(self, lat, lon, department=None, region=None):
+        indices, distances = self.query(lat, lon, k=1, department=department, region=region)
+        return indices[:, 0], distances[:, 0]
+
+    @classmethod
+    def from_csv(cls, csv_path=CITY_CSV):
+        return cls.from_table(load_city_table(csv_path))
+
+    def save(self, cache_file):
+        joblib.dump(self, cache_file)
+
+    @classmethod
+    def load_or_build(cls, csv_path=CITY_CSV):
+        # The pickle lives in the table's directory, which is named after the CSV checksum and removed
+        # when the CSV changes, so an index of a previous CSV is never loaded
+        table = load_city_table(csv_path)
+        cache_file = os.path.join(table.directory, cache_file_city_index)
+        try:
+            index = joblib.load(cache_file)
+            if index.checksum == table.checksum:
+                index.table = table
+                return index
+        except (FileNotFoundError, EOFError):
+            pass
+        index = cls.from_table(table)
+        tmp_path = f'{cache_file}.{os.getpid()}.tmp'
+        index.save(tmp_path)
+        os.replace(tmp_path, cache_file)
+        print(f"City index of {len(index)} cities cached in {cache_file}.")
+        return index
+
+
+_lock = threading.Lock()
+_indexes = {}
+
+
+def get_city_index(csv_path=CITY_CSV):
+    # Per process, rebuilt or reloaded when the CSV checksum changes
+    with _lock:
+        table = load_city_table(csv_path)
+        index = _indexes.get(csv_path)
+        if index is None or index.checksum != table.checksum:
+            index = _indexes[csv_path] = CityIndex.load_or_build(csv_path)
+        return index
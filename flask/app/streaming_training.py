@@ -0,0 +1,151 @@
+import os
+import numpy as np
+import joblib
+from Model import get_db
+from distance_engine import get_distance_engine
+from geo_kmeans import kmeans_plus_plus, as_city_index, snap_to_cities
+from model_registry import ModelRegistry
+
+# Fields read from the trip collection: location is [lat, lng], purchase_rate defaults to 1
+POSITION_FIELD = "location"
+WEIGHT_FIELD = "purchase_rate"
+DEFAULT_BATCH_SIZE = 10000
+checkpoint_file = 'streaming_relay_points_checkpoint.pkl'
+
+
+class MiniBatchState:
+    def __init__(self, centroids, seed=None, num_relay_points=None, query=None):
+        self.centroids = np.asarray(centroids, dtype=np.float64)
+        self.counts = np.zeros(len(self.centroids), dtype=np.float64)  # purchase weight absorbed per centroid
+        self.last_id = None  # _id of the last trip consumed, used to resume the cursor
+        self.epoch = 0
+        self.batches = 0
+        self.clients_seen = 0
+        self.seed = seed
+        # Requested run, a checkpoint only resumes the same one
+        self.num_relay_points = num_relay_points
+        self.query = dict(query or {})
+
+    def save(self, path):
+        # Write to a temporary file first so a crash never leaves a truncated checkpoint
+        tmp_path = path + '.tmp'
+        joblib.dump(self, tmp_path)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def load(path, num_relay_points, query=None):
+        try:
+            state = joblib.load(path)
+        except (FileNotFoundError, EOFError):
+            return None
+        run = (getattr(state, "num_relay_points", None), getattr(state, "query", None))
+        if run != (num_relay_points, dict(query or {})):
+            raise ValueError(f"Checkpoint {path} belongs to another run (relay points {run[0]}, query {run[1]}), "
+                             f"remove it or pass another checkpoint path")
+        print(f"Resuming from checkpoint {path} (epoch {state.epoch}, {state.batches} batches).")
+        return state
+
+
+def iter_client_batches(db, batch_size=DEFAULT_BATCH_SIZE, after_id=None, query=None):
+    # Reads the trip collection in _id order and yields fixed-size numpy batches
+    query = dict(query or {})
+    query[POSITION_FIELD] = {"$exists": True}
+    if after_id is not None:
+        query["_id"] = {"$gt": after_id}
+    cursor = db.trip.find(query, {POSITION_FIELD: 1, WEIGHT_FIELD: 1}).sort("_id", 1).batch_size(batch_size)
+
+    positions = np.empty((batch_size, 2), dtype=np.float64)
+    weights = np.empty(batch_size, dtype=np.float64)
+    size = 0
+    last_id = after_id
+    for doc in cursor:
+        last_id = doc["_id"]
+        location = doc.get(POSITION_FIELD)
+        if not location or len(location) != 2:
+            continue
+        positions[size] = location
+        weights[size] = doc.get(WEIGHT_FIELD, 1.0)
+        size += 1
+        if size == batch_size:
+            yield positions, weights, last_id
+            size = 0
+    if size:
+        yield positions[:size], weights[:size], last_id
+
+
+def minibatch_update(state, positions, weights, engine):
+    # Per-centroid learning rate batch_weight / total_weight (weighted mini-batch k-means)
+    # Returns the labels of the batch against the centroids before the update
+    k = len(state.centroids)
+    labels, _ = engine.nearest(positions[:, 0], positions[:, 1], state.centroids[:, 0], state.centroids[:, 1])
+    batch_weights = np.bincount(labels, weights=weights, minlength=k)
+    sum_lat = np.bincount(labels, weights=weights * positions[:, 0], minlength=k)
+    sum_lon = np.bincount(labels, weights=weights * positions[:, 1], minlength=k)
+
+    filled = batch_weights > 0
+    state.counts[filled] += batch_weights[filled]
+    eta = batch_weights[filled] / state.counts[filled]
+    state.centroids[filled, 0] += eta * (sum_lat[filled] / batch_weights[filled] - state.centroids[filled, 0])
+    state.centroids[filled, 1] += eta * (sum_lon[filled] / batch_weights[filled] - state.centroids[filled, 1])
+    state.batches += 1
+    state.clients_seen += len(positions)
+    return labels
+
+
+def train_streaming(num_relay_points, db=None, batch_size=DEFAULT_BATCH_SIZE, epochs=1,
+                    checkpoint_path=checkpoint_file, checkpoint_every=10, city_positions=None,
+                    seed=None, engine=None, query=None):
+    db = db if db is not None else get_db()
+    engine = get_distance_engine(engine)
+    state = MiniBatchState.load(checkpoint_path, num_relay_points, query) if checkpoint_path else None
+
+    while state is None or state.epoch < epochs:
+        for positions, weights, last_id in iter_client_batches(db, batch_size, state.last_id if state else None, query):
+            if state is None:
+                # Seed the centroids from the first batch
+                rng = np.random.default_rng(seed)
+                centroids = kmeans_plus_plus(positions, weights, min(num_relay_points, len(positions)), rng)
+                state = MiniBatchState(centroids, seed, num_relay_points, query)
+            minibatch_update(state, positions, weights, engine)
+            state.last_id = last_id
+            if checkpoint_path and state.batches % checkpoint_every == 0:
+                state.save(checkpoint_path)
+
+        if state is None:
+            raise ValueError(f"No trip with a '{POSITION_FIELD}' field to train on, send it with the trips (POST /trips, /trips/bulk)")
+        state.epoch += 1
+        state.last_id = None
+        if checkpoint_path:
+            state.save(checkpoint_path)
+        print(f"Epoch {state.epoch}/{epochs} done, {state.clients_seen} clients seen.")
+
+    centroids = state.centroids.copy()
+    city_index = as_city_index(city_positions)
+    if city_index is not None:
+        centroids = snap_to_cities(centroids, city_index)
+    return centroids, state
+
+
+def train_and_publish_streaming(num_relay_points, city_positions=None, checkpoint_path=checkpoint_file, **kwargs):
+    centroids, state = train_streaming(num_relay_points, city_positions=city_positions,
+                                       checkpoint_path=checkpoint_path, **kwargs)
+    artifact = {
+        "centroids": centroids,
+        "cluster_weights": state.counts.copy(),
+        "inertia": None,
+        "iterations": state.batches,
+        "num_clients": state.clients_seen,
+        "total_weight": float(state.counts.sum()),
+    }
+    metadata = {
+        "source": "mongo",
+        "num_relay_points": len(centroids),
+        "batches": state.batches,
+        "epochs": state.epoch,
+        "num_clients": state.clients_seen,
+    }
+    version = ModelRegistry().publish(artifact, metadata)
+    # The run is finished, the next one must not resume from it
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return version
@@ -0,0 +1,62 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from geo_kmeans import weighted_geographic_kmeans, as_city_index
+
+
+def sweep_report(k, result, purchase_rates):
+    total_weight = purchase_rates.sum()
+    return {
+        "k": k,
+        "inertia": result.inertia,
+        "iterations": result.iterations,
+        "converged": result.converged,
+        "mean_weighted_distance_km": float(np.dot(purchase_rates, result.distances) / total_weight),
+        "max_distance_km": float(result.distances.max()),
+    }
+
+
+def sweep_chain(client_positions, purchase_rates, city_positions, k_values, max_iterations=100,
+                seed=None, engine=None):
+    # Runs k_values in ascending order, each k starts from the centroids found for the previous one
+    city_index = as_city_index(city_positions)
+    reports = []
+    previous = None
+    for k in sorted(k_values):
+        result = weighted_geographic_kmeans(client_positions, purchase_rates, city_index, k,
+                                            max_iterations=max_iterations, seed=seed, engine=engine,
+                                            init_centroids=previous)
+        reports.append(sweep_report(k, result, purchase_rates))
+        previous = result.centroids
+        print(f"k={k}: inertia {result.inertia:.2f}, max distance {reports[-1]['max_distance_km']:.2f} km")
+    return reports
+
+
+def sweep_relay_points(client_positions, purchase_rates, city_positions, k_values, workers=None,
+                       max_iterations=100, seed=None, engine="cpu"):
+    # The k range is split in contiguous chains, one per CPU core, warm starts happen inside a chain
+    client_positions = np.asarray(client_positions, dtype=np.float64)
+    purchase_rates = np.asarray(purchase_rates, dtype=np.float64)
+    k_values = sorted(set(int(k) for k in k_values))
+    workers = max(1, min(workers or os.cpu_count() or 1, len(k_values)))
+    chains = [list(chain) for chain in np.array_split(k_values, workers) if len(chain)]
+
+    if workers == 1:
+        reports = sweep_chain(client_positions, purchase_rates, city_positions, k_values, max_iterations, seed, engine)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [
+                executor.submit(sweep_chain, client_positions, purchase_rates, city_positions, chain,
+                                max_iterations, seed, engine)
+                for chain in chains
+            ]
+            reports = [report for future in futures for report in future.result()]
+    return sorted(reports, key=lambda report: report["k"])
+
+
+def recommend_k(reports, target_distance_km, metric="max_distance_km"):
+    # Smallest k whose distance metric is within the target service distance, None if no k reaches it
+    for report in sorted(reports, key=lambda report: report["k"]):
+        if report[metric] <= target_distance_km:
+            return report["k"]
+    return None
@@ -0,0 +1,154 @@
+import math
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+MAX_ZOOM = 18
+# Each tile is split into TILE_GRID x TILE_GRID cells, the points of a cell form one cluster
+TILE_GRID = 64
+# Zoom levels kept in memory per layer
+MAX_CACHED_ZOOMS = 24
+MAX_LATITUDE = 85.05112878
+# Client positions are not served finer than the cells of this zoom (about 400 m over France)
+CLIENT_MAX_ZOOM = 10
+# How often the trip collection is checked for changes of the client layer
+CLIENT_LAYER_RECHECK_SECONDS = 60.0
+
+
+def tile_coordinates(lat, lon, z):
+    # Web Mercator position in tile units at zoom z
+    n = 2 ** z
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -MAX_LATITUDE, MAX_LATITUDE)
+    lon = np.asarray(lon, dtype=np.float64)
+    x = (lon + 180.0) / 360.0 * n
+    lat_rad = np.radians(lat)
+    y = (1.0 - np.log(np.tan(lat_rad) + 1.0 / np.cos(lat_rad)) / math.pi) / 2.0 * n
+    return np.clip(x, 0, n - 1e-9), np.clip(y, 0, n - 1e-9)
+
+
+def build_zoom_clusters(lat, lon, weights, z, grid=TILE_GRID):
+    # One vectorized pass: every point gets a cell key, cells are aggregated with bincount
+    # Returns {(x, y): [[lat, lng, count, weight], ...]}
+    if len(lat) == 0:
+        return {}
+    n = 2 ** z
+    fx, fy = tile_coordinates(lat, lon, z)
+    tx = fx.astype(np.int64)
+    ty = fy.astype(np.int64)
+    cx = ((fx - tx) * grid).astype(np.int64)
+    cy = ((fy - ty) * grid).astype(np.int64)
+    tile_key = tx * n + ty
+    cell_key = tile_key * (grid * grid) + cx * grid + cy
+
+    cells, inverse = np.unique(cell_key, return_inverse=True)
+    counts = np.bincount(inverse)
+    cluster_weights = np.bincount(inverse, weights=weights)
+    cluster_lat = np.bincount(inverse, weights=lat) / counts
+    cluster_lon = np.bincount(inverse, weights=lon) / counts
+
+    # Cells are sorted by key, so the cells of a tile are contiguous
+    cell_tiles = cells // (grid * grid)
+    starts = np.flatnonzero(np.r_[True, cell_tiles[1:] != cell_tiles[:-1]])
+    ends = np.r_[starts[1:], len(cells)]
+    clusters = np.column_stack((np.round(cluster_lat, 5), np.round(cluster_lon, 5), counts, np.round(cluster_weights, 2)))
+    tiles = {}
+    for start, end in zip(starts, ends):
+        key = int(cell_tiles[start])
+        tiles[(key // n, key % n)] = clusters[start:end].tolist()
+    return tiles
+
+
+class TileCache:
+    # Clusters per (layer, version, zoom), built on the first request for that zoom
+    # The version is the relay point generation, or the client layer version below
+    def __init__(self, max_zooms=MAX_CACHED_ZOOMS):
+        self.max_zooms = max_zooms
+        self._zooms = OrderedDict()
+        self._points = {}
+        self._loading = {}  # (layer, version) -> lock held while its points are loaded or a zoom is built
+        self._lock = threading.Lock()
+
+    def get_tile(self, layer, version, z, x, y, load_points):
+        # load_points() -> (lat, lon, weights), only called once per layer and version
+        key = (layer, version, z)
+        with self._lock:
+            tiles = self._zooms.get(key)
+            if tiles is not None:
+                self._zooms.move_to_end(key)
+                return tiles.get((x, y), [])
+            loading = self._loading.setdefault((layer, version), threading.Lock())
+
+        # Loading and clustering happen outside the cache lock, cached zooms are served meanwhile
+        # and concurrent requests for the same layer version wait for a single load
+        with loading:
+            with self._lock:
+                tiles = self._zooms.get(key)
+                points = self._points.get((layer, version))
+            if tiles is None:
+                if points is None:
+                    points = load_points()
+                tiles = build_zoom_clusters(*points, z)
+                with self._lock:
+                    if (layer, version) not in self._points:
+                        # A new version replaces the previous points of the layer
+                        self._points = {k: v for k, v in self._points.items() if k[0] != layer}
+                        self._loading = {k: v for k, v in self._loading.items() if k[0] != layer or k[1] == version}
+                        for stale in [k for k in self._zooms if k[0] == layer and k[1] != version]:
+                            del self._zooms[stale]
+                        self._points[(layer, version)] = points
+                    self._zooms[key] = tiles
+                    while len(self._zooms) > self.max_zooms:
+                        self._zooms.popitem(last=False)
+        return tiles.get((x, y), [])
+
+
+class ClientLayerVersion:
+    # Trip count and newest trip _id, so added and deleted trips show up in the client layer
+    # Read at most every recheck_seconds, tile requests in between reuse the last value
+    def __init__(self, recheck_seconds=CLIENT_LAYER_RECHECK_SECONDS):
+        self.recheck_seconds = recheck_seconds
+        self._version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self, db):
+        with self._lock:
+            if self._version is not None and time.monotonic() - self._checked_at < self.recheck_seconds:
+                return self._version
+        newest = db.trip.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+        version = f"{db.trip.estimated_document_count()}-{newest['_id'] if newest else ''}"
+        with self._lock:
+            self._version = version
+            self._checked_at = time.monotonic()
+        return version
+
+
+def relay_point_layer(db, generation):
+    locations = [doc["location"] for doc in db.relay_points.find({"generation": generation}, {"location": 1, "_id": 0})]
+    positions = np.array(locations, dtype=np.float64).reshape(-1, 2)
+    return positions[:, 0], positions[:, 1], np.ones(len(positions))
+
+
+def client_layer(db, batch_size=10000):
+    # Client positions and purchase rates sent with the trips (location, purchase_rate), same fields as the
+    # streaming training, trips sent without a location are not on the map
+    cursor = db.trip.find({"location": {"$exists": True}}, {"location": 1, "purchase_rate": 1, "_id": 0}).batch_size(batch_size)
+    lat, lon, weights = [], [], []
+    for doc in cursor:
+        location = doc.get("location")
+        if not location or len(location) != 2:
+            continue
+        lat.append(location[0])
+        lon.append(location[1])
+        weights.append(doc.get("purchase_rate", 1.0))
+    return np.array(lat, dtype=np.float64), np.array(lon, dtype=np.float64), np.array(weights, dtype=np.float64)
+
+
+LAYERS = {
+    "relay_points": relay_point_layer,
+    "clients": lambda db, version: client_layer(db),
+}
+
+tile_cache = TileCache()
+client_layer_version = ClientLayerVersion()
@@ -0,0 +1,90 @@
+import json
+import argparse
+from ml_model import train_relay_point_model, load_training_data
+from spatial_index import get_city_index
+from model_registry import ModelRegistry
+
+# Training entry point, run outside of the web process:
+#   python train.py --relay-points 150
+#   python train.py --relay-points 150 --source mongo --batch-size 20000
+#   python train.py --online
+#   python train.py --sweep 50:300:10 --target-distance 15 --workers 8 --report sweep.json
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the relay points model and publish it to the model registry")
+    parser.add_argument("--relay-points", type=int, default=2)
+    parser.add_argument("--source", choices=["fake", "mongo"], default="fake")
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--engine", default=None, help="distance engine: auto, cpu or cuda")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=10000, help="mongo source only")
+    parser.add_argument("--epochs", type=int, default=1, help="mongo source only")
+    parser.add_argument("--online", action="store_true",
+                        help="update the latest model with the trips added since it was published")
+    parser.add_argument("--decay", type=float, default=None, help="online only, share of the cluster weights kept")
+    parser.add_argument("--sweep", default=None, metavar="START:STOP:STEP",
+                        help="evaluate a range of relay point counts instead of publishing a model")
+    parser.add_argument("--target-distance", type=float, default=None, help="sweep only, km")
+    parser.add_argument("--target-metric", choices=["max", "mean"], default="max", help="sweep only")
+    parser.add_argument("--workers", type=int, default=None, help="sweep only, defaults to the CPU count")
+    parser.add_argument("--report", default=None, help="sweep only, JSON report path")
+    args = parser.parse_args()
+
+    if args.online:
+        online(args)
+        return
+    if args.sweep:
+        sweep(args)
+        return
+
+    if args.source == "mongo":
+        from streaming_training import train_and_publish_streaming
+        version = train_and_publish_streaming(args.relay_points, city_positions=get_city_index(),
+                                              batch_size=args.batch_size, epochs=args.epochs,
+                                              seed=args.seed, engine=args.engine)
+    else:
+        result, version = train_relay_point_model(args.relay_points, source=args.source,
+                                                  num_iterations=args.iterations, engine=args.engine,
+                                                  seed=args.seed)
+    print("Published model version", version, "at", ModelRegistry().directory)
+
+
+def online(args):
+    from online_update import run_online_update, ONLINE_DECAY
+
+    outcome = run_online_update(batch_size=args.batch_size, decay=args.decay if args.decay is not None else ONLINE_DECAY,
+                                city_positions=get_city_index(), engine=args.engine)
+    drift = outcome["drift"]
+    print(f"{outcome['action']}: version {outcome['version']}, {drift['clients']} new clients, "
+          f"inertia {drift['inertia_increase']:+.1%}, reassigned {drift['reassigned_share']:.1%}")
+
+
+def sweep(args):
+    from sweep import sweep_relay_points, recommend_k
+
+    if args.source != "fake":
+        raise SystemExit("--sweep needs the whole client set in memory, only --source fake is supported")
+    start, stop, step = (int(part) for part in (args.sweep.split(":") + ["1"])[:3])
+    k_values = range(start, stop + 1, step)
+    client_positions, purchase_rates = load_training_data(args.source)
+    reports = sweep_relay_points(client_positions, purchase_rates, get_city_index(), k_values,
+                                 workers=args.workers, max_iterations=args.iterations,
+                                 seed=args.seed, engine=args.engine or "cpu")
+
+    for report in reports:
+        print(f"{report['k']:>6} relay points: mean {report['mean_weighted_distance_km']:.2f} km, "
+              f"max {report['max_distance_km']:.2f} km, inertia {report['inertia']:.2f}")
+    recommended = None
+    if args.target_distance is not None:
+        metric = "max_distance_km" if args.target_metric == "max" else "mean_weighted_distance_km"
+        recommended = recommend_k(reports, args.target_distance, metric)
+        print("Recommended relay points:", recommended if recommended is not None else "none within the target")
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump({"target_distance_km": args.target_distance, "target_metric": args.target_metric,
+                       "recommended": recommended, "reports": reports}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
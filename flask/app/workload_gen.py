@@ -0,0 +1,216 @@
+import os
+import glob
+import argparse
+from datetime import datetime, timedelta
+import numpy as np
+from bson.objectid import ObjectId
+from city_data import CITY_CSV, load_city_table
+
+# Synthetic workloads at production scale, reproducible from a seed:
+#   python workload_gen.py --clients 10000000 --out workload/
+#   python workload_gen.py --clients 1000000 --users 5000 --format parquet --out workload/
+#   python workload_gen.py --clients 200000 --users 1000 --mongo
+
+DEFAULT_CHUNK_SIZE = 1000000
+KM_PER_DEGREE = 111.195
+# Every generated user gets this password, the load test logs in with it
+DEFAULT_PASSWORD = "workload-password"
+
+
+def commune_weights(table, rng, distribution="zipf", zipf_exponent=1.0, population_csv=None):
+    # Share of the clients drawn around each commune of the city table
+    # cleaned_cities.csv has no population column: "zipf" gives the communes heavy-tailed sizes in a
+    # seeded random order, "uniform" follows the commune density only, population_csv (insee_code,
+    # population) uses real populations when one is available
+    count = len(table)
+    if population_csv:
+        import pandas as pd
+        cities = pd.read_csv(CITY_CSV, usecols=['insee_code', 'latitude', 'longitude', 'label'], dtype={'insee_code': str})
+        cities = cities.dropna(subset=['latitude', 'longitude', 'label'])
+        population = pd.read_csv(population_csv, dtype={'insee_code': str}).set_index('insee_code')['population']
+        # Same rows as the compiled table, a commune listed under several zip codes shares its population between its rows
+        rows_per_commune = cities['insee_code'].map(cities['insee_code'].value_counts())
+        weights = (cities['insee_code'].map(population).fillna(0) / rows_per_commune).values.astype(np.float64)
+    elif distribution == "zipf":
+        ranks = rng.permutation(count) + 1
+        weights = 1.0 / ranks.astype(np.float64) ** zipf_exponent
+    elif distribution == "uniform":
+        weights = np.ones(count, dtype=np.float64)
+    else:
+        raise ValueError(f"Unknown distribution '{distribution}'")
+    total = weights.sum()
+    if total <= 0:
+        raise ValueError("Commune weights sum to zero")
+    return weights / total
+
+
+def generate_clients(num_clients, seed=None, distribution="zipf", zipf_exponent=1.0, jitter_km=2.0,
+                     purchase_rate_range=(1.0, 10.0), chunk_size=DEFAULT_CHUNK_SIZE, population_csv=None):
+    # Yields (positions (n, 2) [lat, lng], purchase_rates (n,)) chunks, the same seed gives the same chunks
+    table = load_city_table()
+    seeds = np.random.SeedSequence(seed)
+    commune_seed, chunk_seeds = seeds.spawn(2)
+    weights = commune_weights(table, np.random.default_rng(commune_seed), distribution, zipf_exponent, population_csv)
+    cumulative = np.cumsum(weights)
+    lat, lon = np.asarray(table.lat, dtype=np.float64), np.asarray(table.lon, dtype=np.float64)
+
+    num_chunks = (num_clients + chunk_size - 1) // chunk_size
+    for chunk, chunk_seed in enumerate(chunk_seeds.spawn(num_chunks)):
+        rng = np.random.default_rng(chunk_seed)
+        size = min(chunk_size, num_clients - chunk * chunk_size)
+        rows = np.minimum(np.searchsorted(cumulative, rng.random(size) * cumulative[-1]), len(cumulative) - 1)
+        # Gaussian offset around the commune centre, converted from km to degrees
+        north, east = rng.normal(0.0, jitter_km, size), rng.normal(0.0, jitter_km, size)
+        positions = np.empty((size, 2), dtype=np.float64)
+        positions[:, 0] = lat[rows] + north / KM_PER_DEGREE
+        positions[:, 1] = lon[rows] + east / (KM_PER_DEGREE * np.cos(np.radians(lat[rows])))
+        purchase_rates = rng.uniform(purchase_rate_range[0], purchase_rate_range[1], size)
+        yield positions, purchase_rates
+
+
+def generate_users(num_users, seed=None, password=DEFAULT_PASSWORD, bcrypt_rounds=4):
+    # Documents in the shape written by User.create_user, all sharing one password hash
+    import bcrypt
+
+    rng = np.random.default_rng(seed)
+    password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(bcrypt_rounds)).decode('utf-8')
+    now = datetime.now()
+    hire_days = rng.integers(0, 3650, num_users)
+    birth_days = rng.integers(18 * 365, 65 * 365, num_users)
+    return [
+        {
+            "_id": ObjectId(),
+            "username": f"user{i}",
+            "email": f"user{i}@example.com",
+            "password": password_hash,
+            "first_name": f"first{i}"[:10],
+            "last_name": f"last{i}"[:10],
+            "hire_date": (now - timedelta(days=int(hire_days[i]))).replace(second=0, microsecond=0),
+            "birth_date": (now - timedelta(days=int(birth_days[i]))).replace(hour=0, minute=0, second=0, microsecond=0),
+            "Position": [0, 0],
+        }
+        for i in range(num_users)
+    ]
+
+
+def trip_documents(positions, purchase_rates, user_ids, rng, days=365, max_distance=1100, max_position_dot=100):
+    # One trip per client in the Trip shape, location and purchase_rate are the fields read by training
+    size = len(positions)
+    now = datetime.now().replace(microsecond=0)
+    start_offsets = rng.integers(60, days * 86400, size)
+    durations = rng.integers(5 * 60, 4 * 3600, size)
+    owners = rng.integers(0, len(user_ids), size)
+    distances = rng.integers(1, max_distance + 1, size)
+    dots = rng.integers(0, max_position_dot + 1, size)
+    done = rng.random(size) < 0.9
+    documents = []
+    for i in range(size):
+        start_date = now - timedelta(seconds=int(start_offsets[i]))
+        documents.append({
+            "user_id": user_ids[owners[i]],
+            "start_date": start_date,
+            "end_date": min(start_date + timedelta(seconds=int(durations[i])), now),
+            "position_dot": int(dots[i]),
+            "Is_done": bool(done[i]),
+            "distance": int(distances[i]),
+            "location": [float(positions[i, 0]), float(positions[i, 1])],
+            "purchase_rate": float(purchase_rates[i]),
+        })
+    return documents
+
+
+def write_npy(chunks, directory):
+    # clients-00000.npy ... each an (n, 3) float64 array of [lat, lng, purchase_rate]
+    os.makedirs(directory, exist_ok=True)
+    total = 0
+    for chunk, (positions, purchase_rates) in enumerate(chunks):
+        np.save(os.path.join(directory, f"clients-{chunk:05d}.npy"), np.column_stack((positions, purchase_rates)))
+        total += len(positions)
+    return total
+
+
+def load_clients(directory):
+    # Concatenates the chunks written by write_npy, returns (positions, purchase_rates)
+    files = sorted(glob.glob(os.path.join(directory, "clients-*.npy")))
+    if not files:
+        raise FileNotFoundError(f"No client chunk in {directory}")
+    data = np.concatenate([np.load(path, mmap_mode='r') for path in files])
+    return data[:, :2], data[:, 2]
+
+
+def write_parquet(chunks, users, directory, seed=None):
+    # users.parquet plus trips-00000.parquet ... (pyarrow or fastparquet must be installed)
+    import pandas as pd
+
+    os.makedirs(directory, exist_ok=True)
+    frame = pd.DataFrame(users)
+    frame["_id"] = frame["_id"].astype(str)
+    frame.to_parquet(os.path.join(directory, "users.parquet"), index=False)
+    user_ids = [user["_id"] for user in users]
+    rng = np.random.default_rng(seed)
+    total = 0
+    for chunk, (positions, purchase_rates) in enumerate(chunks):
+        trips = pd.DataFrame(trip_documents(positions, purchase_rates, user_ids, rng))
+        trips["user_id"] = trips["user_id"].astype(str)
+        trips["latitude"] = positions[:, 0]
+        trips["longitude"] = positions[:, 1]
+        trips = trips.drop(columns=["location"])
+        trips.to_parquet(os.path.join(directory, f"trips-{chunk:05d}.parquet"), index=False)
+        total += len(trips)
+    return total
+
+
+def load_into_mongo(db, chunks, users, seed=None, insert_batch=10000):
+    # Unordered insert_many per batch, the trip rollups are rebuilt once at the end
+    from Model import TripRollup
+
+    db.users.insert_many(users, ordered=False)
+    user_ids = [user["_id"] for user in users]
+    rng = np.random.default_rng(seed)
+    total = 0
+    for positions, purchase_rates in chunks:
+        for start in range(0, len(positions), insert_batch):
+            end = start + insert_batch
+            trips = trip_documents(positions[start:end], purchase_rates[start:end], user_ids, rng)
+            db.trip.insert_many(trips, ordered=False)
+            total += len(trips)
+        print(f"{total} trips inserted.")
+    TripRollup(db).backfill()
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic client, user and trip workload")
+    parser.add_argument("--clients", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--distribution", choices=["zipf", "uniform"], default="zipf")
+    parser.add_argument("--zipf-exponent", type=float, default=1.0)
+    parser.add_argument("--population-csv", default=None, help="insee_code,population file used instead of --distribution")
+    parser.add_argument("--jitter-km", type=float, default=2.0)
+    parser.add_argument("--min-rate", type=float, default=1.0)
+    parser.add_argument("--max-rate", type=float, default=10.0)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--format", choices=["npy", "parquet"], default="npy")
+    parser.add_argument("--out", default="workload")
+    parser.add_argument("--mongo", action="store_true", help="bulk load into MONGO_URI instead of writing files")
+    args = parser.parse_args()
+
+    chunks = generate_clients(args.clients, seed=args.seed, distribution=args.distribution,
+                              zipf_exponent=args.zipf_exponent, jitter_km=args.jitter_km,
+                              purchase_rate_range=(args.min_rate, args.max_rate), chunk_size=args.chunk_size,
+                              population_csv=args.population_csv)
+    if args.mongo:
+        from Model import get_db
+        total = load_into_mongo(get_db(), chunks, generate_users(args.users, seed=args.seed), seed=args.seed)
+        print(f"Loaded {args.users} users and {total} trips into Mongo.")
+    elif args.format == "parquet":
+        total = write_parquet(chunks, generate_users(args.users, seed=args.seed), args.out, seed=args.seed)
+        print(f"Wrote {args.users} users and {total} trips to {args.out}.")
+    else:
+        total = write_npy(chunks, args.out)
+        print(f"Wrote {total} clients to {args.out}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import os
+import signal
+import tempfile
+import multiprocessing
+
+# Production server: gunicorn -c gunicorn.conf.py (from the flask directory)
+# The app and the read-only ML state are loaded once in the master, workers are forked from it and
+# share those pages. Publishing a new model version makes the master reload the state and replace
+# its workers gracefully (same as kill -HUP <master pid>).
+# State that must be the same on every worker lives in Mongo: relay point jobs and live driver positions.
+# The API key cache stays per worker, a revoked key can be accepted by another worker for up to its 60 s TTL.
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+# ASGI app on uvicorn workers: live position viewers are coroutines, the Flask routes run on a2wsgi threads
+# GUNICORN_APP=app:app with GUNICORN_WORKER_CLASS=gthread serves Flask alone, where every open
+# /drivers/stream holds one of the worker's threads
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "uvicorn.workers.UvicornWorker")
+wsgi_app = os.getenv("GUNICORN_APP", "app.asgi:application")
+threads = int(os.getenv("GUNICORN_THREADS", "8"))  # gthread only
+preload_app = True
+# Metrics of all the workers are summed through files in this directory. It must exist before the app is
+# imported, and it is created once per master: a HUP reload reads this file again and keeps it
+if not os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = tempfile.mkdtemp(prefix="gunicorn-metrics-")
+# The preloaded app leaves the Mongo client to post_fork, one per worker
+os.environ["MONGO_CONNECT_AFTER_FORK"] = "1"
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+accesslog = "-"
+
+
+def when_ready(server):
+    # Runs in the master once the app is preloaded (which put the ML modules on sys.path), before the first worker is forked
+    import shared_state
+
+    shared_state.preload()
+
+    def reload_workers(version):
+        server.log.info("Model version %s published, reloading the workers", version)
+        os.kill(os.getpid(), signal.SIGHUP)
+
+    shared_state.watch_registry(reload_workers)
+
+
+def post_fork(server, worker):
+    from app import connect_db
+
+    connect_db()
+
+
+def child_exit(server, worker):
+    # Drops the live-only gauges of the worker, its counters and histograms keep counting in the sum
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)
+
+
+def on_reload(server):
+    # Master main thread, after a HUP and before the new workers are forked
+    import shared_state
+
+    shared_state.preload()
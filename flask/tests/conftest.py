@@ -0,0 +1,54 @@
+import os
+import sys
+from datetime import datetime, timedelta
+import pytest
+
+# The modules under test are imported bare, like the ML modules import each other: importing the app
+# package would need the Mongo credentials and open a client
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+# Tests of the routes import the app package, its Mongo client is only created by the mongo_db fixture.
+# Tests that need a server run against MONGO_TEST_URI (its database is dropped) and are skipped without it
+MONGO_TEST_URI = os.getenv("MONGO_TEST_URI")
+os.environ.setdefault("MONGO_INITDB_ROOT_USERNAME", "test")
+os.environ.setdefault("MONGO_INITDB_ROOT_PASSWORD", "test")
+os.environ["MONGO_URI"] = MONGO_TEST_URI or "mongodb://localhost:27017/relay_points_test"
+os.environ["MONGO_CONNECT_AFTER_FORK"] = "1"
+if os.path.dirname(APP_DIR) not in sys.path:
+    sys.path.insert(0, os.path.dirname(APP_DIR))
+
+
+@pytest.fixture(scope="session")
+def flask_app():
+    from app import app
+    return app
+
+
+@pytest.fixture
+def api_key():
+    # A key the API key cache already knows as valid
+    from app.api_key_cache import api_key_cache
+    key = "test-api-key"
+    api_key_cache.put(key, datetime.now() + timedelta(hours=1))
+    yield key
+    api_key_cache.invalidate(key)
+
+
+@pytest.fixture(scope="session")
+def _connected_app(flask_app):
+    if not MONGO_TEST_URI:
+        pytest.skip("MONGO_TEST_URI is not set")
+    from app import connect_db
+    connect_db()
+    return flask_app
+
+
+@pytest.fixture
+def mongo_db(_connected_app):
+    # Empty database with the indexes of init_db
+    from app import mongo, init_db
+    mongo.cx.drop_database(mongo.db.name)
+    init_db(_connected_app)
+    return mongo.db
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+from api_key_cache import APIKeyCache
+
+
+def test_miss_then_hit():
+    cache = APIKeyCache()
+    assert cache.get("key") is None
+    cache.put("key", datetime.now() + timedelta(days=1))
+    assert cache.get("key") is True
+
+
+def test_unknown_key_is_cached_as_invalid():
+    cache = APIKeyCache()
+    cache.put("key", None)
+    assert cache.get("key") is False
+
+
+def test_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("api_key_cache.time.monotonic", lambda: now[0])
+    cache = APIKeyCache(ttl=60, negative_ttl=5)
+    cache.put("valid", datetime.now() + timedelta(days=1))
+    cache.put("unknown", None)
+
+    now[0] += 10
+    assert cache.get("valid") is True
+    assert cache.get("unknown") is None
+    now[0] += 60
+    assert cache.get("valid") is None
+    assert len(cache) == 0
+
+
+def test_key_expiry_caps_the_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("api_key_cache.time.monotonic", lambda: now[0])
+    cache = APIKeyCache(ttl=60)
+    cache.put("key", datetime.now() + timedelta(seconds=10))
+    now[0] += 20
+    assert cache.get("key") is None
+
+
+def test_expired_key_is_not_cached():
+    cache = APIKeyCache()
+    cache.put("key", datetime.now() - timedelta(seconds=1))
+    assert cache.get("key") is None
+
+
+def test_least_recently_used_is_evicted():
+    cache = APIKeyCache(max_size=2)
+    expiry = datetime.now() + timedelta(days=1)
+    cache.put("a", expiry)
+    cache.put("b", expiry)
+    cache.get("a")
+    cache.put("c", expiry)
+    assert cache.get("b") is None
+    assert cache.get("a") is True
+    assert len(cache) == 2
+
+
+def test_invalidate():
+    cache = APIKeyCache()
+    cache.put("key", None)
+    cache.invalidate("key")
+    assert cache.get("key") is None
@@ -0,0 +1,39 @@
+import pytest
+from starlette.testclient import TestClient
+
+
+@pytest.fixture(scope="module")
+def asgi_client():
+    # Without the lifespan there is no Motor client, enough for the routes that answer before reading
+    from app.asgi import application
+    return TestClient(application)
+
+
+@pytest.mark.parametrize("path", ["/users", "/trips/0123456789abcdef01234567", "/drivers/stream"])
+def test_native_routes_require_a_key(asgi_client, path):
+    assert asgi_client.get(path).status_code == 401
+
+
+def test_invalid_user_id_is_a_404_in_both_apps(asgi_client, flask_app, api_key):
+    headers = {"X-API-KEY": api_key}
+    assert asgi_client.get("/trips/not-an-id", headers=headers).status_code == 404
+    assert flask_app.test_client().get("/trips/not-an-id", headers=headers).status_code == 404
+
+
+def test_flask_routes_are_mounted(asgi_client):
+    # Generating relay points needs a key, on both halves
+    assert asgi_client.post("/relay_points/generate", json={}).status_code == 401
+
+
+def test_relay_points_are_public_in_both_apps(mongo_db, flask_app):
+    from Model import relay_point
+    from app.asgi import application
+    relay_point(mongo_db).replace_relay_points([[48.8566, 2.3522]], 1, ["Paris"])
+
+    response = flask_app.test_client().get("/relay_points")
+    assert response.status_code == 200
+    assert [point["name"] for point in response.get_json()] == ["Paris"]
+    with TestClient(application) as client:
+        response = client.get("/relay_points")
+    assert response.status_code == 200
+    assert [point["name"] for point in response.json()] == ["Paris"]
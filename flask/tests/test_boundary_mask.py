@@ -0,0 +1,46 @@
+import os
+import joblib
+import geopandas as gpd
+from shapely.geometry import box
+import boundary_mask
+from boundary_mask import get_boundary_mask, load_union_geometry
+
+
+def write_boundaries(path, geometry):
+    joblib.dump(gpd.GeoDataFrame(geometry=[geometry], crs="EPSG:4326"), path)
+
+
+def test_union_cache_follows_the_pickle(tmp_path):
+    cache_file = str(tmp_path / "boundaries.pkl")
+    shapefile = str(tmp_path / "missing.zip")
+    write_boundaries(cache_file, box(0, 40, 5, 45))
+    assert load_union_geometry(cache_file, shapefile=shapefile).bounds == (0, 40, 5, 45)
+
+    write_boundaries(cache_file, box(0, 40, 10, 50))
+    assert load_union_geometry(cache_file, shapefile=shapefile).bounds == (0, 40, 10, 50)
+    # The union of the previous pickle is removed
+    assert len(list(tmp_path.glob("boundaries_union.*.wkb"))) == 1
+
+
+def test_pickle_is_rebuilt_when_the_shapefile_changes(tmp_path):
+    cache_file = str(tmp_path / "boundaries.pkl")
+    shapefile = str(tmp_path / "boundaries.geojson")
+    gpd.GeoDataFrame(geometry=[box(0, 40, 5, 45)], crs="EPSG:4326").to_file(shapefile)
+    assert load_union_geometry(cache_file, shapefile=shapefile).bounds == (0, 40, 5, 45)
+
+    os.remove(shapefile)
+    gpd.GeoDataFrame(geometry=[box(-5, 40, 5, 45)], crs="EPSG:4326").to_file(shapefile)
+    assert load_union_geometry(cache_file, shapefile=shapefile).bounds == (-5, 40, 5, 45)
+
+
+def test_loaded_mask_is_reloaded_when_the_pickle_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(boundary_mask, "_masks", {})
+    monkeypatch.setattr(boundary_mask, "FRANCE_SHAPEFILE", str(tmp_path / "missing.zip"))
+    cache_file = str(tmp_path / "boundaries.pkl")
+    write_boundaries(cache_file, box(0, 40, 5, 45))
+    mask = get_boundary_mask(cache_file)
+    assert get_boundary_mask(cache_file) is mask
+    assert not mask.contains([47], [7])[0]
+
+    write_boundaries(cache_file, box(0, 40, 10, 50))
+    assert get_boundary_mask(cache_file).contains([47], [7])[0]
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from distance_engine import CPUDistanceEngine, haversine_matrix, haversine_distances
+
+
+def random_points(rng, n):
+    return rng.uniform(42.0, 51.0, n), rng.uniform(-4.0, 8.0, n)
+
+
+def test_haversine_paris_lyon():
+    distance = haversine_distances(48.8566, 2.3522, 45.7640, 4.8357)
+    assert distance == pytest.approx(392.0, abs=2.0)
+
+
+def test_haversine_matrix_matches_elementwise():
+    rng = np.random.default_rng(0)
+    lat1, lon1 = random_points(rng, 5)
+    lat2, lon2 = random_points(rng, 3)
+    matrix = haversine_matrix(lat1, lon1, lat2, lon2)
+    assert matrix.shape == (5, 3)
+    for j in range(3):
+        np.testing.assert_allclose(matrix[:, j], haversine_distances(lat1, lon1, lat2[j], lon2[j]))
+
+
+def test_nearest_matches_brute_force_across_blocks():
+    rng = np.random.default_rng(1)
+    lat1, lon1 = random_points(rng, 1000)
+    lat2, lon2 = random_points(rng, 7)
+    # A block of 10 clients, so the loop runs over many blocks and a partial last one
+    engine = CPUDistanceEngine(block_bytes=8 * 7 * 10 + 1)
+    indices, distances = engine.nearest(lat1, lon1, lat2, lon2)
+
+    matrix = haversine_matrix(lat1, lon1, lat2, lon2)
+    np.testing.assert_array_equal(indices, matrix.argmin(axis=1))
+    np.testing.assert_allclose(distances, matrix.min(axis=1))
+
+
+def test_nearest_without_targets():
+    with pytest.raises(ValueError):
+        CPUDistanceEngine().nearest(np.zeros(2), np.zeros(2), np.array([]), np.array([]))
+
+
+def test_weighted_min_distances():
+    rng = np.random.default_rng(2)
+    lat1, lon1 = random_points(rng, 200)
+    lat2, lon2 = random_points(rng, 4)
+    rates = rng.uniform(0.1, 2.0, 200)
+    distances = CPUDistanceEngine(block_bytes=8 * 4 * 16).weighted_min_distances(lat1, lon1, lat2, lon2, rates)
+
+    expected = rates * haversine_matrix(lat1, lon1, lat2, lon2).min(axis=1)
+    np.testing.assert_allclose(distances, expected, rtol=1e-6)
+
+
+def test_weighted_min_distances_without_relay_points():
+    distances = CPUDistanceEngine().weighted_min_distances(np.zeros(3), np.zeros(3), np.array([]), np.array([]), np.ones(3))
+    assert (distances >= 1e19).all()
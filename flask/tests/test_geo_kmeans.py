@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from distance_engine import CPUDistanceEngine
+from geo_kmeans import weighted_geographic_kmeans
+
+CENTERS = np.array([[48.85, 2.35], [45.76, 4.84], [43.30, 5.37]])  # Paris, Lyon, Marseille
+
+
+def clustered_clients(rng, per_cluster=200, spread=0.05):
+    positions = np.concatenate([center + rng.normal(0.0, spread, (per_cluster, 2)) for center in CENTERS])
+    return positions, np.ones(len(positions))
+
+
+def test_finds_the_clusters():
+    rng = np.random.default_rng(0)
+    positions, rates = clustered_clients(rng)
+    result = weighted_geographic_kmeans(positions, rates, None, 3, seed=1, engine="cpu")
+
+    assert result.converged
+    found = sorted(map(tuple, np.round(result.centroids, 1)))
+    np.testing.assert_allclose(found, sorted(map(tuple, np.round(CENTERS, 1))), atol=0.1)
+    np.testing.assert_allclose(sorted(result.cluster_weights), [200, 200, 200])
+
+
+def test_result_matches_final_assignment():
+    rng = np.random.default_rng(1)
+    positions, rates = clustered_clients(rng, per_cluster=50)
+    rates = rng.uniform(0.5, 2.0, len(positions))
+    result = weighted_geographic_kmeans(positions, rates, None, 4, max_iterations=2, seed=2, engine="cpu")
+
+    labels, distances = CPUDistanceEngine().nearest(positions[:, 0], positions[:, 1],
+                                                    result.centroids[:, 0], result.centroids[:, 1])
+    np.testing.assert_array_equal(result.labels, labels)
+    assert result.inertia == pytest.approx(float(np.dot(rates, distances ** 2)))
+    assert result.cluster_weights.sum() == pytest.approx(rates.sum())
+
+
+def test_same_seed_same_result():
+    rng = np.random.default_rng(2)
+    positions, rates = clustered_clients(rng, per_cluster=50)
+    first = weighted_geographic_kmeans(positions, rates, None, 3, seed=7, engine="cpu")
+    second = weighted_geographic_kmeans(positions, rates, None, 3, seed=7, engine="cpu")
+    np.testing.assert_array_equal(first.centroids, second.centroids)
+
+
+def test_snaps_centroids_to_cities():
+    rng = np.random.default_rng(3)
+    positions, rates = clustered_clients(rng, per_cluster=50)
+    cities = np.array([[48.86, 2.34], [45.75, 4.85], [43.29, 5.38], [47.22, -1.55]])
+    result = weighted_geographic_kmeans(positions, rates, cities, 3, seed=1, engine="cpu")
+    assert all(any(np.allclose(centroid, city) for city in cities) for centroid in result.centroids)
+
+
+def test_callback_per_iteration():
+    rng = np.random.default_rng(4)
+    positions, rates = clustered_clients(rng, per_cluster=30)
+    calls = []
+    weighted_geographic_kmeans(positions, rates, None, 3, seed=1, engine="cpu",
+                               callback=lambda iteration, inertia: calls.append((iteration, inertia)))
+    assert [iteration for iteration, _ in calls] == list(range(1, len(calls) + 1))
+
+
+def test_more_relay_points_than_clients():
+    positions = CENTERS.copy()
+    result = weighted_geographic_kmeans(positions, np.ones(3), None, 10, seed=0, engine="cpu")
+    assert len(result.centroids) == 3
+    assert result.inertia == pytest.approx(0.0, abs=1e-9)
+
+
+def test_no_clients():
+    with pytest.raises(ValueError):
+        weighted_geographic_kmeans(np.empty((0, 2)), np.empty(0), None, 3, engine="cpu")
@@ -0,0 +1,128 @@
+import os
+import time
+from datetime import datetime, timedelta
+import pytest
+from pymongo import MongoClient
+from jobs import JobManager, parse_job_params, TRAINING_SOURCES
+from job_tasks import run_relay_point_job
+
+
+def test_parse_job_params():
+    assert parse_job_params({"num_relay_points": "12", "source": "fake", "seed": 3, "other": 1}) == \
+        {"num_relay_points": 12, "source": "fake", "seed": 3}
+    assert parse_job_params({"seed": None}) == {"seed": None}
+    assert parse_job_params({}) == {}
+
+
+@pytest.mark.parametrize("data, message", [
+    ({"num_relay_points": "many"}, "num_relay_points must be an integer"),
+    ({"num_relay_points": 0}, "num_relay_points must be positive"),
+    ({"source": "mongo"}, f"source must be one of {', '.join(TRAINING_SOURCES)}"),
+    ({"seed": -1}, "seed must be a non-negative integer"),
+    ({"seed": "1"}, "seed must be a non-negative integer"),
+    ({"seed": True}, "seed must be a non-negative integer"),
+])
+def test_invalid_job_params(data, message):
+    with pytest.raises(ValueError, match=message):
+        parse_job_params(data)
+
+
+def test_invalid_params_are_refused_before_queuing(flask_app, api_key):
+    response = flask_app.test_client().post("/relay_points/generate", json={"source": "nowhere"},
+                                            headers={"X-API-KEY": api_key})
+    assert response.status_code == 400
+    assert response.get_json()["error"].startswith("source must be one of")
+
+
+def test_failed_job_keeps_the_error(mongo_db, monkeypatch):
+    from Model import RelayPointJob
+
+    def generate_relay_points(**params):
+        raise FileNotFoundError("No trained model published yet, run train.py first")
+
+    monkeypatch.setattr("ml_model.generate_relay_points", generate_relay_points)
+    # The job closes its client when it ends
+    monkeypatch.setattr("Model.get_db", lambda: MongoClient(os.environ["MONGO_URI"]).get_default_database())
+    jobs = RelayPointJob(mongo_db)
+    jobs.submit("job", "key", {})
+
+    with pytest.raises(FileNotFoundError):
+        run_relay_point_job("job", {})
+    status = jobs.status("job")
+    assert status["status"] == "failed"
+    assert status["error"] == "FileNotFoundError: No trained model published yet, run train.py first"
+
+
+# Run in the pool processes, which import them from this module
+def slow_job(job_id, params):
+    time.sleep(2)
+
+
+def failing_job(job_id, params):
+    raise RuntimeError("pool process failed")
+
+
+def wait_for_status(manager, db, job_id, status, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.status(db, job_id)
+        if job["status"] == status:
+            return job
+        time.sleep(0.1)
+    raise AssertionError(f"job {job_id} is still {job['status']}")
+
+
+@pytest.fixture
+def managers():
+    # Two web workers sharing the jobs collection
+    managers = [JobManager(max_workers=1), JobManager(max_workers=1)]
+    yield managers
+    for manager in managers:
+        if manager._executor is not None:
+            manager._executor.shutdown(cancel_futures=True)
+
+
+def test_identical_submissions_join_the_job_of_another_worker(mongo_db, managers):
+    first, second = managers
+    job_id, coalesced = first.submit(mongo_db, {"num_relay_points": 3}, func=slow_job)
+    assert not coalesced
+    assert second.submit(mongo_db, {"num_relay_points": 3}, func=slow_job) == (job_id, True)
+    assert second.status(mongo_db, job_id)["status"] == "queued"
+    # Only the worker running the job started a pool
+    assert second._executor is None
+
+    other_id, coalesced = second.submit(mongo_db, {"num_relay_points": 4}, func=slow_job)
+    assert other_id != job_id and not coalesced
+
+
+def test_failure_of_the_pool_process_is_recorded(mongo_db, managers):
+    job_id, _ = managers[0].submit(mongo_db, {}, func=failing_job)
+    job = wait_for_status(managers[1], mongo_db, job_id, "failed")
+    assert job["error"] == "pool process failed"
+    # Finished jobs are not joined
+    assert managers[1].submit(mongo_db, {}, func=slow_job)[1] is False
+
+
+def test_job_with_a_stale_heartbeat_is_failed_and_replaced(mongo_db):
+    from Model import RelayPointJob
+    jobs = RelayPointJob(mongo_db)
+    jobs.submit("lost", "key", {})
+    assert jobs.submit("joining", "key", {}) == ("lost", True)
+
+    stale = datetime.now() - RelayPointJob.stale_after - timedelta(seconds=1)
+    jobs.collection.update_one({"_id": "lost"}, {"$set": {"heartbeat_at": stale}})
+    status = jobs.status("lost")
+    assert status["status"] == "failed"
+    assert status["error"] == "Lost with the worker running it"
+    assert jobs.submit("new", "key", {}) == ("new", False)
+
+
+def test_stale_job_is_replaced_on_submission(mongo_db):
+    from Model import RelayPointJob
+    jobs = RelayPointJob(mongo_db)
+    jobs.submit("lost", "key", {})
+    stale = datetime.now() - RelayPointJob.stale_after - timedelta(seconds=1)
+    jobs.collection.update_one({"_id": "lost"}, {"$set": {"heartbeat_at": stale}})
+
+    assert jobs.submit("new", "key", {}) == ("new", False)
+    assert jobs.status("lost")["status"] == "failed"
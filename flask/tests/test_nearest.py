@@ -0,0 +1,39 @@
+import pytest
+from relay_index import valid_coordinates
+
+
+def test_valid_coordinates():
+    assert valid_coordinates([48.85, -90, 90], [2.35, -180, 180])
+    assert not valid_coordinates([90.5], [2.35])
+    assert not valid_coordinates([48.85], [-180.1])
+    assert not valid_coordinates([float("nan")], [2.35])
+    assert not valid_coordinates([48.85], [float("inf")])
+
+
+@pytest.mark.parametrize("query", ["lat=nan&lng=2.35", "lat=48.85&lng=inf", "lat=91&lng=2.35", "lat=48.85&lng=-181"])
+def test_get_refuses_invalid_coordinates(flask_app, api_key, query):
+    response = flask_app.test_client().get(f"/relay_points/nearest?{query}", headers={"X-API-KEY": api_key})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("points", [[[float("nan"), 2.35]], [[48.85, 2.35], [48.85, 200]], [[-95, 0]]])
+def test_post_refuses_invalid_coordinates(flask_app, api_key, points):
+    # NaN is not valid JSON, sent the way Python's json module writes it
+    response = flask_app.test_client().post("/relay_points/nearest", data=flask_app.json.dumps({"points": points}),
+                                            content_type="application/json", headers={"X-API-KEY": api_key})
+    assert response.status_code == 400
+
+
+def test_nearest_relay_points(mongo_db, flask_app, api_key):
+    from Model import relay_point
+    relay_point(mongo_db).replace_relay_points([[48.8566, 2.3522], [45.764, 4.8357]], 1, ["Paris", "Lyon"])
+    client = flask_app.test_client()
+    headers = {"X-API-KEY": api_key}
+
+    response = client.get("/relay_points/nearest?lat=45.75&lng=4.85&k=2", headers=headers)
+    assert response.status_code == 200
+    assert [result["name"] for result in response.get_json()["results"]] == ["Lyon", "Paris"]
+
+    response = client.post("/relay_points/nearest", json={"points": [[48.86, 2.35], [45.76, 4.83]]}, headers=headers)
+    assert response.status_code == 200
+    assert [distances[0] < 2 for distances in response.get_json()["distances_km"]] == [True, True]
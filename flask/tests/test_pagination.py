@@ -0,0 +1,71 @@
+from datetime import datetime
+import pytest
+from bson.objectid import ObjectId
+from Model import keyset_query, cursor_position, next_cursor, page_sort
+from pagination import encode_cursor, decode_cursor, parse_page_args, MAX_PAGE_SIZE
+
+ID = ObjectId("65f000000000000000000001")
+
+
+def test_keyset_query_by_id():
+    assert keyset_query({"generation": 3}, ID, {"_id": ID}, "_id") == {"generation": 3, "_id": {"$gt": ID}}
+
+
+def test_keyset_query_by_sort_field():
+    start = datetime(2024, 5, 1, 8, 30)
+    query = keyset_query({"user_id": 1}, ID, {"_id": ID, "start_date": start}, "start_date")
+    assert query == {
+        "user_id": 1,
+        "$or": [
+            {"start_date": {"$gt": start}},
+            {"start_date": start, "_id": {"$gt": ID}},
+        ],
+    }
+
+
+def test_keyset_query_leaves_the_query_alone():
+    query = {"user_id": 1}
+    keyset_query(query, ID, {"_id": ID}, "_id")
+    assert query == {"user_id": 1}
+
+
+def test_page_sort():
+    assert page_sort("_id") == [("_id", 1)]
+    assert page_sort("start_date") == [("start_date", 1), ("_id", 1)]
+
+
+def test_cursor_position():
+    start = datetime(2024, 5, 1)
+    assert cursor_position(ID, "_id") == (ID, {"_id": ID})
+    assert cursor_position((start, ID), "start_date") == (ID, {"_id": ID, "start_date": start})
+    # A bare _id cursor on another sort field needs the last document to be read again
+    assert cursor_position(ID, "start_date") == (ID, None)
+
+
+def test_next_cursor():
+    documents = [{"_id": ObjectId(), "start_date": datetime(2024, 5, day)} for day in (1, 2)]
+    assert next_cursor(documents, 3, "_id") is None
+    assert next_cursor(documents, 2, "_id") == documents[-1]["_id"]
+    assert next_cursor(documents, 2, "start_date") == (datetime(2024, 5, 2), documents[-1]["_id"])
+
+
+@pytest.mark.parametrize("next_after", [
+    ID,
+    (datetime(2024, 5, 1, 8, 30, 15, 123000), ID),
+    (None, ID),
+])
+def test_cursor_round_trip(next_after):
+    assert decode_cursor(encode_cursor(next_after)) == next_after
+
+
+@pytest.mark.parametrize("cursor", ["nope", "12.nope", "abc." + str(ID)])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_parse_page_args():
+    assert parse_page_args({}) == (None, 100)
+    assert parse_page_args({"after": str(ID), "limit": "5000"}) == (ID, MAX_PAGE_SIZE)
+    with pytest.raises(ValueError):
+        parse_page_args({"limit": "0"})
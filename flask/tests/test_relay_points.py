@@ -0,0 +1,22 @@
+import numpy as np
+from Model import relay_point
+
+
+def test_replace_relay_points(mongo_db):
+    relay = relay_point(mongo_db)
+    # float32 coordinates and two centroids snapped on the same city
+    locations = np.array([[46.999873398, 6.498147193], [46.999873398, 6.498147193], [47.361512085, 6.235167025]],
+                         dtype=np.float32)
+    relay.replace_relay_points(locations, 1, ["Ville du Pont", "Ville du Pont bis", "Villers Grelot"])
+
+    stored = sorted(mongo_db.relay_points.find({"generation": 1}, {"_id": 0, "name": 1, "location": 1}),
+                    key=lambda doc: doc["name"])
+    assert stored == [
+        {"name": "Ville du Pont", "location": [46.999874, 6.498147]},
+        {"name": "Villers Grelot", "location": [47.361511, 6.235167]},
+    ]
+    assert relay.current_generation() == 1
+
+    # Running the same generation again changes nothing
+    relay.replace_relay_points(locations, 1, ["Ville du Pont", "Ville du Pont bis", "Villers Grelot"])
+    assert mongo_db.relay_points.count_documents({"generation": 1}) == 2
@@ -0,0 +1,60 @@
+from datetime import datetime
+from bson.objectid import ObjectId
+from Model import Trip, TripRollup
+
+USERS = [str(ObjectId()), str(ObjectId())]
+
+
+def create_trips(db):
+    trip = Trip(db)
+    trip.create_trip(USERS[0], "2024-05-01-08:00:00", "2024-05-01-09:00:00", 1, True, 10)
+    trip.create_trip(USERS[0], "2024-05-01-18:00:00", "2024-05-01-18:30:00", 1, False, 5)
+    trip.create_trip(USERS[1], "2024-05-01-10:00:00", "2024-05-01-10:20:00", 1, True, 2)
+    trip.create_trip(USERS[1], "2024-05-02-10:00:00", "2024-05-02-11:00:00", 1, True, 7)
+
+
+def expected_totals():
+    return {
+        None: [
+            {"day": datetime(2024, 5, 1), "distance": 17, "trips": 3, "done": 2, "duration_seconds": 6600,
+             "average_duration_seconds": 2200},
+            {"day": datetime(2024, 5, 2), "distance": 7, "trips": 1, "done": 1, "duration_seconds": 3600,
+             "average_duration_seconds": 3600},
+        ],
+        USERS[0]: [
+            {"day": datetime(2024, 5, 1), "distance": 15, "trips": 2, "done": 1, "duration_seconds": 5400,
+             "average_duration_seconds": 2700},
+        ],
+    }
+
+
+def daily(db, user_id):
+    return TripRollup(db).daily(ObjectId(user_id) if user_id else None)
+
+
+def test_trip_writes_maintain_the_rollups(mongo_db):
+    create_trips(mongo_db)
+    for user_id, totals in expected_totals().items():
+        assert daily(mongo_db, user_id) == totals
+
+    trip = mongo_db.trip.find_one({"distance": 7})
+    Trip(mongo_db).delete_trip(trip["_id"])
+    assert [total["trips"] for total in daily(mongo_db, None)] == [3, 0]
+
+
+def test_backfill_rebuilds_in_place(mongo_db):
+    create_trips(mongo_db)
+    rollup = TripRollup(mongo_db)
+    # Totals that drifted, a day without trips and a legacy all-users document keyed on null
+    mongo_db.trip_rollup.update_many({}, {"$inc": {"trips": 5, "distance": 100}})
+    mongo_db.trip_rollup.insert_many([
+        {"user_id": ObjectId(USERS[0]), "day": datetime(2024, 4, 1), "distance": 1, "trips": 1, "done": 0,
+         "duration_seconds": 0, "updated_at": datetime(2024, 4, 1)},
+        {"user_id": None, "day": datetime(2024, 5, 1), "distance": 1, "trips": 1, "done": 0, "duration_seconds": 0},
+    ])
+
+    rollup.backfill()
+    for user_id, totals in expected_totals().items():
+        assert daily(mongo_db, user_id) == totals
+    assert mongo_db.trip_rollup.count_documents({}) == 5
+    assert mongo_db.trip_rollup.count_documents({"user_id": TripRollup.ALL_USERS}) == 2
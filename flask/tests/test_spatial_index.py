@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+from city_data import load_city_table
+from distance_engine import haversine_matrix
+from spatial_index import CityIndex, SphericalIndex
+
+CITIES = [
+    # label, latitude, longitude, department_number, region_name
+    ("Paris", 48.8566, 2.3522, "75", "Île-de-France"),
+    ("Versailles", 48.8049, 2.1204, "78", "Île-de-France"),
+    ("Beauvais", 49.4295, 2.0807, "60", "Hauts-de-France"),
+    ("Amiens", 49.8941, 2.2958, "80", "Hauts-de-France"),
+    ("Lyon", 45.7640, 4.8357, "69", "Auvergne-Rhône-Alpes"),
+]
+
+
+@pytest.fixture
+def city_table(tmp_path):
+    csv_path = tmp_path / "cities.csv"
+    pd.DataFrame(CITIES, columns=["label", "latitude", "longitude", "department_number", "region_name"]).to_csv(csv_path, index=False)
+    return load_city_table(str(csv_path), cache_dir=str(tmp_path / "cache"))
+
+
+@pytest.fixture
+def city_index(city_table):
+    return CityIndex.from_table(city_table)
+
+
+def test_city_table_keeps_the_csv_coordinates(city_table):
+    assert city_table.positions.tolist() == [[lat, lon] for _, lat, lon, _, _ in CITIES]
+
+
+def test_nearest_matches_brute_force():
+    rng = np.random.default_rng(0)
+    positions = np.column_stack((rng.uniform(42, 51, 500), rng.uniform(-4, 8, 500)))
+    queries = np.column_stack((rng.uniform(42, 51, 50), rng.uniform(-4, 8, 50)))
+    indices, distances = SphericalIndex(positions).nearest(queries[:, 0], queries[:, 1])
+
+    matrix = haversine_matrix(queries[:, 0], queries[:, 1], positions[:, 0], positions[:, 1])
+    np.testing.assert_array_equal(indices, matrix.argmin(axis=1))
+    np.testing.assert_allclose(distances, matrix.min(axis=1), rtol=1e-6)
+
+
+def test_query_restricted_to_a_region(city_index):
+    # Next to Paris, but only the cities of Hauts-de-France may answer
+    indices, _ = city_index.query([48.86], [2.35], k=3, region="Hauts-de-France")
+    assert set(city_index.names[indices[0]]) == {"Beauvais", "Amiens"}
+    assert set(city_index.table.region_of(indices[0])) == {"Hauts-de-France"}
+
+    indices, _ = city_index.nearest([45.76], [4.83], region="Île-de-France")
+    assert city_index.names[indices[0]] in {"Paris", "Versailles"}
+
+
+def test_query_restricted_to_a_department(city_index):
+    indices, _ = city_index.nearest([48.86, 45.76], [2.35, 4.83], department="78")
+    assert list(city_index.names[indices]) == ["Versailles", "Versailles"]
+
+
+def test_unknown_region(city_index):
+    with pytest.raises(LookupError):
+        city_index.query([48.86], [2.35], region="Atlantis")
+
+
+def test_unrestricted_query(city_index):
+    indices, distances = city_index.nearest([48.86], [2.35])
+    assert city_index.names[indices[0]] == "Paris"
+    assert distances[0] < 1.0
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from bson.objectid import ObjectId
+from distance_engine import get_distance_engine
+from streaming_training import MiniBatchState, minibatch_update, train_streaming
+
+CENTERS = [[48.85, 2.35], [45.76, 4.84]]  # Paris, Lyon
+
+
+def test_minibatch_update_moves_centroids_to_the_batch_means():
+    state = MiniBatchState([[48.0, 2.0], [45.0, 5.0]])
+    positions = np.array([[48.8, 2.3], [48.9, 2.4], [45.7, 4.8]])
+    minibatch_update(state, positions, np.ones(3), get_distance_engine("cpu"))
+    # First batch: the learning rate is 1, each centroid lands on the mean of its clients
+    np.testing.assert_allclose(state.centroids, [[48.85, 2.35], [45.7, 4.8]])
+    np.testing.assert_allclose(state.counts, [2, 1])
+
+
+def test_checkpoint_of_another_run(tmp_path):
+    path = str(tmp_path / "checkpoint.pkl")
+    MiniBatchState(CENTERS, num_relay_points=2).save(path)
+    assert MiniBatchState.load(path, 2).num_relay_points == 2
+    with pytest.raises(ValueError):
+        MiniBatchState.load(path, 3)
+
+
+def test_trains_on_trips_sent_to_the_api(mongo_db, flask_app, api_key):
+    rng = np.random.default_rng(0)
+    user_id = str(ObjectId())
+    trips = [
+        {"user_id": user_id, "start_date": "2024-05-01-08:00:00", "end_date": "2024-05-01-09:00:00",
+         "position_dot": 1, "Is_done": True, "distance": 3,
+         "location": (np.array(center) + rng.normal(0, 0.02, 2)).tolist(), "purchase_rate": 2.0}
+        for center in CENTERS for _ in range(50)
+    ]
+    # Both cities in every batch, the first one seeds the centroids
+    trips = [trips[i] for i in rng.permutation(len(trips))]
+    response = flask_app.test_client().post("/trips/bulk", json=trips, headers={"X-API-KEY": api_key})
+    assert response.status_code == 201
+
+    centroids, state = train_streaming(2, db=mongo_db, batch_size=32, epochs=2, checkpoint_path=None, seed=0, engine="cpu")
+    assert state.clients_seen == 200
+    np.testing.assert_allclose(sorted(centroids.tolist()), sorted(CENTERS), atol=0.05)
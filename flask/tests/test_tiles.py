@@ -0,0 +1,71 @@
+import numpy as np
+from bson.objectid import ObjectId
+from tiles import build_zoom_clusters, tile_coordinates, TILE_GRID
+
+
+def test_no_points():
+    assert build_zoom_clusters(np.array([]), np.array([]), np.array([]), 5) == {}
+
+
+def test_world_tile_at_zoom_zero():
+    lat = np.array([48.85, 48.85, -33.87])
+    lon = np.array([2.35, 2.35, 151.21])
+    tiles = build_zoom_clusters(lat, lon, np.array([1.0, 2.0, 0.5]), 0)
+    assert list(tiles) == [(0, 0)]
+    clusters = sorted(tiles[(0, 0)])
+    assert clusters == [[-33.87, 151.21, 1, 0.5], [48.85, 2.35, 2, 3.0]]
+
+
+def test_clusters_land_in_their_tile():
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(42.0, 51.0, 2000)
+    lon = rng.uniform(-4.0, 8.0, 2000)
+    weights = rng.uniform(0.0, 1.0, 2000)
+    z = 6
+    tiles = build_zoom_clusters(lat, lon, weights, z)
+
+    fx, fy = tile_coordinates(lat, lon, z)
+    expected = {(int(x), int(y)) for x, y in zip(fx, fy)}
+    assert set(tiles) == expected
+    clusters = [cluster for tile in tiles.values() for cluster in tile]
+    assert sum(cluster[2] for cluster in clusters) == 2000
+    # Cluster weights are rounded to 2 decimals
+    assert abs(sum(cluster[3] for cluster in clusters) - weights.sum()) <= 0.005 * len(clusters)
+    for (x, y), tile in tiles.items():
+        assert len(tile) <= TILE_GRID * TILE_GRID
+        cx, cy = tile_coordinates([c[0] for c in tile], [c[1] for c in tile], z)
+        # A cluster is the mean of its cell, it stays in the tile
+        assert (cx.astype(int) == x).all() and (cy.astype(int) == y).all()
+
+
+def test_cluster_is_the_mean_of_its_cell():
+    lat = np.array([48.850, 48.851])
+    lon = np.array([2.350, 2.351])
+    tiles = build_zoom_clusters(lat, lon, np.ones(2), 3)
+    [cluster] = [cluster for tile in tiles.values() for cluster in tile]
+    assert cluster == [48.8505, 2.3505, 2, 2.0]
+
+
+def test_client_layer_from_trips_sent_to_the_api(mongo_db, flask_app, api_key, monkeypatch):
+    from app.tiles import client_layer, client_layer_version
+    monkeypatch.setattr(client_layer_version, "recheck_seconds", 0)
+    trip = {"user_id": str(ObjectId()), "start_date": "2024-05-01-08:00:00", "end_date": "2024-05-01-09:00:00",
+            "position_dot": 1, "Is_done": True, "distance": 3}
+    trips = [
+        dict(trip, location=[48.85, 2.35], purchase_rate=2.5),
+        dict(trip, location=[48.851, 2.351]),
+        dict(trip, location=[45.76, 4.84], purchase_rate=1.5),
+        trip,
+    ]
+    client = flask_app.test_client()
+    headers = {"X-API-KEY": api_key}
+    assert client.post("/trips/bulk", json=trips, headers=headers).status_code == 201
+
+    lat, lon, weights = client_layer(mongo_db)
+    assert sorted(zip(lat, lon, weights)) == [(45.76, 4.84, 1.5), (48.85, 2.35, 2.5), (48.851, 2.351, 1.0)]
+
+    response = client.get("/tiles/0/0/0?layer=clients", headers=headers)
+    assert response.status_code == 200
+    clusters = response.get_json()["clusters"]
+    assert sum(cluster[2] for cluster in clusters) == 3
+    assert sum(cluster[3] for cluster in clusters) == 5.0
@@ -0,0 +1,133 @@
+from datetime import datetime, timedelta
+from bson.objectid import ObjectId
+from Model import Trip
+
+USER_ID = str(ObjectId())
+
+
+def trip(**fields):
+    record = {
+        "user_id": USER_ID,
+        "start_date": "2024-05-01-08:00:00",
+        "end_date": "2024-05-01-09:30:00",
+        "position_dot": 3,
+        "Is_done": True,
+        "distance": 12.5,
+    }
+    record.update(fields)
+    return record
+
+
+def validate(records):
+    # validate_trips does not touch the collection
+    return Trip.__new__(Trip).validate_trips(records)
+
+
+def test_valid_trip():
+    documents, indexes, errors = validate([trip()])
+    assert errors == {}
+    assert indexes == [0]
+    assert documents == [{
+        "user_id": ObjectId(USER_ID),
+        "start_date": datetime(2024, 5, 1, 8, 0),
+        "end_date": datetime(2024, 5, 1, 9, 30),
+        "position_dot": 3,
+        "Is_done": True,
+        "distance": 12.5,
+    }]
+
+
+def test_errors_point_to_their_record():
+    records = [
+        trip(),
+        "not a trip",
+        {"user_id": USER_ID},
+        trip(user_id="nope"),
+        trip(start_date="yesterday"),
+        trip(distance="far"),
+        trip(distance=float("inf")),
+        trip(position_dot=[1, 2]),
+        trip(distance=3),
+    ]
+    documents, indexes, errors = validate(records)
+    assert indexes == [0, 8]
+    assert errors == {
+        1: "Trip must be an object",
+        2: "Missing fields",
+        3: "Invalid user_id",
+        4: "Invalid date or number",
+        5: "Invalid date or number",
+        6: "Invalid date or number",
+        7: "Invalid date or number",
+    }
+    assert len(documents) == 2
+
+
+def test_values_are_clamped():
+    future = (datetime.now() + timedelta(days=2)).strftime(Trip.date_format)
+    records = [
+        trip(distance=5000, position_dot=250),
+        trip(start_date="2024-05-01-10:00:00", end_date="2024-05-01-09:00:00"),
+        trip(end_date=future),
+    ]
+    documents, indexes, errors = validate(records)
+    assert errors == {}
+    assert documents[0]["distance"] == Trip.max_distance
+    assert documents[0]["position_dot"] == Trip.max_position_dot
+    # An end before the start is moved to the start, dates in the future to now
+    assert documents[1]["end_date"] == documents[1]["start_date"]
+    assert documents[2]["end_date"] <= datetime.now()
+
+
+def test_nothing_valid():
+    assert validate([{}]) == ([], [], {0: "Missing fields"})
+
+
+def test_lower_bounds():
+    records = [trip(position_dot=-1e20), trip(distance=-5), trip(position_dot=-1), trip(position_dot=1e20, distance=10 ** 30)]
+    documents, indexes, errors = validate(records)
+    assert errors == {
+        0: "distance and position_dot must not be negative",
+        1: "distance and position_dot must not be negative",
+        2: "distance and position_dot must not be negative",
+    }
+    assert indexes == [3]
+    assert documents[0]["position_dot"] == Trip.max_position_dot
+    assert documents[0]["distance"] == Trip.max_distance
+
+
+def test_each_record_keeps_its_number_type():
+    documents, _, errors = validate([trip(distance=10), trip(distance=2.5), trip(distance=5000)])
+    assert errors == {}
+    assert [document["distance"] for document in documents] == [10, 2.5, Trip.max_distance]
+    assert [type(document["distance"]) for document in documents] == [int, float, int]
+
+
+def test_is_done_must_be_a_boolean():
+    documents, indexes, errors = validate([trip(Is_done=[True]), trip(Is_done="yes"), trip(Is_done=False)])
+    assert errors == {0: "Is_done must be a boolean", 1: "Is_done must be a boolean"}
+    assert documents[0]["Is_done"] is False
+
+
+def test_client_fields():
+    records = [
+        trip(location=[48.85, 2.35], purchase_rate=4),
+        trip(location=[91, 2.35]),
+        trip(location=[48.85, -181]),
+        trip(location=[float("nan"), 2.35]),
+        trip(location=[48.85]),
+        trip(location="48.85,2.35"),
+        trip(purchase_rate=-1),
+        trip(purchase_rate=float("inf")),
+        trip(purchase_rate=True),
+        trip(),
+    ]
+    documents, indexes, errors = validate(records)
+    assert indexes == [0, 9]
+    assert documents[0]["location"] == [48.85, 2.35]
+    assert documents[0]["purchase_rate"] == 4.0
+    assert "location" not in documents[1] and "purchase_rate" not in documents[1]
+    assert errors == {
+        **{i: "location must be [latitude, longitude] in degrees" for i in range(1, 6)},
+        **{i: "purchase_rate must be a non-negative number" for i in range(6, 9)},
+    }
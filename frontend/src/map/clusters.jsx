@@ -0,0 +1,86 @@
+import React, { useState, useEffect, useRef, useCallback } from 'react';
+import PropTypes from 'prop-types';
+import { CircleMarker, Tooltip, useMap, useMapEvents } from 'react-leaflet';
+import axios from 'axios';
+
+const REFRESH_MS = 5 * 60 * 1000;
+const NO_HEADERS = {}; // one object, so the default does not change loadVisibleTiles on every render
+
+// Web Mercator tile containing a point, same math as the backend tiles
+const toTile = (lat, lng, z) => {
+  const n = 2 ** z;
+  const latRad = (Math.max(Math.min(lat, 85.05112878), -85.05112878) * Math.PI) / 180;
+  const x = Math.floor(((lng + 180) / 360) * n);
+  const y = Math.floor(((1 - Math.log(Math.tan(latRad) + 1 / Math.cos(latRad)) / Math.PI) / 2) * n);
+  return [Math.min(Math.max(x, 0), n - 1), Math.min(Math.max(y, 0), n - 1)];
+};
+
+// Clusters of one layer, only the tiles in view are fetched and each tile is fetched once per zoom,
+// the fetched tiles are dropped every refreshMs so new data shows up without a page reload
+const ClusterLayer = ({ apiUrl, layer = 'clients', color = 'blue', headers = NO_HEADERS, maxZoom = 18, refreshMs = REFRESH_MS }) => {
+  const map = useMap();
+  const cache = useRef(new Map());
+  const [clusters, setClusters] = useState([]);
+
+  const loadVisibleTiles = useCallback(async () => {
+    const z = Math.min(Math.round(map.getZoom()), maxZoom);
+    const bounds = map.getBounds();
+    const [minX, minY] = toTile(bounds.getNorth(), bounds.getWest(), z);
+    const [maxX, maxY] = toTile(bounds.getSouth(), bounds.getEast(), z);
+
+    const requests = [];
+    for (let x = minX; x <= maxX; x++) {
+      for (let y = minY; y <= maxY; y++) {
+        const key = `${layer}/${z}/${x}/${y}`;
+        if (!cache.current.has(key)) {
+          requests.push(
+            axios.get(`${apiUrl}/tiles/${z}/${x}/${y}`, { params: { layer }, headers })
+              .then((response) => cache.current.set(key, response.data.clusters))
+              .catch((error) => console.error('Error fetching tile:', error))
+          );
+        }
+      }
+    }
+    await Promise.all(requests);
+
+    const visible = [];
+    for (let x = minX; x <= maxX; x++) {
+      for (let y = minY; y <= maxY; y++) {
+        visible.push(...(cache.current.get(`${layer}/${z}/${x}/${y}`) || []));
+      }
+    }
+    setClusters(visible);
+  }, [map, apiUrl, layer, headers, maxZoom]);
+
+  useMapEvents({ moveend: loadVisibleTiles });
+  useEffect(() => {
+    loadVisibleTiles();
+    const interval = setInterval(() => {
+      cache.current.clear();
+      loadVisibleTiles();
+    }, refreshMs);
+    return () => clearInterval(interval);
+  }, [loadVisibleTiles, refreshMs]);
+
+  return clusters.map(([lat, lng, count], index) => (
+    <CircleMarker
+      key={`${layer}-${index}-${lat}-${lng}`}
+      center={[lat, lng]}
+      radius={Math.min(4 + 3 * Math.log10(count), 20)}
+      pathOptions={{ color, fillColor: color, fillOpacity: 0.6 }}
+    >
+      <Tooltip>{count}</Tooltip>
+    </CircleMarker>
+  ));
+};
+
+ClusterLayer.propTypes = {
+  apiUrl: PropTypes.string.isRequired,
+  layer: PropTypes.oneOf(['clients', 'relay_points']),
+  color: PropTypes.string,
+  headers: PropTypes.objectOf(PropTypes.string),
+  maxZoom: PropTypes.number,
+  refreshMs: PropTypes.number,
+};
+
+export default ClusterLayer;
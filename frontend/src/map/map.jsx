@@ -1,51 +1,90 @@
 import React, { useState, useEffect } from 'react';
 import { MapContainer, TileLayer, Marker, Popup } from 'react-leaflet';
 import L from 'leaflet';
-import axios from 'axios';
 import 'leaflet/dist/leaflet.css';
 import './map.css';
-// Define custom icons for relay points and drivers
-const relayIcon = L.icon({
-  iconUrl: '../assets/46087.png', // Path to the icon
-  iconSize: [32, 32], // Size of the icon
-  iconAnchor: [16, 32], // Anchor point of the icon
-});
-
+import ClusterLayer from './clusters.jsx';
+// Define custom icons for drivers
 const driverIcon = L.icon({
   iconUrl: '../assets/fast-delivery-truck.svg',
   iconSize: [32, 32],
   iconAnchor: [16, 32],
 });
 
+const API_URL = 'http://127.0.0.1:5000';
+// Key returned by POST /login, needed for the driver positions and the client layer
+const API_KEY = import.meta.env.VITE_API_KEY || localStorage.getItem('apiKey') || '';
+const AUTH_HEADERS = API_KEY ? { 'X-API-KEY': API_KEY } : {};
+const STREAM_RETRY_MS = 5000;
+
+// Reads a Server-Sent Events response with fetch, EventSource cannot send the API key header
+const readEvents = async (url, signal, onEvent) => {
+  const response = await fetch(url, { headers: AUTH_HEADERS, signal });
+  if (!response.ok) {
+    throw new Error(`Driver stream answered ${response.status}`);
+  }
+  const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+  let buffer = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) {
+      return;
+    }
+    buffer += value;
+    let end;
+    while ((end = buffer.indexOf('\n\n')) >= 0) {
+      const block = buffer.slice(0, end);
+      buffer = buffer.slice(end + 2);
+      let name = 'message';
+      const data = [];
+      block.split('\n').forEach((line) => {
+        if (line.startsWith('event:')) name = line.slice(6).trim();
+        else if (line.startsWith('data:')) data.push(line.slice(5).trimStart());
+      });
+      if (data.length > 0) {
+        onEvent(name, JSON.parse(data.join('\n')));
+      }
+    }
+  }
+};
+// Highest zoom served for the client layer (cells of about 400 m over France), same as the backend
+const CLIENT_MAX_ZOOM = 10;
+
 const MyMap = () => {
-  const [relayPoints, setRelayPoints] = useState([]);
   const [drivers, setDrivers] = useState([]);
-  const [error, setError] = useState(null);
   useEffect(() => {
-    const fetchPositions = async () => {
-      try {
-        // Replace these URLs with your actual API endpoints
-        const relayResponse = await axios.get('127.0.0.1:5000/relay-points');
-        setRelayPoints(relayResponse.data);
-
-        const driverResponse = await axios.get('127.0.0.1:5000/drivers');
-        setDrivers(driverResponse.data); 
-      } catch (error) {
-        console.error('Error fetching positions:', error);
-        setError('Sorry, can\'t load the map');
-      } //api not set up yet for the driver the app need to be finish first
+    // Drivers are pushed by the server: a snapshot first, then only the positions that changed
+    const positions = new Map();
+    const controller = new AbortController();
+    const onEvent = (name, data) => {
+      if (name === 'snapshot') {
+        positions.clear();
+        data.forEach((driver) => positions.set(driver.driver_id, driver));
+      } else if (name === 'delta') {
+        data.updated.forEach((driver) => positions.set(driver.driver_id, driver));
+        data.removed.forEach((driverId) => positions.delete(driverId));
+      }
+      setDrivers(Array.from(positions.values()));
     };
 
-    // Fetch positions on component mount and set intervals for updates
-    fetchPositions();
-    const interval = setInterval(fetchPositions, 5000); // Update every 5 seconds
+    const follow = async () => {
+      // Reconnects until the component unmounts, every connection starts with a snapshot
+      while (!controller.signal.aborted) {
+        try {
+          await readEvents(`${API_URL}/drivers/stream`, controller.signal, onEvent);
+        } catch (error) {
+          if (controller.signal.aborted) {
+            return;
+          }
+          console.error('Driver stream interrupted, reconnecting:', error);
+        }
+        await new Promise((resolve) => setTimeout(resolve, STREAM_RETRY_MS));
+      }
+    };
+    follow();
 
-    return () => clearInterval(interval); // Cleanup on component unmount
+    return () => controller.abort();
   }, []);
-  if (error) {
-    return <div>{error}</div>;
-  }
-
   return (
     <div>
 
@@ -54,25 +93,13 @@ const MyMap = () => {
         url="https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png"
         attribution='&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
         />
-      {Array.isArray(relayPoints) && relayPoints.length > 0 ? (
-        relayPoints.map((point, index) => (
-          <Marker
-          key={`relay-${index}`}
-          position={[point.position]}
-          icon={relayIcon}
-          >
-      <Popup>Relay Point {index + 1}</Popup>
-    </Marker>
-  ))
-) : (
-  <div className="no-relay-points">
-            No relay points available
-          </div>
-)}
+      {/* Every relay point of the active generation, tile by tile */}
+      <ClusterLayer apiUrl={API_URL} layer="relay_points" color="red" />
+      <ClusterLayer apiUrl={API_URL} layer="clients" headers={AUTH_HEADERS} maxZoom={CLIENT_MAX_ZOOM} />
       {Array.isArray(drivers) && drivers.length > 0 ? (
-        drivers.map((drivers, index) => (
+        drivers.map((driver, index) => (
          <Marker
-        key={`driver-${index}`}
+        key={`driver-${driver.driver_id}`}
         position={[driver.latitude, driver.longitude]}
         icon={driverIcon}
         >